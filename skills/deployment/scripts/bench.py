@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""Benchmark deployment config generation and a simulated deploy pipeline.
+
+Generator cases time makefile_block(), compose_template() and a full config.py
+run on synthetic profiles with 1 to 1000 environments and services.
+
+Deploy cases generate a throwaway project and run the generated Makefile
+targets against local stand-ins: an ssh shim that runs remote scripts on this
+machine, and either a docker shim or the real docker daemon with a local
+registry container (--registry).
+
+Results can be saved as a baseline and compared on later runs; the exit code
+is 1 when a case is slower than the baseline by more than the tolerance.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import config  # noqa: E402
+
+
+SIZES = (1, 10, 100, 1000)
+# Built by the generator itself so the benchmarked block cannot drift from what config.py renders.
+BASE_CFG = config.base_settings(
+    argparse.Namespace(**config.GENERATE_DEFAULTS), {"app_name": "bench-app", "use_sudo": False}, Path(".")
+)
+REGISTRY_IMAGE = "registry:2"
+REGISTRY_PORT = 5000
+
+# The shim sees `ssh [opts] host "command"` and runs the command locally; control
+# connection checks (-O) and multiplex setup (-M/-N/-f) succeed without work.
+SSH_SHIM = """#!/bin/sh
+for a; do last=$a; done
+case "$last" in -O|-M|-N|-f|exit|check) exit 0;; esac
+exec sh -c "$last"
+"""
+# Minimal docker stand-in: images and containers are marker files in $BENCH_DOCKER_STATE.
+DOCKER_SHIM = """#!/bin/sh
+state=${BENCH_DOCKER_STATE:?}
+case "$*" in
+  "image inspect"*) [ -f "$state/image" ] ;;
+  "buildx build"*|"build "*) touch "$state/image" ;;
+  "rmi"*) rm -f "$state/image" ;;
+  *"compose"*" ps -q"*) [ -f "$state/running" ] && echo c1; true ;;
+  *"compose"*" down"*) rm -f "$state/running" ;;
+  *"compose"*" up"*) touch "$state/running" ;;
+esac
+"""
+
+
+def measure(func, repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        "median_ms": round(statistics.median(samples), 3),
+        "min_ms": round(min(samples), 3),
+        "runs": len(samples),
+    }
+
+
+def synthetic_profile(envs: int) -> dict:
+    """Profile with `envs` custom environments, each with its own hosts and compose tuning."""
+    return {
+        "app_name": "bench-app",
+        "use_sudo": False,
+        "compose": {"publish": "none", "limits": {"cpus": "0.5", "memory": "256M"}, "ulimits": {"nofile": 65536}},
+        "environments": {
+            f"env{i}": {
+                "remote_host": f"10.0.{i // 250}.{i % 250 + 1}",
+                "remote_hosts": f"10.1.{i // 250}.{i % 250 + 1} 10.2.{i // 250}.{i % 250 + 1}",
+                "compose": {"replicas": i % 3 + 1},
+            }
+            for i in range(envs)
+        },
+    }
+
+
+def run_config(argv: list[str]) -> int:
+    saved = sys.argv
+    sys.argv = ["config.py", *argv]
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return config.main()
+    finally:
+        sys.argv = saved
+
+
+def generator_cases(sizes: list[int], repeat: int, workdir: Path) -> list[dict]:
+    cases = []
+    for size in sizes:
+        custom_envs = [f"env{i}" for i in range(size)]
+        cases.append(
+            {"name": "makefile_block", "size": size, **measure(lambda: config.makefile_block(BASE_CFG, custom_envs), repeat)}
+        )
+
+        profile = synthetic_profile(size)
+
+        def render_compose() -> None:
+            for name in custom_envs:
+                config.compose_template(
+                    name, "bench-app", 8080, "/healthz", "rolling", config.compose_settings(profile, name)
+                )
+
+        cases.append({"name": "compose_template", "size": size, **measure(render_compose, repeat)})
+
+        profile_path = workdir / f"profile-{size}.json"
+        profile_path.write_text(json.dumps(profile), encoding="utf-8")
+        counter = iter(range(repeat * 2))
+
+        def cold_envs() -> None:
+            root = workdir / f"envs-{size}-{next(counter)}"
+            root.mkdir()
+            if run_config(["--root", str(root), "--from-json", str(profile_path)]) != 0:
+                raise RuntimeError(f"generation failed for {size} environments")
+
+        cases.append({"name": "main_envs_cold", "size": size, **measure(cold_envs, repeat)})
+        warm_root = workdir / f"envs-{size}-0"
+        cases.append(
+            {
+                "name": "main_envs_cached",
+                "size": size,
+                **measure(lambda: run_config(["--root", str(warm_root), "--from-json", str(profile_path)]), repeat),
+            }
+        )
+
+        services = workdir / f"services-{size}"
+        manifest = {
+            "defaults": {"use_sudo": False, "registry_host": "registry.local"},
+            "services": [{"root": f"svc{i}", "app_name": f"svc{i}", "app_port": 8000 + i % 1000} for i in range(size)],
+        }
+        for i in range(size):
+            (services / f"svc{i}").mkdir(parents=True)
+        (services / "manifest.json").write_text(json.dumps(manifest), encoding="utf-8")
+        batch_argv = ["--root", str(services), "--batch", "manifest.json", "--workers", "4"]
+        # One cold pass writes every service; the repeats then measure the cached path.
+        cases.append({"name": "main_services_cold", "size": size, **measure(lambda: run_config(batch_argv), 1)})
+        cases.append({"name": "main_services_cached", "size": size, **measure(lambda: run_config(batch_argv), repeat)})
+    return cases
+
+
+def make_shims(bin_dir: Path, fake_docker: bool) -> None:
+    bin_dir.mkdir(parents=True)
+    shims = {"ssh": SSH_SHIM, **({"docker": DOCKER_SHIM} if fake_docker else {})}
+    for name, body in shims.items():
+        path = bin_dir / name
+        path.write_text(body, encoding="utf-8")
+        path.chmod(0o755)
+
+
+def start_registry() -> str:
+    result = subprocess.run(
+        ["docker", "run", "-d", "--rm", "-p", f"127.0.0.1:{REGISTRY_PORT}:5000", REGISTRY_IMAGE],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"could not start local registry: {result.stderr.strip()}")
+    return result.stdout.strip()
+
+
+def deploy_cases(repeat: int, workdir: Path, registry: bool) -> list[dict]:
+    if not shutil.which("make"):
+        raise RuntimeError("make is required for deploy benchmarks")
+    app = workdir / "deploy-app"
+    app.mkdir()
+    (app / "main.py").write_text("print('bench')\n", encoding="utf-8")
+    make_shims(workdir / "bin", fake_docker=not registry)
+    (workdir / "docker-state").mkdir()
+    env = {
+        **os.environ,
+        "PATH": f"{workdir / 'bin'}{os.pathsep}{os.environ.get('PATH', '')}",
+        "BENCH_DOCKER_STATE": str(workdir / "docker-state"),
+    }
+    generated = run_config(
+        [
+            "--root",
+            str(app),
+            "--app-name",
+            "bench-app",
+            "--registry-host",
+            f"127.0.0.1:{REGISTRY_PORT}" if registry else "registry.local",
+            "--remote-host",
+            "bench-host",
+            "--remote-compose-path",
+            str(workdir / "remote"),
+            "--ssh-multiplex",
+            "false",
+            "--use-sudo",
+            "false",
+        ]
+    )
+    if generated != 0:
+        raise RuntimeError("could not generate the deploy fixture")
+
+    def deploy(label: str) -> None:
+        result = subprocess.run(
+            ["make", "remote-deploy", "ENV_MODE=test", f"DEPLOY_RUN_ID={label}"],
+            cwd=app,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"make remote-deploy failed:\n{result.stdout}{result.stderr}")
+
+    container = start_registry() if registry else None
+    try:
+        cases = []
+        counter = iter(range(repeat * 3))
+
+        def changed() -> None:
+            (app / "main.py").write_text(f"print('bench {time.time_ns()}')\n", encoding="utf-8")
+            deploy(f"bench-{next(counter)}")
+
+        cases.append({"name": "deploy_changed", "size": 1, **measure(changed, repeat)})
+        cases.append({"name": "deploy_unchanged", "size": 1, **measure(lambda: deploy(f"bench-{next(counter)}"), repeat)})
+        report = config.deploy_report(config.load_timeline(app / config.STATE_DIR / "timeline.jsonl"))
+        cases.append(
+            {
+                "name": "deploy_unchanged_critical_path",
+                "size": 1,
+                "median_ms": round(report["critical_path_s"] * 1000, 3),
+                "min_ms": round(report["critical_path_s"] * 1000, 3),
+                "runs": 1,
+            }
+        )
+        return cases
+    finally:
+        if container:
+            subprocess.run(["docker", "rm", "-f", container], capture_output=True)
+
+
+def compare(cases: list[dict], baseline: dict, tolerance: float, min_delta_ms: float) -> list[dict]:
+    previous = {(item["name"], item["size"]): item for item in baseline.get("cases", [])}
+    regressions = []
+    for case in cases:
+        before = previous.get((case["name"], case["size"]))
+        if not before:
+            continue
+        delta = case["median_ms"] - before["median_ms"]
+        if delta > min_delta_ms and case["median_ms"] > before["median_ms"] * (1 + tolerance):
+            regressions.append(
+                {
+                    "name": case["name"],
+                    "size": case["size"],
+                    "baseline_ms": before["median_ms"],
+                    "median_ms": case["median_ms"],
+                    "ratio": round(case["median_ms"] / before["median_ms"], 2) if before["median_ms"] else None,
+                }
+            )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark config generation and simulated deploys.")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in SIZES), help="Environment/service counts.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per case; the median is reported.")
+    parser.add_argument("--skip-generator", action="store_true", help="Only run deploy cases.")
+    parser.add_argument("--skip-deploy", action="store_true", help="Only run generator cases.")
+    parser.add_argument("--registry", action="store_true", help=f"Use real docker and a local {REGISTRY_IMAGE} container.")
+    parser.add_argument("--save", help="Write results to this file (e.g. a baseline to commit).")
+    parser.add_argument("--compare", help="Baseline file; exit 1 when a case regresses.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown ratio over the baseline.")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0, help="Ignore slowdowns smaller than this.")
+    args = parser.parse_args()
+
+    try:
+        sizes = [int(item) for item in config.split_list(args.sizes)]
+    except ValueError:
+        print(f"CONFIG_ERROR: invalid --sizes: {args.sizes}")
+        return 1
+    cases: list[dict] = []
+    try:
+        with tempfile.TemporaryDirectory(prefix="deploy-bench-") as tmp:
+            workdir = Path(tmp)
+            if not args.skip_generator:
+                cases += generator_cases(sizes, max(1, args.repeat), workdir)
+            if not args.skip_deploy:
+                cases += deploy_cases(max(1, args.repeat), workdir, args.registry)
+    except RuntimeError as err:
+        print(f"CONFIG_ERROR: {err}")
+        return 1
+
+    results = {
+        "template_version": config.TEMPLATE_VERSION,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "cases": cases,
+    }
+    regressions: list[dict] = []
+    if args.compare:
+        try:
+            baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        except (OSError, ValueError) as err:
+            print(f"CONFIG_ERROR: cannot read baseline: {err}")
+            return 1
+        regressions = compare(cases, baseline, args.tolerance, args.min_delta_ms)
+        results["baseline"] = args.compare
+        results["regressions"] = regressions
+    results["status"] = "regressed" if regressions else "ok"
+    if args.save:
+        config.atomic_write(Path(args.save), json.dumps(results, ensure_ascii=True, indent=2) + "\n")
+    print(json.dumps(results, ensure_ascii=True, indent=2))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
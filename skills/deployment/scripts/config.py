@@ -7,37 +7,143 @@ This script generates:
 - Docker Compose files for each environment
 - Environment files (.deploy.env.*)
 
+Import it and call render() to get the same files as in-memory strings without writing them.
+
 This is the primary entry point for setting up deployment infrastructure.
 """
 import argparse
+import difflib
+import hashlib
+import heapq
+import inspect
 import json
 import os
+import queue
 import re
+import shlex
+import shutil
+import socket
+import subprocess
 import sys
+import tarfile
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Any
+from urllib.parse import urlsplit
 
 
 MAKEFILE_START = "# DEPLOYMENT-CONFIG:START"
 MAKEFILE_END = "# DEPLOYMENT-CONFIG:END"
 DEPLOYMENT_TIPS_START = "<!-- DEPLOYMENT:START -->"
 DEPLOYMENT_TIPS_END = "<!-- DEPLOYMENT:END -->"
-STANDARD_ENVS = {"local", "test", "prod"}
-
-ENV_KEYS = [
-    "REGISTRY_HOST",
-    "REMOTE_USER",
-    "REMOTE_HOST",
-    "REMOTE_PORT",
-    "REMOTE_COMPOSE_PATH",
-    "LOCAL_COMPOSE_FILE",
+DOCKERIGNORE_MARKER = "# DEPLOYMENT-DOCKERIGNORE"
+DOCKERIGNORE_DEFAULTS = [
+    "**/.git",
+    "**/.hg",
+    "**/.svn",
+    "**/node_modules",
+    "**/__pycache__",
+    "**/*.py[cod]",
+    "**/.venv",
+    "**/venv",
+    "**/.pytest_cache",
+    "**/.mypy_cache",
+    "**/.DS_Store",
+    "**/*.log",
+    "**/.buildx-cache*",
+    "**/*.tar",
+    "**/.deploy.env.*",
+    "**/.deploy-state",
 ]
+STANDARD_ENVS = {"local", "test", "prod"}
+DEPLOY_STRATEGIES = ("recreate", "rolling")
+BUILD_CACHE_TYPES = ("none", "inline", "registry", "local")
+RUNTIMES = ("generic", "python", "node", "go", "static")
+IMAGE_SOURCES = ("registry", "load")
+LOAD_COMPRESSORS = {
+    "zstd": (["zstd", "-T0", "-3", "-q", "-c"], "zstd -dc"),
+    "gzip": (["gzip", "-1", "-c"], "gzip -dc"),
+    "none": (None, "cat"),
+}
+
+COMPOSE_DEFAULTS = {
+    "replicas": 1,
+    "publish": "auto",
+    "limits": {},
+    "reservations": {},
+    "ulimits": {},
+    "healthcheck": {"interval": "30s", "timeout": "5s", "retries": 3},
+}
+PROD_COMPOSE_DEFAULTS = {"limits": {"cpus": "1.0", "memory": "512M"}}
+HEALTHCHECK_KEYS = ("interval", "timeout", "retries", "start_period")
+# auto publishes APP_PORT (a port range when several containers run at once); none only exposes it on app-network
+PUBLISH_MODES = ("auto", "range", "none")
+# Post-deploy smoke benchmark (profile "smoke"); regressions and drops are fractions of the baseline.
+SMOKE_DEFAULTS = {
+    "path": None,
+    "via": "remote",
+    "concurrency": 4,
+    "duration": 10,
+    "max_p95_regression": 0.25,
+    "max_p99_regression": 0.5,
+    "max_rps_drop": 0.25,
+    "max_error_rate": 0.01,
+    "max_p99_ms": None,
+    "min_delta_ms": 5,
+    "rollback": False,
+}
+SMOKE_VIAS = ("remote", "tunnel")
+STATE_DIR = ".deploy-state"
+# Every template lives in this file, so its digest versions the rendered outputs.
+TEMPLATE_VERSION = hashlib.sha256(Path(__file__).read_bytes()).hexdigest()[:16]
+SSH_DEFAULTS = {
+    "SSH_MULTIPLEX": "true",
+    "SSH_CONTROL_PATH": "~/.ssh/deploy-mux-%C",
+    "SSH_CONTROL_PERSIST": "60s",
+}
+
+# Per-environment keys written to .deploy.env.*: extra profile aliases, the default, optional
+# per-environment defaults, and whether an environment inherits the common value.
+ENV_SCHEMA: dict[str, dict[str, Any]] = {
+    "REGISTRY_HOST": {"default": "registry.example.com", "prod": "registry.prod.example.com"},
+    "REMOTE_USER": {"default": "deploy", "prod": "deploy-prod"},
+    "REMOTE_HOST": {"default": "127.0.0.1", "prod": "prod.example.com"},
+    "REMOTE_HOSTS": {"default": None},
+    "REMOTE_PORT": {"default": 22},
+    "REMOTE_COMPOSE_PATH": {"default": "~/docker-composes"},
+    "LOCAL_COMPOSE_FILE": {
+        "aliases": ["compose_file"],
+        "default": "docker-compose.{env}.yaml",
+        "prod": "docker-compose.yaml",
+        "inherit": False,
+    },
+    **{key: {"default": value} for key, value in SSH_DEFAULTS.items()},
+    # Image retention: newest N images of the app per host, within an optional disk budget (e.g. 10G).
+    "IMAGE_KEEP": {"aliases": ["retention_keep"], "default": 3},
+    "IMAGE_MAX_DISK": {"aliases": ["retention_max_disk"], "default": ""},
+}
+ENV_KEYS = list(ENV_SCHEMA)
+ENV_ALIAS_INDEX = {
+    alias: key for key, spec in ENV_SCHEMA.items() for alias in [key.lower(), *spec.get("aliases", [])]
+}
+# Process variables read by the generator carry this prefix (or an <ENV>_ one), so generic CI
+# variables such as VERSION or APP_NAME never override the profile.
+ENVIRON_PREFIX = "DEPLOY_"
+# Resolution tiers, highest precedence first.
+TIER_CLI, TIER_ENVIRON, TIER_ENV_OBJ, TIER_PROFILE, TIER_COMMON, TIER_DEFAULT = range(6)
 
 
 def parse_bool(value: str) -> bool:
     return str(value).lower() in {"1", "true", "yes", "on"}
 
 
+def format_bool(value: Any) -> str:
+    return "true" if parse_bool(str(value)) else "false"
+
+
 def normalize_port(value: Any, field_name: str = "port") -> int:
     try:
         port = int(str(value))
@@ -48,6 +154,27 @@ def normalize_port(value: Any, field_name: str = "port") -> int:
     return port
 
 
+def normalize_strategy(value: Any) -> str:
+    strategy = str(value).strip().lower()
+    if strategy not in DEPLOY_STRATEGIES:
+        raise ValueError(f"deploy_strategy must be one of: {', '.join(DEPLOY_STRATEGIES)}")
+    return strategy
+
+
+def normalize_build_cache(value: Any) -> str:
+    cache = str(value).strip().lower()
+    if cache not in BUILD_CACHE_TYPES:
+        raise ValueError(f"build_cache must be one of: {', '.join(BUILD_CACHE_TYPES)}")
+    return cache
+
+
+def normalize_runtime(value: Any) -> str:
+    runtime = str(value).strip().lower()
+    if runtime not in RUNTIMES:
+        raise ValueError(f"runtime must be one of: {', '.join(RUNTIMES)}")
+    return runtime
+
+
 def normalize_env_name(env_name: str) -> str:
     value = env_name.strip().lower()
     if not value:
@@ -77,55 +204,169 @@ def get_env_obj(profile: dict, env_name: str) -> dict:
 
 
 def pick(base: dict, cli_value: Any, keys: list[str], default: Any) -> Any:
+    """CLI value, then DEPLOY_<upper-case key> from the process environment, then the profile."""
     if cli_value is not None:
         return cli_value
+    for key in keys:
+        name = key if key.startswith(ENVIRON_PREFIX) else ENVIRON_PREFIX + key
+        if key.isupper() and os.environ.get(name):
+            return os.environ[name]
     for key in keys:
         if key in base and base[key] not in (None, ""):
             return base[key]
     return default
 
 
-def pick_env(base: dict, env_obj: dict, cli_value: Any, keys: list[str], default: Any) -> Any:
-    if cli_value is not None:
-        return cli_value
-    for key in keys:
-        if key in base and base[key] not in (None, ""):
-            return base[key]
-    for key in keys:
-        if key in env_obj and env_obj[key] not in (None, ""):
-            return env_obj[key]
-    return default
+def split_list(value: Any) -> list[str]:
+    items = value if isinstance(value, (list, tuple)) else re.split(r"[\s,]+", str(value))
+    return [str(item).strip() for item in items if str(item).strip()]
+
 
+def index_profile(obj: dict) -> dict[tuple[str, str], Any]:
+    """Map each recognised key of a profile object to (environment prefix, schema key) in one pass.
+
+    "remote_port" -> ("", "REMOTE_PORT"); "PROD_REMOTE_PORT" -> ("prod", "REMOTE_PORT").
+    """
+    index: dict[tuple[str, str], Any] = {}
+    for raw_key, value in obj.items():
+        name = str(raw_key).lower()
+        if isinstance(value, dict):
+            # Nested groups such as "retention": {"keep": 5} map to their flat aliases.
+            for sub_key, sub_value in value.items():
+                alias = f"{name}_{str(sub_key).lower()}"
+                if alias in ENV_ALIAS_INDEX and sub_value not in (None, "") and not isinstance(sub_value, dict):
+                    index.setdefault(("", ENV_ALIAS_INDEX[alias]), sub_value)
+            continue
+        if value in (None, ""):
+            continue
+        if name in ENV_ALIAS_INDEX:
+            index.setdefault(("", ENV_ALIAS_INDEX[name]), value)
+            continue
+        for pos in (i for i, char in enumerate(name) if char == "_"):
+            if name[pos + 1 :] in ENV_ALIAS_INDEX:
+                index.setdefault((name[:pos], ENV_ALIAS_INDEX[name[pos + 1 :]]), value)
+                break
+    return index
+
+
+def resolve_env(
+    env_name: str, args, profile_index: dict, env_obj: dict, common: dict | None = None
+) -> dict[str, str]:
+    """Resolve every ENV_SCHEMA key for one environment ("" = common) in a single pass.
+
+    Precedence: CLI -> DEPLOY_<KEY> / <ENV>_<KEY> variables -> environments.<env> -> profile -> common -> defaults.
+    """
+    env_index = index_profile(env_obj)
+    env_key = env_name.replace("-", "_")
+    env_prefix = f"{env_key.upper()}_" if env_name else ENVIRON_PREFIX
+    values: dict[str, Any] = {}
+    tiers: dict[str, int] = {}
+    for key, spec in ENV_SCHEMA.items():
+        cli_attr = f"{env_name}_{key.lower()}" if env_name else key.lower()
+        candidates = [
+            (TIER_CLI, getattr(args, cli_attr.replace("-", "_"), None)),
+            (TIER_ENVIRON, os.environ.get(env_prefix + key) or None),
+            (TIER_ENV_OBJ, env_index.get(("", key))),
+            (TIER_PROFILE, profile_index.get((env_key, key))),
+        ]
+        if common is not None and spec.get("inherit", True) and common["tiers"][key] != TIER_DEFAULT:
+            candidates.append((TIER_COMMON, common["values"][key]))
+        default = spec.get(env_name, spec["default"])
+        if isinstance(default, str):
+            default = default.format(env=env_name or "test")
+        candidates.append((TIER_DEFAULT, default))
+        tiers[key], values[key] = next((tier, value) for tier, value in candidates if value is not None or tier == TIER_DEFAULT)
+
+    # An explicit host list wins unless a single host was given at a higher-precedence tier.
+    use_list = values["REMOTE_HOSTS"] is not None and tiers["REMOTE_HOSTS"] <= tiers["REMOTE_HOST"]
+    hosts = split_list(values["REMOTE_HOSTS"] if use_list else values["REMOTE_HOST"])
+    if not hosts:
+        raise ValueError(f"{env_name or 'common'}.remote_host cannot be empty")
+    values["REMOTE_HOST"], values["REMOTE_HOSTS"] = hosts[0], " ".join(hosts)
+    tiers["REMOTE_HOSTS"] = tiers["REMOTE_HOSTS"] if use_list else tiers["REMOTE_HOST"]
+    values["REMOTE_PORT"] = normalize_port(values["REMOTE_PORT"], f"{env_name}_remote_port" if env_name else "remote_port")
+    values["SSH_MULTIPLEX"] = format_bool(values["SSH_MULTIPLEX"])
+    label = f"{env_name}.retention" if env_name else "retention"
+    try:
+        values["IMAGE_KEEP"] = int(values["IMAGE_KEEP"])
+    except (TypeError, ValueError):
+        raise ValueError(f"{label}.keep must be an integer") from None
+    if values["IMAGE_KEEP"] < 1:
+        raise ValueError(f"{label}.keep must be at least 1")
+    if str(values["IMAGE_MAX_DISK"]).strip() and memory_bytes(values["IMAGE_MAX_DISK"]) is None:
+        raise ValueError(f"{label}.max_disk must be a size such as 10G or 512M")
+    return {"values": {key: str(value) for key, value in values.items()}, "tiers": tiers}
+
+
+def atomic_write(path: Path, text: str) -> None:
+    """Write via a temp file in the same directory + rename, keeping the existing file mode."""
+    tmp = path.with_name(f".{path.name}.tmp-{os.getpid()}-{threading.get_ident()}")
+    try:
+        tmp.write_text(text, encoding="utf-8")
+        if path.exists():
+            shutil.copymode(path, tmp)
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
 
-def upsert_block(path: Path, start: str, end: str, block: str) -> str:
+
+def read_text(path: Path) -> str | None:
+    try:
+        return path.read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return None
+
+
+def merge_block(current: str | None, start: str, end: str, block: str) -> str:
+    """Replace the marked block in current, or append it when the markers are missing."""
     block_text = block.strip("\n") + "\n"
-    if path.exists():
-        content = path.read_text(encoding="utf-8")
-        if start in content and end in content:
-            pattern = re.compile(re.escape(start) + r".*?" + re.escape(end), re.DOTALL)
-            new_content = pattern.sub(block_text.strip("\n"), content, count=1)
-            if new_content != content:
-                path.write_text(new_content, encoding="utf-8")
-                return "updated"
-            return "unchanged"
-        suffix = "" if content.endswith("\n") or content == "" else "\n"
-        path.write_text(content + suffix + block_text, encoding="utf-8")
-        return "updated"
-    path.write_text(block_text, encoding="utf-8")
-    return "created"
-
-
-def write_file(path: Path, content: str, overwrite: bool) -> str:
-    existed = path.exists()
-    if existed and not overwrite:
-        return "skipped"
-    path.write_text(content.strip("\n") + "\n", encoding="utf-8")
-    return "updated" if existed else "created"
+    if current is None:
+        return block_text
+    head = current.find(start)
+    tail = current.find(end, head) if head != -1 else -1
+    if tail != -1:
+        return current[:head] + block_text.strip("\n") + current[tail + len(end) :]
+    suffix = "" if current.endswith("\n") or current == "" else "\n"
+    return current + suffix + block_text
+
+
+def apply_outputs(root: Path, outputs: dict[str, dict], write: bool = True, diff: bool = False) -> dict:
+    """Compare planned outputs with root and write the changes; with write=False only report
+    what would happen (created/updated/unchanged/skipped) and optionally a unified diff."""
+    results: dict[str, str] = {}
+    diffs: dict[str, str] = {}
+    for name, output in outputs.items():
+        path = root / name
+        current = read_text(path)
+        if output["block"]:
+            text = merge_block(current, *output["block"], output["content"])
+        elif current is None or output["overwrite"]:
+            text = output["content"].strip("\n") + "\n"
+        else:
+            results[name] = "skipped"
+            continue
+        if text == current:
+            results[name] = "unchanged"
+            continue
+        results[name] = "created" if current is None else "updated"
+        if write:
+            atomic_write(path, text)
+        if diff:
+            diffs[name] = "".join(
+                difflib.unified_diff(
+                    (current or "").splitlines(keepends=True),
+                    text.splitlines(keepends=True),
+                    "/dev/null" if current is None else f"a/{name}",
+                    f"b/{name}",
+                )
+            )
+    return {"results": results, "diffs": diffs}
 
 
 def makefile_block(base_cfg: dict, custom_envs: list[str]) -> str:
     tab = "\t"
     custom_hint = " ".join(custom_envs) if custom_envs else "custom-env"
+    smoke = base_cfg["smoke"]
     lines = [
         MAKEFILE_START,
         f"APP_NAME ?= {base_cfg['app_name']}",
@@ -157,9 +398,284 @@ def makefile_block(base_cfg: dict, custom_envs: list[str]) -> str:
         "endif",
         "",
         "FULL_REGISTRY_IMAGE = $(REGISTRY_HOST)/$(APP_NAME):$(VERSION)",
+        "REGISTRY_REPO = $(REGISTRY_HOST)/$(APP_NAME)",
         f"CUSTOM_ENVS ?= {custom_hint}",
         "",
-        ".PHONY: check-config test build-arm build save tag push remote-pull remote-clean local-clean push-compose-file remote-deploy remote-status remote-logs help",
+        "# Multi-host fan-out (fleet-deploy): canary hosts first, then waves of FLEET_BATCH_SIZE",
+        "REMOTE_HOSTS ?= $(REMOTE_HOST)",
+        f"FLEET_PARALLEL ?= {base_cfg['fleet_parallel']}",
+        f"FLEET_BATCH_SIZE ?= {base_cfg['fleet_batch_size']}",
+        f"FLEET_CANARY ?= {base_cfg['fleet_canary']}",
+        "PYTHON ?= python3",
+        "# Skill script behind fleet, remote-load, sync, digests and timing; override when it lives elsewhere,",
+        "# e.g. DEPLOY_SCRIPT=tools/deploy/config.py for a copy committed with the project",
+        f"DEPLOY_SCRIPT ?= {base_cfg['deploy_script']}",
+        "HAVE_SCRIPT = $(wildcard $(DEPLOY_SCRIPT))",
+        'REMOTE_ARGS = --root . --hosts "$(REMOTE_HOSTS)" --remote-user $(REMOTE_USER) --remote-port $(REMOTE_PORT) \\',
+        f"{tab}--remote-compose-path '$(REMOTE_COMPOSE_PATH)' --use-sudo $(USE_SUDO) --ssh-opts \"$(SSH_MUX_OPTS) $(SSH_OPTS)\"",
+        "",
+        "# Artifacts synced next to the compose file: src[:dest] (files or directories), dest relative to",
+        "# REMOTE_COMPOSE_PATH. push-compose-file sends only changed files (rsync block delta, else tar)",
+        f"ARTIFACTS ?= {' '.join(base_cfg['artifacts'])}",
+        "SYNC_METHOD ?= auto",
+        "ARTIFACT_INCLUDES = $(foreach a,$(ARTIFACTS),--include $(firstword $(subst :, ,$(a))))",
+        "",
+        "# Image source: registry (push/pull) or load (stream over SSH, only layers the host lacks)",
+        f"IMAGE_SOURCE ?= {base_cfg['image_source']}",
+        "LOAD_COMPRESSION ?= auto",
+        "PUBLISH = $(if $(filter load,$(IMAGE_SOURCE)),remote-load,push)",
+        "PRE_PULL = $(if $(filter load,$(IMAGE_SOURCE)),,remote-pull)",
+        "DEPLOY_GOAL = $(filter remote-deploy fleet-deploy,$(MAKECMDGOALS))",
+        "# remote-deploy pre-pulls the image while local steps finish, so remote-up need not pull again",
+        "REMOTE_PULL = $(if $(filter load,$(IMAGE_SOURCE))$(filter remote-deploy,$(MAKECMDGOALS)),true,compose pull)",
+        "",
+        "# Print build context size before each build when true",
+        "CONTEXT_REPORT ?= false",
+        "",
+        "# Target platforms (comma separated); several build one multi-arch manifest in a single buildx push",
+        f"PLATFORMS ?= {base_cfg['platforms']}",
+        "comma := ,",
+        "BUILD_PLATFORM ?= $(firstword $(subst $(comma), ,$(PLATFORMS)))",
+        "MULTI_PLATFORM = $(if $(word 2,$(subst $(comma), ,$(PLATFORMS))),true,)",
+        "",
+        "# Build cache: none | inline | registry | local (registry/local export needs a docker-container builder)",
+        f"BUILD_CACHE ?= {base_cfg['build_cache']}",
+        f"BUILD_CACHE_REF ?= {base_cfg['build_cache_ref']}",
+        f"BUILD_CACHE_DIR ?= {base_cfg['build_cache_dir']}",
+        "BUILD_CACHE_MODE ?= max",
+        "BUILDX_BUILDER ?= deploy-builder",
+        "ifeq ($(BUILD_CACHE),registry)",
+        "BUILD_CACHE_FROM = --cache-from type=registry,ref=$(BUILD_CACHE_REF)",
+        "BUILD_CACHE_TO = --cache-to type=registry,ref=$(BUILD_CACHE_REF),mode=$(BUILD_CACHE_MODE)",
+        "else ifeq ($(BUILD_CACHE),local)",
+        "BUILD_CACHE_FROM = --cache-from type=local,src=$(BUILD_CACHE_DIR)",
+        "BUILD_CACHE_TO = --cache-to type=local,dest=$(BUILD_CACHE_DIR)-new,mode=$(BUILD_CACHE_MODE)",
+        "else ifeq ($(BUILD_CACHE),inline)",
+        "# inline cache travels inside the pushed image, so read it back from the tags push publishes",
+        "BUILD_CACHE_FROM = $(foreach ref,$(sort $(FULL_REGISTRY_IMAGE) $(REGISTRY_REPO):latest),--cache-from type=registry,ref=$(ref))",
+        "BUILD_CACHE_TO = --cache-to type=inline",
+        "endif",
+        "BUILDX_FLAGS = $(if $(filter registry local,$(BUILD_CACHE)),--builder $(BUILDX_BUILDER) --load,)",
+        "CACHE_ROTATE = $(if $(filter local,$(BUILD_CACHE)),&& rm -rf $(BUILD_CACHE_DIR) && mv $(BUILD_CACHE_DIR)-new $(BUILD_CACHE_DIR),)",
+        "",
+        "# Skip-if-unchanged: digests of the build inputs and of each release, stamped locally",
+        "# (STATE_DIR) and on the remote (.$(APP_NAME).release); FORCE=true rebuilds and restarts anyway",
+        "SKIP_UNCHANGED ?= true",
+        "FORCE ?= false",
+        "STATE_DIR ?= .deploy-state",
+        "STAMPS = $(filter 1 true yes on,$(SKIP_UNCHANGED))",
+        "SKIP_ENABLED = $(if $(filter 1 true yes on,$(FORCE)),,$(STAMPS))",
+        "# Without the script the digests stay empty, so nothing is skipped",
+        "DIGEST_CMD = $(if $(HAVE_SCRIPT),$(PYTHON) $(DEPLOY_SCRIPT) --root . --digest --state-dir $(STATE_DIR),true)",
+        'BUILD_DIGEST = $(eval BUILD_DIGEST := $(shell $(NOTIME) $(DIGEST_CMD) --context $(MONOREPO_ROOT) --dockerfile Dockerfile --salt "$(PLATFORMS) $(BUILD_PLATFORM)"))$(BUILD_DIGEST)',
+        "PUSH_DIGEST = $(if $(BUILD_DIGEST),$(BUILD_DIGEST)@$(FULL_REGISTRY_IMAGE),)",
+        'RELEASE_DIGEST = $(eval RELEASE_DIGEST := $(shell $(NOTIME) $(DIGEST_CMD) --include $(LOCAL_COMPOSE_FILE) $(ARTIFACT_INCLUDES) --salt "$(PUSH_DIGEST) $(DEPLOY_STRATEGY) $(IMAGE_SOURCE) $(ARTIFACTS)"))$(RELEASE_DIGEST)',
+        "BUILD_STAMP = $(STATE_DIR)/build-$(APP_NAME)",
+        "PUSH_STAMP = $(STATE_DIR)/push-$(ENV_MODE)",
+        "# $(call UNCHANGED,stamp-file,DIGEST_VAR) / $(call STAMP,stamp-file,DIGEST_VAR): digests are only computed when used",
+        'UNCHANGED = $(if $(SKIP_ENABLED),[ -n "$($(2))" ] && [ "$$(cat $(1) 2>/dev/null)" = "$($(2))" ],false)',
+        'STAMP = $(if $(STAMPS),mkdir -p $(STATE_DIR) && echo "$($(2))" > $(1),true)',
+        "PUSH_CURRENT = $(if $(SKIP_ENABLED),$(shell $(NOTIME) $(call UNCHANGED,$(PUSH_STAMP),PUSH_DIGEST) && echo true),)",
+        "# PUBLISHING is set for push and inherited by tag/build, so an up-to-date push also skips them",
+        "PUBLISHED = $(if $(PUBLISHING),$(PUSH_CURRENT),)",
+        "RELEASE_ENV = RELEASE_DIGEST=$(if $(STAMPS),$(RELEASE_DIGEST)) SKIP_UNCHANGED=$(SKIP_ENABLED)",
+        "# Both tests are brace groups so they compose safely with && and || in recipes",
+        'REMOTE_RELEASE_CURRENT = { [ -n "$$SKIP_UNCHANGED" ] && [ -n "$$RELEASE_DIGEST" ] && [ "$$(cat .$(APP_NAME).release 2>/dev/null)" = "$$RELEASE_DIGEST" ]; }',
+        "# stage leaves .<app>.staged holding the release digest once the image is pulled and verified",
+        'REMOTE_RELEASE_STAGED = { [ -n "$$RELEASE_DIGEST" ] && [ "$$(cat .$(APP_NAME).staged 2>/dev/null)" = "$$RELEASE_DIGEST" ]; }',
+        "",
+        "# GNU make >= 4.0 (output-sync) runs deploys in parallel and times them; older makes stay serial",
+        "MAKE_4 = $(filter output-sync,$(.FEATURES))",
+        "",
+        "# Step timing: deploy steps run their recipe lines through config.py --timed, which appends",
+        "# start/end, exit status, bytes and host per line to TIMELINE (summarised by deploy-report)",
+        "DEPLOY_TIMING ?= true",
+        "TIMELINE ?= $(STATE_DIR)/timeline.jsonl",
+        "# $(shell) also runs through a target's SHELL; this prefix keeps such probes off the timeline",
+        "NOTIME = : notime;",
+        "TIMED_TARGETS = build push remote-pull local-clean local-gc remote-clean push-compose-file remote-load remote-up fleet-deploy stage stage-host preflight smoke-bench remote-rollback",
+        "ifeq ($(origin DEPLOY_RUN_ID),undefined)",
+        "DEPLOY_RUN_ID = $(eval DEPLOY_RUN_ID := $(shell $(NOTIME) date -u +%Y%m%dT%H%M%SZ))$(DEPLOY_RUN_ID)",
+        "endif",
+        "export DEPLOY_RUN_ID",
+        "STEP_HOST = $(if $(filter build push local-clean local-gc,$@),local,$(if $(filter remote-load fleet-deploy stage preflight,$@),all,$(REMOTE_HOST)))",
+        "STEP_BYTES = $(if $(filter push,$@),--bytes-image $(FULL_REGISTRY_IMAGE))$(if $(filter push-compose-file,$@),--bytes-file $(LOCAL_COMPOSE_FILE))",
+        "DEPLOY_SUMMARY = $(if $(and $(filter 1 true yes on,$(DEPLOY_TIMING)),$(HAVE_SCRIPT),$(MAKE_4)),$(NOTIME) $(PYTHON) $(DEPLOY_SCRIPT) --root . --deploy-report --summary --timeline $(TIMELINE) --run $(DEPLOY_RUN_ID),:)",
+        "# Without DEPLOY_SCRIPT (or with make < 4.0, e.g. macOS' 3.81) the steps run through /bin/sh, untimed",
+        "ifneq ($(and $(filter 1 true yes on,$(DEPLOY_TIMING)),$(HAVE_SCRIPT),$(MAKE_4)),)",
+        "$(TIMED_TARGETS): private SHELL = $(PYTHON) $(DEPLOY_SCRIPT) --timed $@ --host $(STEP_HOST) --timeline $(TIMELINE) $(STEP_BYTES)",
+        "endif",
+        "",
+        "# SSH connection reuse: one control master per host serves every ssh call in a make run",
+        "SSH_MULTIPLEX ?= true",
+        "SSH_CONTROL_PATH ?= ~/.ssh/deploy-mux-%C",
+        "SSH_CONTROL_PERSIST ?= 60s",
+        "SSH_OPTS ?=",
+        "SSH_MUX_OPTS = $(if $(filter 1 true yes on,$(SSH_MULTIPLEX)),-o ControlMaster=auto -o ControlPath=$(SSH_CONTROL_PATH) -o ControlPersist=$(SSH_CONTROL_PERSIST),)",
+        "SSH = ssh $(SSH_MUX_OPTS) $(SSH_OPTS) -p $(REMOTE_PORT) $(REMOTE_USER)@$(REMOTE_HOST)",
+        "",
+        "# Deploy strategy: recreate (pull, down, up) or rolling (health-gated side-by-side switch)",
+        f"DEPLOY_STRATEGY ?= {base_cfg['deploy_strategy']}",
+        f"HEALTH_TIMEOUT ?= {base_cfg['health_timeout']}",
+        "REMOTE_COMPOSE = $(SUDO_CMD) env APP_NAME=$(APP_NAME) FULL_REGISTRY_IMAGE=$(FULL_REGISTRY_IMAGE) docker compose -f $(APP_NAME).yaml",
+        "",
+        "# Image retention: per host, keep the newest IMAGE_KEEP images of the app within IMAGE_MAX_DISK",
+        "# (empty = no budget). Running images and the previous release (.<app>.images) are never removed,",
+        "# and the build cache is left alone. One batched docker pipeline; args: docker command, repos, dangling.",
+        "IMAGE_RETENTION ?= true",
+        "IMAGE_KEEP ?= 3",
+        "IMAGE_MAX_DISK ?=",
+        "define IMAGE_GC",
+        """gc_budget=$$(echo "$(IMAGE_MAX_DISK)" | awk '{ n = $$1 + 0; u = toupper($$1); gsub(/[0-9. ]/, "", u); m = 1; if (u ~ /^K/) m = 1024; else if (u ~ /^M/) m = 1048576; else if (u ~ /^G/) m = 1073741824; else if (u ~ /^T/) m = 1099511627776; printf "%.0f", n * m }')""",
+        'gc_protect=" $$(cat .$(APP_NAME).images 2>/dev/null | tr \'\\n\' \' \') $$($(1) ps -aq | xargs -r $(1) inspect -f \'{{.Image}}\' | tr \'\\n\' \' \') $$($(1) image inspect -f \'{{.Id}}\' $(FULL_REGISTRY_IMAGE) 2>/dev/null) "',
+        """gc_ids=$$( { for repo in $(2); do $(1) image ls -q --no-trunc "$$repo"; done; $(if $(3),$(1) image ls -q --no-trunc --filter dangling=true;) } | sort -u)""",
+        """[ -z "$$gc_ids" ] || $(1) image inspect -f '{{.Id}} {{.Size}} {{.Created}}' $$gc_ids | sort -k3 -r | awk -v keep=$(IMAGE_KEEP) -v budget="$$gc_budget" -v protect="$$gc_protect" '{ n++; if (index(protect, " " $$1 " ")) { used += $$2; next } if (n > keep || (budget > 0 && used + $$2 > budget)) { print $$1; d++ } else used += $$2 } END { printf "Image retention: %d kept, %d removed\\n", n - d, d > "/dev/stderr" }' | xargs -r $(1) rmi -f >/dev/null || true""",
+        "endef",
+        "",
+        "define LOCAL_GC_SCRIPT",
+        "$(call IMAGE_GC,docker,$(APP_NAME) $(REGISTRY_REPO),)",
+        "endef",
+        "export LOCAL_GC_SCRIPT",
+        "",
+        "define REMOTE_GC_SCRIPT",
+        "cd $(REMOTE_COMPOSE_PATH) 2>/dev/null || true",
+        "$(call IMAGE_GC,$(SUDO_CMD) docker,$(REGISTRY_REPO),dangling)",
+        "endef",
+        "export REMOTE_GC_SCRIPT",
+        "",
+        "define DEPLOY_PRELUDE",
+        "set -e",
+        "cd $(REMOTE_COMPOSE_PATH)",
+        'compose() { $(REMOTE_COMPOSE) "$$@" </dev/null; }',
+        "gc() {",
+        "$(call IMAGE_GC,$(SUDO_CMD) docker,$(REGISTRY_REPO),dangling)",
+        "}",
+        "# Release history, newest first: .<app>.images holds 'image-id ref compose-id deployed-at' per release",
+        "# (the last IMAGE_KEEP, at least two) and .<app>.history/<compose-id>.yaml the compose file it ran with",
+        "release() {",
+        '  [ -z "$$RELEASE_DIGEST" ] || echo "$$RELEASE_DIGEST" > .$(APP_NAME).release',
+        "  rm -f .$(APP_NAME).staged",
+        "  cur=$$($(SUDO_CMD) docker image inspect -f '{{.Id}}' $(FULL_REGISTRY_IMAGE) 2>/dev/null || true)",
+        '  if [ -n "$$cur" ]; then',
+        "    conf=$$(cksum < $(APP_NAME).yaml | tr ' ' -)",
+        "    mkdir -p .$(APP_NAME).history && cp $(APP_NAME).yaml .$(APP_NAME).history/$$conf.yaml",
+        "    keep=$(IMAGE_KEEP); [ \"$$keep\" -ge 2 ] 2>/dev/null || keep=2",
+        '    { echo "$$cur $(FULL_REGISTRY_IMAGE) $$conf $$(date -u +%Y-%m-%dT%H:%M:%SZ)"; awk -v e="$$cur $(FULL_REGISTRY_IMAGE) $$conf " \'index($$0, e) != 1\' .$(APP_NAME).images 2>/dev/null; } | head -n $$keep > .$(APP_NAME).images.tmp',
+        "    mv -f .$(APP_NAME).images.tmp .$(APP_NAME).images",
+        '    for f in .$(APP_NAME).history/*.yaml; do grep -q " $$(basename $$f .yaml) " .$(APP_NAME).images || rm -f "$$f"; done',
+        "  fi",
+        "  $(if $(filter 1 true yes on,$(IMAGE_RETENTION)),gc || true,:)",
+        "}",
+        'if $(REMOTE_RELEASE_CURRENT) && [ -n "$$(compose ps -q $(APP_NAME))" ]; then',
+        '  echo "$(APP_NAME) on $$(hostname) already runs this release, restart skipped"; exit 0',
+        "fi",
+        "endef",
+        "",
+        "define RECREATE_DEPLOY_SCRIPT",
+        "$(DEPLOY_PRELUDE)",
+        "if $(REMOTE_RELEASE_STAGED); then",
+        '  echo "$(APP_NAME) on $$(hostname): switching to the staged release"',
+        "else",
+        "  $(REMOTE_PULL)",
+        "  compose down",
+        "fi",
+        "compose up -d",
+        "release",
+        "endef",
+        "export RECREATE_DEPLOY_SCRIPT",
+        "",
+        "# Staging: pull and verify the image (optionally create the containers) ahead of the deploy window",
+        "STAGE_CREATE ?= false",
+        "STAGE_HOSTS = $(or $(REMOTE_HOSTS),$(REMOTE_HOST))",
+        "STAGE_LAYERS = $(if $(filter true,$(MULTI_PLATFORM)),,$(shell $(NOTIME) docker image inspect --format '{{range .RootFS.Layers}}{{.}} {{end}}' $(APP_NAME):$(VERSION) 2>/dev/null))",
+        "",
+        "define STAGE_SCRIPT",
+        "$(DEPLOY_PRELUDE)",
+        'if $(REMOTE_RELEASE_STAGED); then echo "$(APP_NAME) on $$(hostname): release already staged"; exit 0; fi',
+        "$(if $(filter load,$(IMAGE_SOURCE)),,$(SUDO_CMD) docker pull -q $(FULL_REGISTRY_IMAGE) >/dev/null)",
+        "layers=$$($(SUDO_CMD) docker image inspect --format '{{range .RootFS.Layers}}{{.}} {{end}}' $(FULL_REGISTRY_IMAGE)) || { echo \"$(FULL_REGISTRY_IMAGE) is missing on $$(hostname)\" >&2; exit 1; }",
+        'if [ -n "$$EXPECTED_LAYERS" ] && [ "$$(echo $$layers)" != "$$(echo $$EXPECTED_LAYERS)" ]; then',
+        '  echo "$(FULL_REGISTRY_IMAGE) on $$(hostname) does not match the local build layers" >&2; exit 1',
+        "fi",
+        "# Containers with a fixed name cannot sit next to running ones, so only idle hosts get them pre-created",
+        'if [ "$$STAGE_CREATE" = true ] && [ -z "$$(compose ps -q $(APP_NAME))" ]; then compose create; fi',
+        '[ -z "$$RELEASE_DIGEST" ] || echo "$$RELEASE_DIGEST" > .$(APP_NAME).staged',
+        'echo "$(APP_NAME) on $$(hostname): staged $(FULL_REGISTRY_IMAGE)"',
+        "endef",
+        "export STAGE_SCRIPT",
+        "",
+        "define ROLLING_DEPLOY_SCRIPT",
+        "$(DEPLOY_PRELUDE)",
+        "health() { $(SUDO_CMD) docker inspect -f '{{if .State.Health}}{{.State.Health.Status}}{{else}}{{.State.Status}}{{end}}' \"$$1\" 2>/dev/null || echo missing; }",
+        "new_ids() { for id in $$(compose ps -a -q $(APP_NAME)); do case \" $$old \" in *\" $$id \"*) ;; *) printf '%s ' \"$$id\";; esac; done; }",
+        'rollback() { echo "Rolling deploy failed: $$1; removing new containers, previous release keeps serving" >&2; [ -z "$$new" ] || $(SUDO_CMD) docker rm -f $$new >/dev/null; exit 1; }',
+        "$(REMOTE_RELEASE_STAGED) || $(REMOTE_PULL) $(APP_NAME)",
+        "old=$$(compose ps -q $(APP_NAME) | tr '\\n' ' ')",
+        "count=$$(echo $$old | wc -w)",
+        'if [ "$$count" -eq 0 ]; then compose up -d $(APP_NAME); release; exit 0; fi',
+        "new=",
+        'compose up -d --no-deps --no-recreate --scale $(APP_NAME)=$$((count * 2)) $(APP_NAME) || { new=$$(new_ids); rollback "scale-up failed"; }',
+        "new=$$(new_ids)",
+        '[ -n "$$new" ] || rollback "no new containers were started"',
+        "deadline=$$(( $$(date +%s) + $(HEALTH_TIMEOUT) ))",
+        "while :; do",
+        "  ready=1",
+        "  for id in $$new; do",
+        '    state=$$(health $$id)',
+        '    case "$$state" in',
+        "      healthy|running) ;;",
+        '      unhealthy|exited|dead|missing) rollback "container $$id is $$state" ;;',
+        "      *) ready=0 ;;",
+        "    esac",
+        "  done",
+        '  [ "$$ready" -eq 0 ] || break',
+        '  [ "$$(date +%s)" -lt "$$deadline" ] || rollback "health check not green after $(HEALTH_TIMEOUT)s"',
+        "  sleep 2",
+        "done",
+        "$(SUDO_CMD) docker stop $$old >/dev/null",
+        "$(SUDO_CMD) docker rm $$old >/dev/null",
+        'echo "Rolled $(APP_NAME) to $(FULL_REGISTRY_IMAGE): replaced $$count container(s)"',
+        "release",
+        "endef",
+        "export ROLLING_DEPLOY_SCRIPT",
+        "",
+        "# Rollback: retag release #ROLLBACK_TO of the history (2 = previous) and switch to it together with",
+        "# its compose file; the image and file are already on the host, so nothing is built, pushed or pulled",
+        "define ROLLBACK_SCRIPT",
+        "set -e",
+        "cd $(REMOTE_COMPOSE_PATH)",
+        'case "$$ROLLBACK_TO" in ""|*[!0-9]*|0) echo "ROLLBACK_TO must be a release number from remote-history" >&2; exit 1;; esac',
+        'entry=$$(sed -n "$${ROLLBACK_TO}p" .$(APP_NAME).images 2>/dev/null || true)',
+        '[ -n "$$entry" ] || { echo "No release #$$ROLLBACK_TO of $(APP_NAME) on $$(hostname) (see make remote-history)" >&2; exit 1; }',
+        "set -- $$entry",
+        '$(SUDO_CMD) docker image inspect $$1 >/dev/null 2>&1 || { echo "Image of release #$$ROLLBACK_TO ($$2) is gone from $$(hostname)" >&2; exit 1; }',
+        "$(SUDO_CMD) docker tag $$1 $$2",
+        'if [ -n "$$3" ] && [ -f .$(APP_NAME).history/$$3.yaml ]; then',
+        "  cp .$(APP_NAME).history/$$3.yaml .$(APP_NAME).yaml.tmp && mv -f .$(APP_NAME).yaml.tmp $(APP_NAME).yaml",
+        "fi",
+        "$(SUDO_CMD) env APP_NAME=$(APP_NAME) FULL_REGISTRY_IMAGE=$$2 docker compose -f $(APP_NAME).yaml up -d --remove-orphans </dev/null",
+        "# The chosen release moves to the top, so rolling back again (#2) returns to the one it replaced",
+        '{ echo "$$entry"; sed "$${ROLLBACK_TO}d" .$(APP_NAME).images; } > .$(APP_NAME).images.tmp',
+        "mv -f .$(APP_NAME).images.tmp .$(APP_NAME).images",
+        "rm -f .$(APP_NAME).release .$(APP_NAME).staged",
+        'echo "$(APP_NAME) on $$(hostname) rolled back to $$2 (deployed $${4:-earlier})"',
+        "endef",
+        "export ROLLBACK_SCRIPT",
+        "",
+        "define HISTORY_SCRIPT",
+        "cd $(REMOTE_COMPOSE_PATH) 2>/dev/null && [ -s .$(APP_NAME).images ] || { echo \"No releases of $(APP_NAME) recorded on $$(hostname)\"; exit 0; }",
+        "n=0",
+        "while read -r id ref conf at; do",
+        "  n=$$((n + 1))",
+        '  if [ "$$n" -eq 1 ]; then state=current; else state=available; fi',
+        '  [ -z "$$conf" ] || [ -f .$(APP_NAME).history/$$conf.yaml ] || state="$$state, no compose snapshot"',
+        "  $(SUDO_CMD) docker image inspect $$id >/dev/null 2>&1 || state=\"image removed\"",
+        "  printf '%-3s %-20s %-12s %s  [%s]\\n' \"$$n\" \"$${at:--}\" \"$$(echo $$id | cut -c8-19)\" \"$$ref\" \"$$state\"",
+        "done < .$(APP_NAME).images",
+        "endef",
+        "export HISTORY_SCRIPT",
+        "",
+        ".PHONY: check-config check-script test context-report buildx-setup build-arm build save tag push remote-pull remote-clean local-clean local-gc remote-load push-compose-file remote-up remote-deploy fleet-deploy stage stage-host preflight smoke-bench remote-rollback remote-history remote-status remote-stats remote-logs fleet-logs ssh-open ssh-close deploy-report help",
         "",
         "check-config: ## Validate merged deployment config",
         f'{tab}@test -f $(DEPLOY_COMMON_FILE) || (printf "$(RED)Missing $(DEPLOY_COMMON_FILE)$(NC)\\\\n" && exit 1)',
@@ -173,64 +689,230 @@ def makefile_block(base_cfg: dict, custom_envs: list[str]) -> str:
         f'{tab}@case "$(REMOTE_PORT)" in ""|*[!0-9]*) printf "$(RED)REMOTE_PORT must be numeric$(NC)\\\\n"; exit 1;; esac',
         f'{tab}@if [ "$(REMOTE_PORT)" -lt 1 ] || [ "$(REMOTE_PORT)" -gt 65535 ]; then printf "$(RED)REMOTE_PORT out of range$(NC)\\\\n"; exit 1; fi',
         "",
+        "check-script: ## Check that DEPLOY_SCRIPT (the skill's config.py) is available",
+        f'{tab}@test -f "$(DEPLOY_SCRIPT)" || (printf "$(RED)Deployment script not found: $(DEPLOY_SCRIPT); set DEPLOY_SCRIPT=/path/to/config.py$(NC)\\\\n" && exit 1)',
+        "",
         "# === Base ===",
         "test: ## Run local compose smoke",
         f"{tab}docker compose -f docker-compose.local.yaml up --build",
         "",
-        "build-arm: ## Build image from monorepo root",
+        "context-report: check-script ## Print build context size and largest directories",
+        f"{tab}@$(PYTHON) $(DEPLOY_SCRIPT) --root . --context-report --context $(MONOREPO_ROOT) --dockerfile Dockerfile",
+        "",
+        "buildx-setup: ## Create the docker-container buildx builder used for cache export",
+        f"{tab}@docker buildx inspect $(BUILDX_BUILDER) >/dev/null 2>&1 || docker buildx create --name $(BUILDX_BUILDER) --driver docker-container >/dev/null",
+        "",
+        "build-arm: $(if $(filter registry local,$(BUILD_CACHE)),buildx-setup) $(if $(filter 1 true yes on,$(CONTEXT_REPORT)),context-report) ## Build image from monorepo root",
         f'{tab}@printf "$(YELLOW)Building image from monorepo root...$(NC)\\\\n"',
-        f"{tab}docker build \\",
+        f"{tab}docker buildx build $(BUILDX_FLAGS) \\",
+        f"{tab}{tab}$(BUILD_CACHE_FROM) $(BUILD_CACHE_TO) \\",
         f"{tab}{tab}-t $(APP_NAME):$(VERSION) \\",
         f"{tab}{tab}-f Dockerfile \\",
-        f"{tab}{tab}$(MONOREPO_ROOT)",
+        f"{tab}{tab}$(MONOREPO_ROOT) $(CACHE_ROTATE)",
         "",
-        "build: ## Build amd64 image via buildx",
-        f"{tab}docker buildx build --platform linux/amd64 \\",
-        f"{tab}{tab}-t $(APP_NAME):$(VERSION) \\",
-        f"{tab}{tab}-f Dockerfile \\",
-        f"{tab}{tab}$(MONOREPO_ROOT)",
+        "build: $(if $(filter registry local,$(BUILD_CACHE)),buildx-setup) $(if $(filter 1 true yes on,$(CONTEXT_REPORT)),context-report) ## Build BUILD_PLATFORM image via buildx (skipped when inputs are unchanged)",
+        f'{tab}@if [ -n "$(PUBLISHED)" ]; then \\',
+        f'{tab}{tab}printf "$(GREEN)$(FULL_REGISTRY_IMAGE) already built from these inputs, build skipped$(NC)\\\\n"; \\',
+        f"{tab}elif $(call UNCHANGED,$(BUILD_STAMP),BUILD_DIGEST) && docker image inspect $(APP_NAME):$(VERSION) >/dev/null 2>&1; then \\",
+        f'{tab}{tab}printf "$(GREEN)Build inputs unchanged, reusing $(APP_NAME):$(VERSION)$(NC)\\\\n"; \\',
+        f"{tab}else \\",
+        f"{tab}{tab}docker buildx build --platform $(BUILD_PLATFORM) $(BUILDX_FLAGS) \\",
+        f"{tab}{tab}{tab}$(BUILD_CACHE_FROM) $(BUILD_CACHE_TO) \\",
+        f"{tab}{tab}{tab}-t $(APP_NAME):$(VERSION) \\",
+        f"{tab}{tab}{tab}-f Dockerfile \\",
+        f"{tab}{tab}{tab}$(MONOREPO_ROOT) $(CACHE_ROTATE) && $(call STAMP,$(BUILD_STAMP),BUILD_DIGEST); \\",
+        f"{tab}fi",
         "",
         "save: build ## Save image tarball",
         f"{tab}docker save $(APP_NAME):$(VERSION) -o ./$(APP_NAME)-$(VERSION).tar",
         f'{tab}@printf "$(GREEN)Image saved to ./$(APP_NAME)-$(VERSION).tar$(NC)\\\\n"',
         "",
         "tag: check-config build ## Tag image",
-        f"{tab}docker tag $(APP_NAME):$(VERSION) $(FULL_REGISTRY_IMAGE)",
+        f"{tab}$(if $(PUBLISHED),@:,docker tag $(APP_NAME):$(VERSION) $(FULL_REGISTRY_IMAGE))",
+        "",
+        "push: PUBLISHING = true",
+        "ifeq ($(MULTI_PLATFORM),true)",
+        "push: check-config buildx-setup ## Push image (one multi-arch manifest when PLATFORMS lists several)",
+        f'{tab}@if [ -n "$(PUSH_CURRENT)" ]; then \\',
+        f'{tab}{tab}printf "$(GREEN)$(FULL_REGISTRY_IMAGE) already built from these inputs, push skipped$(NC)\\\\n"; \\',
+        f"{tab}else \\",
+        f"{tab}{tab}docker buildx build --builder $(BUILDX_BUILDER) --platform $(PLATFORMS) \\",
+        f"{tab}{tab}{tab}$(BUILD_CACHE_FROM) $(BUILD_CACHE_TO) \\",
+        f"{tab}{tab}{tab}-t $(FULL_REGISTRY_IMAGE) \\",
+        f"{tab}{tab}{tab}-f Dockerfile \\",
+        f"{tab}{tab}{tab}--push \\",
+        f"{tab}{tab}{tab}$(MONOREPO_ROOT) $(CACHE_ROTATE) && $(call STAMP,$(PUSH_STAMP),PUSH_DIGEST); \\",
+        f"{tab}fi",
+        "else",
+        "push: check-config tag",
+        f'{tab}@if [ -n "$(PUSH_CURRENT)" ]; then \\',
+        f'{tab}{tab}printf "$(GREEN)$(FULL_REGISTRY_IMAGE) already built from these inputs, push skipped$(NC)\\\\n"; \\',
+        f"{tab}else \\",
+        f"{tab}{tab}docker push $(FULL_REGISTRY_IMAGE) && $(call STAMP,$(PUSH_STAMP),PUSH_DIGEST); \\",
+        f"{tab}fi",
+        "endif",
+        "",
+        "ssh-open: ## Open the shared SSH control connection",
+        "ifneq ($(SSH_MUX_OPTS),)",
+        f"{tab}@mkdir -p $(dir $(SSH_CONTROL_PATH))",
+        f"{tab}@$(SSH) -O check 2>/dev/null || $(SSH) -M -N -f",
+        "endif",
         "",
-        "push: check-config tag ## Push image",
-        f"{tab}docker push $(FULL_REGISTRY_IMAGE)",
+        "ssh-close: ## Close the shared SSH control connection",
+        "ifneq ($(SSH_MUX_OPTS),)",
+        f"{tab}@$(SSH) -O exit 2>/dev/null || true",
+        "endif",
+        "",
+        "remote-pull: check-config push | ssh-open ## Pull image on remote host (skipped when the release is unchanged)",
+        f"{tab}@$(SSH) '$(RELEASE_ENV); if cd $(REMOTE_COMPOSE_PATH) 2>/dev/null && {{ $(REMOTE_RELEASE_CURRENT) || $(REMOTE_RELEASE_STAGED); }}; then \\",
+        f"{tab}{tab}echo \"$(APP_NAME): release current or staged on $(REMOTE_HOST), pull skipped\"; \\",
+        f"{tab}{tab}else $(SUDO_CMD) docker pull $(FULL_REGISTRY_IMAGE); fi'",
         "",
-        "remote-pull: check-config push ## Pull image on remote host",
-        f'{tab}ssh -p $(REMOTE_PORT) $(REMOTE_USER)@$(REMOTE_HOST) "$(SUDO_CMD) docker pull $(FULL_REGISTRY_IMAGE)"',
+        "remote-clean: check-config | ssh-open ## Apply image retention on the remote host (keeps running and previous images)",
+        f"{tab}@printf '%s\\n' \"$$REMOTE_GC_SCRIPT\" | $(SSH) \"sh -s\"",
         "",
-        "remote-clean: check-config ## Cleanup dangling images on remote host",
-        f'{tab}ssh -p $(REMOTE_PORT) $(REMOTE_USER)@$(REMOTE_HOST) "$(SUDO_CMD) docker image prune -f"',
+        "local-gc: ## Apply image retention to local images (keeps the newest builds and the build cache)",
+        f"{tab}@printf '%s\\n' \"$$LOCAL_GC_SCRIPT\" | sh -s",
         "",
-        "local-clean: ## Cleanup local images",
+        "local-clean: ## Remove the local images of this version",
         f"{tab}docker rmi $(APP_NAME):$(VERSION) || true",
         f"{tab}docker rmi $(FULL_REGISTRY_IMAGE) || true",
         "",
-        "push-compose-file: check-config push ## Upload compose file to remote host",
-        f'{tab}ssh -p $(REMOTE_PORT) $(REMOTE_USER)@$(REMOTE_HOST) "mkdir -p $(REMOTE_COMPOSE_PATH)"',
-        f'{tab}ssh -p $(REMOTE_PORT) $(REMOTE_USER)@$(REMOTE_HOST) "chmod 750 $(REMOTE_COMPOSE_PATH) || true"',
-        f'{tab}ssh -p $(REMOTE_PORT) $(REMOTE_USER)@$(REMOTE_HOST) "rm -f $(REMOTE_COMPOSE_PATH)/$(APP_NAME).yaml"',
-        f"{tab}scp -P $(REMOTE_PORT) $(LOCAL_COMPOSE_FILE) $(REMOTE_USER)@$(REMOTE_HOST):$(REMOTE_COMPOSE_PATH)/$(APP_NAME).yaml",
+        "push-compose-file: check-config | ssh-open ## Sync the compose file and ARTIFACTS to the remote host (changed files only)",
+        "ifneq ($(HAVE_SCRIPT),)",
+        f"{tab}@$(PYTHON) $(DEPLOY_SCRIPT) $(REMOTE_ARGS) --hosts $(REMOTE_HOST) --sync $(ENV_MODE) --sync-method $(SYNC_METHOD) \\",
+        f"{tab}{tab}--artifact $(LOCAL_COMPOSE_FILE):$(APP_NAME).yaml $(foreach a,$(ARTIFACTS),--artifact $(a))",
+        "else",
+        "# Without the script only the compose file can be uploaded (in full, replaced atomically)",
+        f'{tab}@test -z "$(ARTIFACTS)" || (printf "$(RED)ARTIFACTS need the deployment script: $(DEPLOY_SCRIPT)$(NC)\\\\n" && exit 1)',
+        f'{tab}@$(SSH) "mkdir -p $(REMOTE_COMPOSE_PATH) && {{ chmod 750 $(REMOTE_COMPOSE_PATH) || true; }} && \\',
+        f'{tab}{tab}cat > $(REMOTE_COMPOSE_PATH)/.$(APP_NAME).yaml.tmp && mv $(REMOTE_COMPOSE_PATH)/.$(APP_NAME).yaml.tmp $(REMOTE_COMPOSE_PATH)/$(APP_NAME).yaml" < $(LOCAL_COMPOSE_FILE)',
+        "endif",
+        "",
+        "remote-load: check-script check-config build ## Stream image to REMOTE_HOSTS over SSH (compressed, missing layers only)",
+        f"{tab}@$(PYTHON) $(DEPLOY_SCRIPT) $(REMOTE_ARGS) --remote-load $(ENV_MODE) \\",
+        f"{tab}{tab}--image $(APP_NAME):$(VERSION) --remote-image $(FULL_REGISTRY_IMAGE) --compression $(LOAD_COMPRESSION)",
+        "",
+        "# Deploy graph (safe for make -j): ssh-open overlaps with build/push, the compose upload follows a",
+        "# successful push, and the remote pre-pull overlaps with local-clean; these ordering edges only apply",
+        "# to deploy goals, so remote-up and local-clean on their own still never build or push.",
+        "DEPLOY_JOBS ?= 4",
+        "# PREFLIGHT=true probes the hosts while the image builds and stops before anything is pushed or uploaded",
+        "PREFLIGHT ?= false",
+        "# SMOKE=true load-tests the new release after remote-up and fails the deploy on a regression (smoke-bench)",
+        "SMOKE ?= false",
+        "ifneq ($(DEPLOY_GOAL),)",
+        "ifneq ($(MAKE_4),)",
+        "MAKEFLAGS += -j$(DEPLOY_JOBS) --output-sync=line",
+        "endif",
+        "local-gc: | $(PUBLISH)",
+        "$(PUBLISH): | $(if $(filter 1 true yes on,$(PREFLIGHT)),preflight)",
+        "push-compose-file: | $(PUBLISH)",
+        "remote-up: | $(PUBLISH) $(PRE_PULL)",
+        "smoke-bench: | remote-up",
+        "endif",
+        "",
+        "remote-deploy: check-config $(PUBLISH) $(PRE_PULL) push-compose-file local-gc remote-up $(if $(filter 1 true yes on,$(SMOKE)),smoke-bench) ## Deploy on remote host",
+        f"{tab}@$(DEPLOY_SUMMARY)",
+        "",
+        "remote-up: check-config push-compose-file | ssh-open ## Switch one host to the pushed image (no build/push; skipped when the release is unchanged)",
+        f"{tab}@printf '%s\\n' \"$$$(if $(filter rolling,$(DEPLOY_STRATEGY)),ROLLING,RECREATE)_DEPLOY_SCRIPT\" | $(SSH) \"$(RELEASE_ENV) sh -s\"",
+        "",
+        "fleet-deploy: check-script check-config $(PUBLISH) local-gc ## Deploy to every host in REMOTE_HOSTS (canary, then batches)",
+        f'{tab}@$(PYTHON) $(DEPLOY_SCRIPT) --root . --fleet $(ENV_MODE) --hosts "$(REMOTE_HOSTS)" --target remote-up \\',
+        f"{tab}{tab}--parallel $(FLEET_PARALLEL) --batch-size $(FLEET_BATCH_SIZE) --canary $(FLEET_CANARY)",
+        f"{tab}@$(DEPLOY_SUMMARY)",
+        "",
+        "stage: check-script check-config $(PUBLISH) ## Pre-pull and verify the release on every host ahead of remote-deploy (STAGE_CREATE=true also creates containers)",
+        f'{tab}@$(PYTHON) $(DEPLOY_SCRIPT) --root . --fleet $(ENV_MODE) --hosts "$(STAGE_HOSTS)" --target stage-host \\',
+        f"{tab}{tab}--parallel $(FLEET_PARALLEL) --batch-size $(words $(STAGE_HOSTS)) --canary 0",
+        f"{tab}@$(DEPLOY_SUMMARY)",
+        "",
+        "stage-host: check-config push-compose-file | ssh-open ## Stage the release on REMOTE_HOST (run by stage)",
+        f"{tab}@printf '%s\\n' \"$$STAGE_SCRIPT\" | $(SSH) \"$(RELEASE_ENV) STAGE_CREATE=$(if $(filter 1 true yes on,$(STAGE_CREATE)),true,false) EXPECTED_LAYERS='$(strip $(STAGE_LAYERS))' sh -s\"",
+        "",
+        "preflight: check-script check-config ## Probe docker, disk, memory, networks and port conflicts on every host (JSON)",
+        f"{tab}@$(PYTHON) $(DEPLOY_SCRIPT) $(REMOTE_ARGS) --preflight $(ENV_MODE) --compose-file $(LOCAL_COMPOSE_FILE) \\",
+        f"{tab}{tab}--app-name $(APP_NAME) --image $(APP_NAME):$(VERSION)",
+        "",
+        "# Smoke benchmark: SMOKE_CONCURRENCY keep-alive clients for SMOKE_DURATION seconds against SMOKE_PATH on",
+        "# SMOKE_HOST, run on the host (SMOKE_FROM=remote, needs python3 there) or locally through an SSH tunnel",
+        "# (tunnel). SMOKE_URL overrides the target, e.g. a proxy when APP_PORT is not published. Results are",
+        "# compared with $(STATE_DIR)/smoke-$(ENV_MODE).json, recorded by the first run or by SMOKE_SAVE=true.",
+        f"APP_PORT ?= {base_cfg['app_port']}",
+        "SMOKE_HOST ?= $(REMOTE_HOST)",
+        "SMOKE_SSH = ssh $(SSH_MUX_OPTS) $(SSH_OPTS) -p $(REMOTE_PORT) $(REMOTE_USER)@$(SMOKE_HOST)",
+        f"SMOKE_FROM ?= {smoke['via']}",
+        f"SMOKE_PATH ?= {smoke['path']}",
+        "SMOKE_URL ?=",
+        f"SMOKE_CONCURRENCY ?= {smoke['concurrency']}",
+        f"SMOKE_DURATION ?= {smoke['duration']:g}",
+        f"SMOKE_MAX_P95_REGRESSION ?= {smoke['max_p95_regression']:g}",
+        f"SMOKE_MAX_P99_REGRESSION ?= {smoke['max_p99_regression']:g}",
+        f"SMOKE_MAX_RPS_DROP ?= {smoke['max_rps_drop']:g}",
+        f"SMOKE_MAX_ERROR_RATE ?= {smoke['max_error_rate']:g}",
+        f"SMOKE_MAX_P99_MS ?= {'' if smoke['max_p99_ms'] is None else format(smoke['max_p99_ms'], 'g')}",
+        f"SMOKE_MIN_DELTA_MS ?= {smoke['min_delta_ms']:g}",
+        f"SMOKE_ROLLBACK ?= {format_bool(smoke['rollback'])}",
+        "SMOKE_SAVE ?= false",
+        "SMOKE_ARGS = --via $(SMOKE_FROM) --url-path '$(SMOKE_PATH)' $(if $(SMOKE_URL),--url '$(SMOKE_URL)') \\",
+        f"{tab}--concurrency $(SMOKE_CONCURRENCY) --duration $(SMOKE_DURATION) --min-delta-ms $(SMOKE_MIN_DELTA_MS) \\",
+        f"{tab}--max-p95-regression $(SMOKE_MAX_P95_REGRESSION) --max-p99-regression $(SMOKE_MAX_P99_REGRESSION) \\",
+        f"{tab}--max-rps-drop $(SMOKE_MAX_RPS_DROP) --max-error-rate $(SMOKE_MAX_ERROR_RATE) \\",
+        f"{tab}$(if $(SMOKE_MAX_P99_MS),--max-p99-ms $(SMOKE_MAX_P99_MS)) $(if $(filter 1 true yes on,$(SMOKE_SAVE)),--save-baseline)",
         "",
-        "remote-deploy: check-config push local-clean push-compose-file ## Deploy on remote host",
-        f'{tab}ssh -p $(REMOTE_PORT) $(REMOTE_USER)@$(REMOTE_HOST) "cd $(REMOTE_COMPOSE_PATH) && $(SUDO_CMD) docker compose -f $(APP_NAME).yaml down"',
-        f'{tab}ssh -p $(REMOTE_PORT) $(REMOTE_USER)@$(REMOTE_HOST) "cd $(REMOTE_COMPOSE_PATH) && $(SUDO_CMD) docker compose -f $(APP_NAME).yaml pull"',
-        f'{tab}ssh -p $(REMOTE_PORT) $(REMOTE_USER)@$(REMOTE_HOST) "cd $(REMOTE_COMPOSE_PATH) && $(SUDO_CMD) docker compose -f $(APP_NAME).yaml up -d"',
+        "smoke-bench: check-script check-config | ssh-open ## Load-test SMOKE_HOST; fail on latency/throughput regressions vs the ENV_MODE baseline",
+        f"{tab}@$(PYTHON) $(DEPLOY_SCRIPT) $(REMOTE_ARGS) --hosts $(SMOKE_HOST) --smoke-bench $(ENV_MODE) \\",
+        f"{tab}{tab}--app-name $(APP_NAME) --app-port $(APP_PORT) --state-dir $(STATE_DIR) $(SMOKE_ARGS) || {{ \\",
+        f"{tab}{tab}$(if $(filter 1 true yes on,$(SMOKE_ROLLBACK)),printf \"$(RED)Smoke benchmark failed; rolling $(SMOKE_HOST) back$(NC)\\\\n\"; \\",
+        f"{tab}{tab}printf '%s\\n' \"$$ROLLBACK_SCRIPT\" | $(SMOKE_SSH) \"ROLLBACK_TO=2 sh -s\";) exit 1; }}",
         "",
-        "remote-status: check-config ## Check remote compose status",
-        f'{tab}ssh -p $(REMOTE_PORT) $(REMOTE_USER)@$(REMOTE_HOST) "cd $(REMOTE_COMPOSE_PATH) && $(SUDO_CMD) docker compose -f $(APP_NAME).yaml ps"',
+        "# Release number from remote-history; 2 is the release before the current one",
+        "ROLLBACK_TO ?= 2",
+        "remote-rollback: check-config | ssh-open ## Switch REMOTE_HOST back to an earlier release in seconds (ROLLBACK_TO=<n> from remote-history)",
+        f"{tab}@printf '%s\\n' \"$$ROLLBACK_SCRIPT\" | $(SSH) \"ROLLBACK_TO=$(ROLLBACK_TO) sh -s\"",
         "",
-        "remote-logs: check-config ## Tail recent logs on remote host",
-        f'{tab}ssh -p $(REMOTE_PORT) $(REMOTE_USER)@$(REMOTE_HOST) "cd $(REMOTE_COMPOSE_PATH) && $(SUDO_CMD) docker compose -f $(APP_NAME).yaml logs --tail=200"',
+        "remote-history: check-config | ssh-open ## List the releases on REMOTE_HOST that remote-rollback can switch to",
+        f"{tab}@printf '%s\\n' \"$$HISTORY_SCRIPT\" | $(SSH) \"sh -s\"",
+        "",
+        "# fleet-logs filters: LOG_GREP (extended regex), LOG_LEVEL (debug|info|warn|error|fatal), LOG_SINCE (10m, ISO time)",
+        "LOG_TAIL ?= 50",
+        "LOG_FOLLOW ?= true",
+        "LOG_JSON ?= false",
+        "LOG_ARGS = $(if $(LOG_GREP),--grep '$(LOG_GREP)') $(if $(LOG_LEVEL),--level $(LOG_LEVEL)) $(if $(LOG_SINCE),--since '$(LOG_SINCE)') \\",
+        f"{tab}$(if $(filter 1 true yes on,$(LOG_FOLLOW)),--follow) $(if $(filter 1 true yes on,$(LOG_JSON)),--json)",
+        "",
+        "remote-status: check-config | ssh-open ## Check remote compose status",
+        f'{tab}$(SSH) "cd $(REMOTE_COMPOSE_PATH) && $(REMOTE_COMPOSE) ps"',
+        "",
+        "remote-logs: check-config | ssh-open ## Tail recent logs on remote host",
+        f'{tab}$(SSH) "cd $(REMOTE_COMPOSE_PATH) && $(REMOTE_COMPOSE) logs --tail=200"',
+        "",
+        "fleet-logs: check-script check-config ## Follow logs of every host merged by timestamp (LOG_GREP, LOG_LEVEL, LOG_SINCE, LOG_JSON)",
+        f"{tab}@$(PYTHON) $(DEPLOY_SCRIPT) $(REMOTE_ARGS) --logs $(ENV_MODE) --app-name $(APP_NAME) --tail $(LOG_TAIL) $(LOG_ARGS)",
+        "",
+        "# remote-stats samples docker stats every STATS_INTERVAL seconds for STATS_WINDOW seconds on every host and",
+        "# flags containers whose average CPU or peak memory reaches STATS_SATURATION of their limit;",
+        "# STATS_FORMAT=prometheus prints the text format, STATS_PROM_FILE also writes it (textfile collector)",
+        "STATS_WINDOW ?= 30",
+        "STATS_INTERVAL ?= 5",
+        "STATS_SATURATION ?= 0.9",
+        "STATS_FORMAT ?= json",
+        "STATS_PROM_FILE ?=",
+        "",
+        "remote-stats: check-script check-config ## Sample CPU/memory vs limits, restarts and health of every host (JSON or Prometheus)",
+        f"{tab}@$(PYTHON) $(DEPLOY_SCRIPT) $(REMOTE_ARGS) --stats $(ENV_MODE) --app-name $(APP_NAME) \\",
+        f"{tab}{tab}--window $(STATS_WINDOW) --interval $(STATS_INTERVAL) --saturation $(STATS_SATURATION) \\",
+        f"{tab}{tab}--format $(STATS_FORMAT) $(if $(STATS_PROM_FILE),--prom-file '$(STATS_PROM_FILE)')",
+        "",
+        "deploy-report: check-script ## Print step timings and the critical path of the last deploy (REPORT_RUN=<id> for another)",
+        f"{tab}@$(PYTHON) $(DEPLOY_SCRIPT) --root . --deploy-report --timeline $(TIMELINE) $(if $(REPORT_RUN),--run $(REPORT_RUN))",
         "",
         "help: ## Show help",
         f'{tab}@printf "$(YELLOW)Current ENV_MODE: $(GREEN)$(ENV_MODE)$(NC)\\\\n"',
         f'{tab}@printf "$(YELLOW)Config files: $(GREEN)$(DEPLOY_COMMON_FILE), $(DEPLOY_ENV_FILE)$(NC)\\\\n"',
         f'{tab}@printf "$(YELLOW)Remote target: $(GREEN)$(REMOTE_USER)@$(REMOTE_HOST):$(REMOTE_PORT)$(NC)\\\\n"',
+        f'{tab}@printf "$(YELLOW)Deploy strategy: $(GREEN)$(DEPLOY_STRATEGY)$(NC)\\\\n"',
         f'{tab}@printf "$(YELLOW)Custom env examples: $(GREEN)$(CUSTOM_ENVS)$(NC)\\\\n"',
         f'{tab}@printf "\\\\n$(YELLOW)Available commands:$(NC)\\\\n"',
         f'{tab}@grep -E "^[a-zA-Z_-]+:.*?## .*$$" $(MAKEFILE_LIST) | sort | awk \'{{n = split($$$0, parts, "##"); split(parts[1], a, ":"); gsub(/^[ \\t]+|[ \\t]+$$$/, "", a[1]); desc = ""; for(i=2; i<=n; i++) {{ if(i>2) desc = desc "##"; desc = desc parts[i] }}; gsub(/^[ \\t]+|[ \\t]+$$$/, "", desc); printf "  $(GREEN)%-25s$(NC) %s\\\\n", a[1], desc}}\'',
@@ -239,19 +921,215 @@ def makefile_block(base_cfg: dict, custom_envs: list[str]) -> str:
     return "\n".join(lines)
 
 
-def dockerfile_template(app_port: int) -> str:
-    return f"""# DEPLOYMENT-DOCKERFILE:START
-FROM alpine:3.20
+def dockerfile_template(app_port: int, runtime: str = "generic", app_dir: str = ".") -> str:
+    # COPY sources are relative to the build context ($(MONOREPO_ROOT)), not to the app.
+    src = "" if app_dir == "." else f"{app_dir}/"
+    if runtime == "python":
+        body = f"""ARG PYTHON_VERSION=3.12
+FROM python:${{PYTHON_VERSION}}-alpine AS deps
+RUN python -m venv /opt/venv
+ENV PATH="/opt/venv/bin:$PATH"
+WORKDIR /app
+COPY {src}requirements*.txt ./
+RUN --mount=type=cache,target=/root/.cache/pip pip install -r requirements.txt
+
+FROM python:${{PYTHON_VERSION}}-alpine AS runtime
+ENV PATH="/opt/venv/bin:$PATH" PYTHONDONTWRITEBYTECODE=1 PYTHONUNBUFFERED=1
+WORKDIR /app
+COPY --from=deps /opt/venv /opt/venv
+COPY {src or "./"} ./
+USER nobody
+EXPOSE {app_port}
+CMD ["python", "-m", "app"]"""
+    elif runtime == "node":
+        body = f"""ARG NODE_VERSION=20
+FROM node:${{NODE_VERSION}}-alpine AS deps
+WORKDIR /app
+COPY {src}package.json {src}package-lock.json* ./
+RUN --mount=type=cache,target=/root/.npm npm ci
+
+FROM deps AS build
+COPY {src or "./"} ./
+RUN npm run build --if-present && npm prune --omit=dev
+
+FROM node:${{NODE_VERSION}}-alpine AS runtime
+ENV NODE_ENV=production
 WORKDIR /app
+COPY --from=build /app/package.json ./
+COPY --from=build /app/node_modules ./node_modules
+COPY --from=build /app/dist ./dist
+USER node
+EXPOSE {app_port}
+CMD ["node", "dist/index.js"]"""
+    elif runtime == "go":
+        body = f"""ARG GO_VERSION=1.22
+FROM golang:${{GO_VERSION}}-alpine AS build
+WORKDIR /src
+COPY {src}go.mod {src}go.sum* ./
+RUN --mount=type=cache,target=/go/pkg/mod go mod download
+COPY {src or "./"} ./
+RUN --mount=type=cache,target=/go/pkg/mod --mount=type=cache,target=/root/.cache/go-build \\
+    CGO_ENABLED=0 go build -trimpath -ldflags="-s -w" -o /out/app .
+
+FROM alpine:3.20 AS runtime
+WORKDIR /app
+COPY --from=build /out/app /app/app
+USER nobody
+EXPOSE {app_port}
+CMD ["/app/app"]"""
+    elif runtime == "static":
+        body = f"""ARG NODE_VERSION=20
+FROM node:${{NODE_VERSION}}-alpine AS build
+WORKDIR /app
+COPY {src}package.json {src}package-lock.json* ./
+RUN --mount=type=cache,target=/root/.npm npm ci
+COPY {src or "./"} ./
+RUN npm run build
+
+FROM nginx:1.27-alpine AS runtime
+RUN sed -i -e 's/listen  *80;/listen {app_port};/' -e 's/listen  *\\[::\\]:80;/listen [::]:{app_port};/' /etc/nginx/conf.d/default.conf
+COPY --from=build /app/dist /usr/share/nginx/html
+EXPOSE {app_port}"""
+    else:
+        body = f"""FROM alpine:3.20
+WORKDIR /app
+# Install dependencies before copying sources and keep package caches in BuildKit cache mounts, e.g.
+# RUN --mount=type=cache,target=/root/.cache/pip pip install -r requirements.txt
 COPY . /app
 EXPOSE {app_port}
-CMD ["sh", "-c", "echo \\"Set real runtime command in Dockerfile\\""]
+CMD ["sh", "-c", "echo \\"Set real runtime command in Dockerfile\\""]"""
+    return f"""# syntax=docker/dockerfile:1
+# DEPLOYMENT-DOCKERFILE:START
+{body}
 # DEPLOYMENT-DOCKERFILE:END
 """
 
 
-def compose_template(env_name: str, app_name: str, app_port: int, health_endpoint: str) -> str:
-    prod_resources = ""
+def compose_settings(profile: dict, env_name: str) -> dict:
+    """Merge compose tuning: defaults < prod defaults < profile "compose" < environments.<env>.compose."""
+    settings = {key: dict(value) if isinstance(value, dict) else value for key, value in COMPOSE_DEFAULTS.items()}
+    layers = [PROD_COMPOSE_DEFAULTS] if env_name == "prod" else []
+    layers += [profile.get("compose") or {}, get_env_obj(profile, env_name).get("compose") or {}]
+    for layer in layers:
+        if not isinstance(layer, dict):
+            raise ValueError(f"{env_name}.compose must be an object")
+        for key, value in layer.items():
+            if key not in COMPOSE_DEFAULTS:
+                raise ValueError(f"{env_name}.compose.{key} is not supported")
+            if isinstance(COMPOSE_DEFAULTS[key], dict):
+                if value is not None and not isinstance(value, dict):
+                    raise ValueError(f"{env_name}.compose.{key} must be an object")
+                settings[key] = {**settings[key], **value} if value else {}
+            else:
+                settings[key] = value
+    try:
+        settings["replicas"] = int(settings["replicas"])
+    except (TypeError, ValueError):
+        raise ValueError(f"{env_name}.compose.replicas must be an integer") from None
+    if settings["replicas"] < 1:
+        raise ValueError(f"{env_name}.compose.replicas must be >= 1")
+    if settings["publish"] not in PUBLISH_MODES:
+        raise ValueError(f"{env_name}.compose.publish must be one of: {', '.join(PUBLISH_MODES)}")
+    for key in settings["healthcheck"]:
+        if key not in HEALTHCHECK_KEYS:
+            raise ValueError(f"{env_name}.compose.healthcheck.{key} is not supported")
+    return settings
+
+
+def smoke_settings(profile: dict, health_endpoint: str) -> dict:
+    """Profile "smoke" object over SMOKE_DEFAULTS; the load hits health_endpoint unless "path" is set."""
+    layer = profile.get("smoke") or {}
+    if not isinstance(layer, dict):
+        raise ValueError("smoke must be an object")
+    settings = dict(SMOKE_DEFAULTS)
+    for key, value in layer.items():
+        if key not in SMOKE_DEFAULTS:
+            raise ValueError(f"smoke.{key} is not supported")
+        settings[key] = value
+    settings["path"] = str(settings["path"] or health_endpoint)
+    settings["via"] = str(settings["via"]).lower()
+    if settings["via"] not in SMOKE_VIAS:
+        raise ValueError(f"smoke.via must be one of: {', '.join(SMOKE_VIAS)}")
+    settings["rollback"] = parse_bool(str(settings["rollback"]))
+    for key in [key for key in SMOKE_DEFAULTS if key not in ("path", "via", "rollback")]:
+        if key == "max_p99_ms" and settings[key] in (None, ""):
+            settings[key] = None
+            continue
+        try:
+            settings[key] = int(settings[key]) if key == "concurrency" else float(settings[key])
+        except (TypeError, ValueError):
+            raise ValueError(f"smoke.{key} must be a number") from None
+        if settings[key] < 0 or (key in ("concurrency", "duration") and settings[key] <= 0):
+            raise ValueError(f"smoke.{key} must be positive")
+    return settings
+
+
+def yaml_lines(mapping: dict, indent: int) -> list[str]:
+    lines = []
+    for key, value in mapping.items():
+        if value is None:
+            continue
+        if isinstance(value, dict):
+            lines.append(" " * indent + f"{key}:")
+            lines.extend(yaml_lines(value, indent + 2))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            lines.append(" " * indent + f"{key}: {value}")
+        else:
+            lines.append(" " * indent + f'{key}: "{value}"')
+    return lines
+
+
+def publish_slots(env_name: str, strategy: str, tuning: dict) -> int:
+    """Containers of the service that can run at once, i.e. host ports an auto publish needs."""
+    return tuning["replicas"] * (2 if strategy == "rolling" and env_name != "local" else 1)
+
+
+def publish_warnings(app_port: int, strategy: str, tunings: dict[str, dict]) -> list[str]:
+    warnings = []
+    for env_name, tuning in tunings.items():
+        slots = publish_slots(env_name, strategy, tuning)
+        if tuning["publish"] == "none":
+            warnings.append(
+                f"{env_name}: port {app_port} is not published on the host (compose.publish=none);"
+                " reach the service through app-network and set SMOKE_URL for smoke-bench"
+            )
+        elif slots > 1:
+            alternates = " and the serving port alternates between releases" if slots > tuning["replicas"] else ""
+            warnings.append(
+                f"{env_name}: up to {slots} containers run at once ({tuning['replicas']} replicas, {strategy});"
+                f" host ports {app_port}-{app_port + slots - 1} must be free{alternates}"
+            )
+    return warnings
+
+
+def compose_template(
+    env_name: str,
+    app_name: str,
+    app_port: int,
+    health_endpoint: str,
+    strategy: str = "recreate",
+    tuning: dict | None = None,
+) -> str:
+    tuning = tuning or compose_settings({}, env_name)
+    slots = publish_slots(env_name, strategy, tuning)
+    container_name = f"    container_name: ${{APP_NAME}}-{env_name}\n"
+    published = f'    ports:\n      - "{app_port}:{app_port}"'
+    if slots > 1:
+        # Replicas, and old and new containers during a rolling deploy, run side by side: each binds
+        # a free host port of the range (APP_PORT first); app-network still resolves the service
+        # name to every replica for a reverse proxy.
+        if slots > tuning["replicas"] and tuning["publish"] == "auto":
+            # The containers that survive a rolling deploy keep the ports they started on, so APP_PORT
+            # would stop serving after every other release.
+            raise ValueError(
+                f"{env_name}.compose.publish must be set for deploy_strategy=rolling: \"none\" to serve through"
+                f" a reverse proxy on app-network (stable entry point), or \"range\" to publish host ports"
+                f" {app_port}-{app_port + slots - 1} and accept that the serving port alternates between releases"
+            )
+        container_name = ""
+        published = f'    ports:\n      - "{app_port}-{app_port + slots - 1}:{app_port}"'
+    if tuning["publish"] == "none":
+        published = f'    expose:\n      - "{app_port}"'
     image_or_build = "    image: ${FULL_REGISTRY_IMAGE}"
     if env_name == "local":
         image_or_build = (
@@ -260,33 +1138,44 @@ def compose_template(env_name: str, app_name: str, app_port: int, health_endpoin
             "      dockerfile: Dockerfile\n"
             f"    image: {app_name}:local"
         )
-    if env_name == "prod":
-        prod_resources = """
-    deploy:
-      resources:
-        limits:
-          cpus: "1.0"
-          memory: "512M"
-"""
+    healthcheck = "\n".join(
+        f"      {key}: {tuning['healthcheck'][key]}"
+        for key in HEALTHCHECK_KEYS
+        if tuning["healthcheck"].get(key) is not None
+    )
+    deploy = {
+        "replicas": tuning["replicas"] if tuning["replicas"] > 1 else None,
+        "resources": {
+            key: {name: str(value) for name, value in tuning[key].items()} or None
+            for key in ("limits", "reservations")
+        },
+    }
+    if not any(deploy["resources"].values()):
+        deploy["resources"] = None
+    extra = yaml_lines({"deploy": deploy}, 4) if any(deploy.values()) else []
+    ulimits = {
+        name: {limit: int(number) for limit, number in value.items()} if isinstance(value, dict) else int(value)
+        for name, value in tuning["ulimits"].items()
+        if value is not None
+    }
+    if ulimits:
+        extra += yaml_lines({"ulimits": ulimits}, 4)
+    extra_block = "".join(f"\n{line}" for line in extra)
     return f"""services:
   {app_name}:
 {image_or_build}
-    container_name: ${{APP_NAME}}-{env_name}
-    restart: unless-stopped
-    ports:
-      - "{app_port}:{app_port}"
+{container_name}    restart: unless-stopped
+{published}
     environment:
       - ENV_MODE={env_name}
     healthcheck:
       test: ["CMD-SHELL", "wget -qO- http://127.0.0.1:{app_port}{health_endpoint} || exit 1"]
-      interval: 30s
-      timeout: 5s
-      retries: 3
+{healthcheck}
     logging:
       driver: "json-file"
       options:
         max-size: "10m"
-        max-file: "5"{prod_resources}
+        max-file: "5"{extra_block}
     networks:
       - app-network
 
@@ -297,16 +1186,10 @@ networks:
 
 
 def common_env_template(common_cfg: dict) -> str:
-    return (
-        "# DEPLOYMENT-ENV:common\n"
-        "# Shared defaults for all environments\n"
-        f"REGISTRY_HOST={common_cfg['REGISTRY_HOST']}\n"
-        f"REMOTE_USER={common_cfg['REMOTE_USER']}\n"
-        f"REMOTE_HOST={common_cfg['REMOTE_HOST']}\n"
-        f"REMOTE_PORT={common_cfg['REMOTE_PORT']}\n"
-        f"REMOTE_COMPOSE_PATH={common_cfg['REMOTE_COMPOSE_PATH']}\n"
-        f"LOCAL_COMPOSE_FILE={common_cfg['LOCAL_COMPOSE_FILE']}\n"
-    )
+    lines = ["# DEPLOYMENT-ENV:common", "# Shared defaults for all environments"]
+    for key in ENV_KEYS:
+        lines.append(f"{key}={common_cfg[key]}")
+    return "\n".join(lines) + "\n"
 
 
 def env_override_template(env_name: str, common_cfg: dict, env_cfg: dict) -> str:
@@ -323,6 +1206,214 @@ def env_override_template(env_name: str, common_cfg: dict, env_cfg: dict) -> str
     return "\n".join(lines) + "\n"
 
 
+def context_layout(root: Path, monorepo_root: str) -> tuple[Path, str]:
+    """Return the build context directory and the app directory relative to it."""
+    context = (root / monorepo_root).resolve()
+    try:
+        app_dir = root.relative_to(context).as_posix()
+    except ValueError:
+        app_dir = "."
+    return context, app_dir or "."
+
+
+def dockerignore_name(app_dir: str) -> str:
+    # BuildKit prefers <Dockerfile>.dockerignore next to the Dockerfile, which scopes the
+    # ignore rules to this app without touching the monorepo root.
+    return ".dockerignore" if app_dir == "." else "Dockerfile.dockerignore"
+
+
+def dockerignore_template(app_dir: str, extra: list[str], include: list[str]) -> str:
+    lines = [DOCKERIGNORE_MARKER]
+    if app_dir != ".":
+        lines.append(f"# Context is the monorepo root; send only {app_dir} (plus context_include paths)")
+        lines.append("*")
+        for path in [app_dir, *include]:
+            lines.append(f"!{path.strip('/')}")
+    lines.extend(DOCKERIGNORE_DEFAULTS)
+    lines.extend(extra)
+    return "\n".join(lines) + "\n"
+
+
+def ignore_regex(pattern: str) -> re.Pattern:
+    out = ""
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if pattern.startswith("**", i):
+            i += 2
+            if pattern.startswith("/", i):
+                out += "(?:.*/)?"
+                i += 1
+            else:
+                out += ".*"
+            continue
+        if char == "*":
+            out += "[^/]*"
+        elif char == "?":
+            out += "[^/]"
+        elif char == "[":
+            close = pattern.find("]", i + 1)
+            if close == -1:
+                out += re.escape(char)
+            else:
+                body = pattern[i + 1 : close]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out += f"[{body}]"
+                i = close
+        elif char == "\\" and i + 1 < len(pattern):
+            i += 1
+            out += re.escape(pattern[i])
+        else:
+            out += re.escape(char)
+        i += 1
+    return re.compile(f"^{out}$")
+
+
+def load_ignore_rules(path: Path) -> list[tuple[re.Pattern, bool, str]]:
+    rules: list[tuple[re.Pattern, bool, str]] = []
+    if not path.exists():
+        return rules
+    for line in path.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        negate = line.startswith("!")
+        pattern = os.path.normpath(line[1:].strip() if negate else line).lstrip("/")
+        if pattern in ("", "."):
+            continue
+        rules.append((ignore_regex(pattern), negate, pattern))
+    return rules
+
+
+def is_ignored(rel_path: str, rules: list[tuple[re.Pattern, bool, str]]) -> bool:
+    parts = rel_path.split("/")
+    candidates = ["/".join(parts[: i + 1]) for i in range(len(parts))]
+    ignored = False
+    for regex, negate, _ in rules:
+        if any(regex.match(candidate) for candidate in candidates):
+            ignored = not negate
+    return ignored
+
+
+def may_reinclude(rel_dir: str, rules: list[tuple[re.Pattern, bool, str]]) -> bool:
+    for _, negate, pattern in rules:
+        if not negate:
+            continue
+        prefix = re.split(r"[*?\[]", pattern, maxsplit=1)[0]
+        if not prefix or prefix.startswith(rel_dir + "/") or rel_dir.startswith(prefix.rstrip("/")):
+            return True
+    return False
+
+
+def iter_context_files(context: Path, rules: list[tuple[re.Pattern, bool, str]]):
+    """Yield (relative path, stat) for every file the daemon would receive."""
+    for dirpath, dirnames, filenames in os.walk(context):
+        rel_dir = Path(dirpath).relative_to(context).as_posix()
+        rel_dir = "" if rel_dir == "." else rel_dir
+        kept = []
+        for name in sorted(dirnames):
+            rel = f"{rel_dir}/{name}" if rel_dir else name
+            if not is_ignored(rel, rules) or may_reinclude(rel, rules):
+                kept.append(name)
+        dirnames[:] = kept
+        for name in sorted(filenames):
+            rel = f"{rel_dir}/{name}" if rel_dir else name
+            if is_ignored(rel, rules):
+                continue
+            try:
+                yield rel, os.lstat(os.path.join(dirpath, name))
+            except OSError:
+                continue
+
+
+def resolve_ignore_file(context: Path, dockerfile: Path) -> Path:
+    specific = dockerfile.with_name(dockerfile.name + ".dockerignore")
+    return specific if specific.exists() else context / ".dockerignore"
+
+
+def human_size(num: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if num < 1024 or unit == "GiB":
+            return f"{num:.1f} {unit}" if unit != "B" else f"{int(num)} B"
+        num /= 1024
+    return f"{num:.1f} GiB"
+
+
+def context_report(context: Path, dockerfile: Path, top: int = 15, depth: int = 2) -> dict:
+    ignore_file = resolve_ignore_file(context, dockerfile)
+    rules = load_ignore_rules(ignore_file)
+    total = 0
+    files = 0
+    dirs: dict[str, int] = {}
+    for rel, stat in iter_context_files(context, rules):
+        total += stat.st_size
+        files += 1
+        parts = rel.split("/")[:-1]
+        for level in range(1, min(depth, len(parts)) + 1):
+            key = "/".join(parts[:level])
+            dirs[key] = dirs.get(key, 0) + stat.st_size
+    largest = sorted(dirs.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "status": "ok",
+        "context": str(context),
+        "ignore_file": str(ignore_file) if ignore_file.exists() else None,
+        "files": files,
+        "size_bytes": total,
+        "size": human_size(total),
+        "largest_dirs": [{"path": path, "size_bytes": size, "size": human_size(size)} for path, size in largest],
+    }
+
+
+def file_digest(path: Path, stat: os.stat_result, cache: dict) -> str:
+    """sha256 of a file, reused from cache while size and mtime are unchanged."""
+    key = str(path)
+    signature = [stat.st_size, stat.st_mtime_ns]
+    cached = cache.get(key)
+    if cached and cached[:2] == signature:
+        return cached[2]
+    if os.path.islink(path):
+        digest = hashlib.sha256(os.readlink(path).encode()).hexdigest()
+    else:
+        sha = hashlib.sha256()
+        with path.open("rb") as fh:
+            for chunk in iter(lambda: fh.read(1 << 20), b""):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+    cache[key] = [*signature, digest]
+    return digest
+
+
+def inputs_digest(
+    context: Path | None, dockerfile: Path | None, includes: list[Path], salt: str, state_dir: Path
+) -> str:
+    cache_file = state_dir / "hash-cache.json"
+    try:
+        cache = json.loads(cache_file.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        cache = {}
+    before = dict(cache)
+    sha = hashlib.sha256(salt.encode())
+    if context is not None:
+        rules = load_ignore_rules(resolve_ignore_file(context, dockerfile or context / "Dockerfile"))
+        for rel, stat in iter_context_files(context, rules):
+            if (context / rel).is_relative_to(state_dir):
+                continue
+            sha.update(f"{rel}\0{stat.st_mode & 0o111:o}\0{file_digest(context / rel, stat, cache)}\n".encode())
+    for path in ([dockerfile] if dockerfile else []) + includes:
+        if path.is_dir():
+            for item in sorted(p for p in path.rglob("*") if p.is_file()):
+                rel = item.relative_to(path.parent).as_posix()
+                sha.update(f"{rel}\0{item.stat().st_mode & 0o111:o}\0{file_digest(item, item.stat(), cache)}\n".encode())
+            continue
+        stat = os.stat(path)
+        sha.update(f"{path.name}\0{file_digest(path, stat, cache)}\n".encode())
+    if cache != before:
+        state_dir.mkdir(parents=True, exist_ok=True)
+        atomic_write(cache_file, json.dumps(cache))
+    return sha.hexdigest()
+
+
 def deployment_tips_block() -> str:
     return """<!-- DEPLOYMENT:START -->
 # Deployment Skills Tips
@@ -369,304 +1460,1911 @@ def collect_custom_envs(args, profile: dict, env_mode: str) -> list[str]:
     return unique
 
 
-def main() -> int:
-    parser = argparse.ArgumentParser(
-        description="Create deployment configuration with shared common file + environment override files."
+def read_env_file(path: Path) -> dict[str, str]:
+    values: dict[str, str] = {}
+    if not path.exists():
+        return values
+    for line in path.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if not line or line.startswith("#") or "=" not in line:
+            continue
+        key, value = line.split("=", 1)
+        values[key.strip()] = value.strip()
+    return values
+
+
+def load_env_files(root: Path, env_name: str) -> dict[str, str]:
+    values = read_env_file(root / ".deploy.env.common")
+    values.update(read_env_file(root / f".deploy.env.{env_name}"))
+    return values
+
+
+def fleet_waves(hosts: list[str], batch_size: int, canary: int) -> list[list[str]]:
+    batch_size = max(1, batch_size)
+    canary = max(0, min(canary, len(hosts)))
+    waves = [hosts[:canary]] if canary else []
+    rest = hosts[canary:]
+    waves.extend(rest[i : i + batch_size] for i in range(0, len(rest), batch_size))
+    return waves
+
+
+def run_host_target(root: Path, env_name: str, host: str, target: str) -> dict:
+    started = time.monotonic()
+    # The parent make's jobserver fds are not inherited, so drop them and let each host run its own.
+    makeflags = [flag for flag in os.environ.get("MAKEFLAGS", "").split(" ") if not flag.startswith("--jobserver")]
+    proc = subprocess.run(
+        ["make", "--no-print-directory", "-C", str(root), f"ENV_MODE={env_name}", f"REMOTE_HOST={host}", target],
+        capture_output=True,
+        text=True,
+        env={**os.environ, "MAKEFLAGS": " ".join(makeflags)},
     )
-    parser.add_argument("--root", default=".", help="Project root.")
-    parser.add_argument("--from-json", help="Optional profile JSON.")
-    parser.add_argument("--app-name")
-    parser.add_argument("--version")
-    parser.add_argument("--env-mode")
-    parser.add_argument("--use-sudo")
-    parser.add_argument("--monorepo-root")
-    parser.add_argument("--registry-host")
-    parser.add_argument("--remote-user")
-    parser.add_argument("--remote-host")
-    parser.add_argument("--remote-port")
-    parser.add_argument("--remote-compose-path")
-    parser.add_argument("--test-registry-host")
-    parser.add_argument("--test-remote-user")
-    parser.add_argument("--test-remote-host")
-    parser.add_argument("--test-remote-port")
-    parser.add_argument("--test-remote-compose-path")
-    parser.add_argument("--prod-registry-host")
-    parser.add_argument("--prod-remote-user")
-    parser.add_argument("--prod-remote-host")
-    parser.add_argument("--prod-remote-port")
-    parser.add_argument("--prod-remote-compose-path")
-    parser.add_argument("--custom-env", action="append", help="Custom environment name (repeatable).")
-    parser.add_argument("--app-port", type=int)
-    parser.add_argument("--health-endpoint")
-    parser.add_argument("--force-compose", action="store_true", help="Overwrite compose files.")
-    parser.add_argument("--force-env-files", action="store_true", help="Overwrite .deploy.env* files.")
-    parser.add_argument("--force-dockerfile", action="store_true", help="Overwrite Dockerfile.")
-    args = parser.parse_args()
+    result = {
+        "host": host,
+        "status": "ok" if proc.returncode == 0 else "failed",
+        "exit_code": proc.returncode,
+        "duration_s": round(time.monotonic() - started, 3),
+    }
+    if proc.returncode != 0:
+        result["output_tail"] = (proc.stdout + proc.stderr).strip().splitlines()[-20:]
+    print(f"[{host}] {target}: {result['status']} ({result['duration_s']}s)", file=sys.stderr)
+    return result
+
+
+def run_fleet(
+    root: Path, env_name: str, hosts: list[str], target: str, parallel: int, batch_size: int, canary: int
+) -> dict:
+    waves = fleet_waves(hosts, batch_size, canary)
+    results: list[dict] = []
+    failed = False
+    with ThreadPoolExecutor(max_workers=max(1, parallel)) as pool:
+        for index, wave in enumerate(waves):
+            if failed:
+                results.extend({"host": host, "status": "skipped", "wave": index} for host in wave)
+                continue
+            wave_results = list(pool.map(lambda host: run_host_target(root, env_name, host, target), wave))
+            for item in wave_results:
+                item["wave"] = index
+            results.extend(wave_results)
+            failed = any(item["status"] != "ok" for item in wave_results)
+    return {
+        "status": "failed" if failed else "ok",
+        "env": env_name,
+        "target": target,
+        "waves": len(waves),
+        "hosts": results,
+    }
 
+
+def script_path(root: Path) -> str:
+    """DEPLOY_SCRIPT default: relative inside the project, $(HOME)-relative for a per-user skill install."""
+    script = Path(__file__).resolve()
     try:
-        profile = load_profile(args.from_json)
-    except (FileNotFoundError, json.JSONDecodeError) as err:
+        return script.relative_to(root).as_posix()
+    except ValueError:
+        pass
+    try:
+        return "$(HOME)/" + script.relative_to(Path.home().resolve()).as_posix()
+    except (RuntimeError, ValueError):
+        return str(script)
+
+
+def fleet_main(args) -> int:
+    root = Path(args.root).resolve()
+    try:
+        env_name = normalize_env_name(args.fleet)
+    except ValueError as err:
         print(f"CONFIG_ERROR: {err}")
         return 1
+    env_values = load_env_files(root, env_name)
+    hosts = split_list(args.hosts or env_values.get("REMOTE_HOSTS") or env_values.get("REMOTE_HOST", ""))
+    if not hosts:
+        print(f"CONFIG_ERROR: no REMOTE_HOSTS configured for {env_name}")
+        return 1
+    report = run_fleet(root, env_name, hosts, args.target, args.parallel, args.batch_size, args.canary)
+    print(json.dumps(report, ensure_ascii=True, indent=2))
+    return 0 if report["status"] == "ok" else 1
+
+
+def remote_settings(args, env_name: str) -> dict:
+    """Connection settings for runtime modes: .deploy.env.* values, overridden by CLI flags."""
+    values = load_env_files(Path(args.root).resolve(), env_name)
+    ssh_opts = args.ssh_opts
+    if ssh_opts is None:
+        ssh_opts = values.get("SSH_OPTS", "")
+        if parse_bool(values.get("SSH_MULTIPLEX", SSH_DEFAULTS["SSH_MULTIPLEX"])):
+            control_path = values.get("SSH_CONTROL_PATH", SSH_DEFAULTS["SSH_CONTROL_PATH"])
+            persist = values.get("SSH_CONTROL_PERSIST", SSH_DEFAULTS["SSH_CONTROL_PERSIST"])
+            ssh_opts = f"-o ControlMaster=auto -o ControlPath={control_path} -o ControlPersist={persist} {ssh_opts}"
+    return {
+        "env": env_name,
+        "hosts": split_list(args.hosts or values.get("REMOTE_HOSTS") or values.get("REMOTE_HOST", "")),
+        "user": args.remote_user or values.get("REMOTE_USER", "deploy"),
+        "port": str(args.remote_port or values.get("REMOTE_PORT", "22")),
+        "compose_path": args.remote_compose_path or values.get("REMOTE_COMPOSE_PATH", "~/docker-composes"),
+        "sudo": "sudo " if parse_bool(args.use_sudo if args.use_sudo is not None else "true") else "",
+        "ssh_opts": shlex.split(ssh_opts),
+    }
+
 
+def ssh_argv(settings: dict, host: str) -> list[str]:
+    return ["ssh", *settings["ssh_opts"], "-p", settings["port"], f"{settings['user']}@{host}"]
+
+
+def layer_chain_ids(diff_ids: list[str]) -> list[str]:
+    chain: list[str] = []
+    for diff_id in diff_ids:
+        if not chain:
+            chain.append(diff_id)
+        else:
+            chain.append("sha256:" + hashlib.sha256(f"{chain[-1]} {diff_id}".encode()).hexdigest())
+    return chain
+
+
+def saved_image_layers(archive: Path) -> list[tuple[str, str]]:
+    """Return (layer member name, chain id) pairs from a `docker save` archive."""
+    with tarfile.open(archive, "r") as tar:
+        manifest = json.load(tar.extractfile("manifest.json"))[0]
+        config = json.load(tar.extractfile(manifest["Config"]))
+    chain = layer_chain_ids(config["rootfs"]["diff_ids"])
+    return list(zip(manifest["Layers"], chain))
+
+
+REMOTE_LAYER_QUERY = (
+    "command -v zstd >/dev/null 2>&1 && echo ZSTD; "
+    "{sudo}docker image ls -q --no-trunc | sort -u | xargs -r {sudo}docker image inspect -f '{{{{json .RootFS.Layers}}}}'"
+)
+
+
+def remote_chain_ids(settings: dict, host: str) -> tuple[set[str], bool]:
+    proc = subprocess.run(
+        [*ssh_argv(settings, host), REMOTE_LAYER_QUERY.format(sudo=settings["sudo"])],
+        capture_output=True,
+        text=True,
+        stdin=subprocess.DEVNULL,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip() or f"layer query failed on {host}")
+    chains: set[str] = set()
+    has_zstd = False
+    for line in proc.stdout.splitlines():
+        line = line.strip()
+        if line == "ZSTD":
+            has_zstd = True
+        elif line.startswith("["):
+            chains.update(layer_chain_ids(json.loads(line) or []))
+    return chains, has_zstd
+
+
+class CountingWriter:
+    def __init__(self, sink):
+        self.sink = sink
+        self.bytes = 0
+
+    def write(self, data: bytes) -> int:
+        self.sink.write(data)
+        self.bytes += len(data)
+        return len(data)
+
+
+def load_image_on_host(
+    settings: dict, host: str, archive: Path, layers: list[tuple[str, str]], image: str, remote_image: str, compression: str
+) -> dict:
+    started = time.monotonic()
+    wall_start = time.time()
+    result: dict[str, Any] = {"host": host, "layers": len(layers)}
+    ssh = comp = pump = None
+    try:
+        remote_chains, remote_zstd = remote_chain_ids(settings, host)
+        skip = {name for name, chain in layers if chain in remote_chains}
+        if compression == "auto":
+            compression = "zstd" if remote_zstd and shutil.which("zstd") else "gzip"
+        compressor, decompressor = LOAD_COMPRESSORS[compression]
+        sudo = settings["sudo"]
+        remote_cmd = f"{decompressor} | {sudo}docker load"
+        if remote_image and remote_image != image:
+            remote_cmd += f" && {sudo}docker tag {shlex.quote(image)} {shlex.quote(remote_image)}"
+        ssh = subprocess.Popen(
+            [*ssh_argv(settings, host), remote_cmd], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        wire = CountingWriter(ssh.stdin)
+        if compressor:
+            comp = subprocess.Popen(compressor, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+            def copy_out() -> None:
+                try:
+                    for chunk in iter(lambda: comp.stdout.read(1 << 20), b""):
+                        wire.write(chunk)
+                except OSError:
+                    pass  # ssh went away; its exit status reports the failure
+
+            pump = threading.Thread(target=copy_out, daemon=True)
+            pump.start()
+            raw = CountingWriter(comp.stdin)
+        else:
+            raw = wire
+        with tarfile.open(archive, "r") as src, tarfile.open(fileobj=raw, mode="w|") as out:
+            for member in src:
+                if member.name in skip:
+                    continue
+                out.addfile(member, src.extractfile(member) if member.isfile() else None)
+        if comp:
+            comp.stdin.close()
+            pump.join()
+            comp.wait()
+        stdout, stderr = ssh.communicate()
+        result.update(
+            {
+                "status": "ok" if ssh.returncode == 0 else "failed",
+                "layers_sent": len(layers) - len(skip),
+                "compression": compression,
+                "raw_bytes": raw.bytes,
+                "wire_bytes": wire.bytes,
+            }
+        )
+        if ssh.returncode != 0:
+            result["error"] = stderr.decode(errors="replace").strip()
+    except (OSError, RuntimeError, KeyError, ValueError, tarfile.TarError) as err:
+        result.update({"status": "failed", "error": str(err)})
+    finally:
+        # On any failure mid-stream, stop the compressor and ssh instead of leaving them on open pipes.
+        for proc in (comp, ssh):
+            if proc is not None and proc.poll() is None:
+                proc.kill()
+        if pump is not None:
+            pump.join()
+        for proc in (comp, ssh):
+            if proc is not None:
+                for stream in (proc.stdin, proc.stdout, proc.stderr):
+                    if stream is not None:
+                        try:
+                            stream.close()
+                        except OSError:
+                            pass
+                proc.wait()
+    result["duration_s"] = round(time.monotonic() - started, 3)
+    record_step("remote-load", host, wall_start, 0 if result["status"] == "ok" else 1, result.get("wire_bytes"))
+    print(f"[{host}] remote-load: {result['status']} ({result['duration_s']}s)", file=sys.stderr)
+    return result
+
+
+def remote_load_main(args) -> int:
     try:
-        env_mode = normalize_env_name(str(pick(profile, args.env_mode, ["env_mode", "ENV_MODE"], "test")))
-        use_sudo = parse_bool(str(pick(profile, args.use_sudo, ["use_sudo", "USE_SUDO"], "true")))
-        common_port = normalize_port(
-            pick(profile, args.remote_port, ["remote_port", "REMOTE_PORT"], 22),
-            "remote_port",
+        env_name = normalize_env_name(args.remote_load)
+    except ValueError as err:
+        print(f"CONFIG_ERROR: {err}")
+        return 1
+    settings = remote_settings(args, env_name)
+    if not settings["hosts"] or not args.image:
+        print("CONFIG_ERROR: --remote-load needs --image and at least one host")
+        return 1
+    with tempfile.TemporaryDirectory(prefix="deploy-load-") as tmp:
+        archive = Path(tmp) / "image.tar"
+        saved = subprocess.run(["docker", "save", args.image, "-o", str(archive)])
+        if saved.returncode != 0:
+            print(f"CONFIG_ERROR: docker save failed for {args.image}")
+            return 1
+        try:
+            layers = saved_image_layers(archive)
+        except (KeyError, IndexError, ValueError, tarfile.TarError) as err:
+            print(f"CONFIG_ERROR: unreadable docker save archive: {err}")
+            return 1
+        with ThreadPoolExecutor(max_workers=max(1, args.parallel)) as pool:
+            hosts = list(
+                pool.map(
+                    lambda host: load_image_on_host(
+                        settings, host, archive, layers, args.image, args.remote_image, args.compression
+                    ),
+                    settings["hosts"],
+                )
+            )
+    failed = any(item["status"] != "ok" for item in hosts)
+    report = {"status": "failed" if failed else "ok", "env": env_name, "image": args.image, "hosts": hosts}
+    print(json.dumps(report, ensure_ascii=True, indent=2))
+    return 1 if failed else 0
+
+
+SYNC_METHODS = ("auto", "rsync", "tar")
+
+
+def artifact_specs(value: Any) -> list[str]:
+    """Profile "artifacts" as "src:dest" specs; dest is relative to REMOTE_COMPOSE_PATH and defaults to src."""
+    specs = []
+    for item in value or []:
+        if isinstance(item, dict):
+            src, dest = str(item.get("src", "")), str(item.get("dest") or item.get("src", ""))
+        else:
+            src, _, dest = str(item).partition(":")
+            dest = dest or src
+        src, dest = src.strip().rstrip("/"), dest.strip().rstrip("/")
+        if not src or any(ch.isspace() for ch in src + dest) or ":" in src + dest:
+            raise ValueError(f"invalid artifact: {item!r}")
+        if dest.startswith(("/", "~")) or ".." in Path(dest).parts:
+            raise ValueError(f"artifact destination must stay inside remote_compose_path: {dest}")
+        specs.append(f"{src}:{dest}")
+    return specs
+
+
+def artifact_files(root: Path, specs: list[str]) -> list[tuple[str, Path]]:
+    """(remote relative path, local file) for every file of the artifact specs; directories are walked."""
+    files: dict[str, Path] = {}
+    for spec in specs:
+        src, _, dest = spec.partition(":")
+        dest = dest or src
+        path = root / src
+        if path.is_dir():
+            for item in sorted(p for p in path.rglob("*") if p.is_file()):
+                files[f"{dest}/{item.relative_to(path).as_posix()}"] = item.resolve()
+        elif path.is_file():
+            files[dest] = path.resolve()
+        else:
+            raise ValueError(f"artifact does not exist: {src}")
+    return list(files.items())
+
+
+def remote_dir(settings: dict) -> str:
+    path = settings["compose_path"]
+    return path[2:] if path.startswith("~/") else path
+
+
+def sync_rsync(settings: dict, host: str, files: list[tuple[str, Path]]) -> list[str]:
+    """Block-level delta of changed files in one connection; --delay-updates renames them into place together."""
+    with tempfile.TemporaryDirectory(prefix="deploy-sync-") as tmp:
+        stage = Path(tmp)
+        stage.chmod(0o750)
+        for dest, src in files:
+            (stage / dest).parent.mkdir(parents=True, exist_ok=True)
+            (stage / dest).symlink_to(src)
+        path = settings["compose_path"]
+        proc = subprocess.run(
+            [
+                "rsync", "-rLptcz", "--omit-dir-times", "--delay-updates", "--out-format=%n",
+                "-e", shlex.join(["ssh", *settings["ssh_opts"], "-p", settings["port"]]),
+                f"--rsync-path=mkdir -p {path} && {{ chmod 750 {path} || true; }} && rsync",
+                f"{stage}/", f"{settings['user']}@{host}:{remote_dir(settings)}/",
+            ],
+            capture_output=True,
+            text=True,
+            stdin=subprocess.DEVNULL,
         )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip() or f"rsync exited {proc.returncode}")
+    return [line for line in proc.stdout.splitlines() if line and not line.endswith("/")]
+
+
+def sync_tar(settings: dict, host: str, files: list[tuple[str, Path]]) -> list[str]:
+    """File-level fallback: compare sha256 sums, then stream changed files into a staging dir and rename them."""
+    path = settings["compose_path"]
+    dests = " ".join(shlex.quote(dest) for dest, _ in files)
+    probe = subprocess.run(
+        [*ssh_argv(settings, host), f"cd {path} 2>/dev/null && sha256sum -- {dests} 2>/dev/null; true"],
+        capture_output=True,
+        text=True,
+        stdin=subprocess.DEVNULL,
+    )
+    if probe.returncode == 255:
+        raise RuntimeError(probe.stderr.strip())
+    remote = {}
+    for line in probe.stdout.splitlines():
+        digest, _, name = line.partition("  ")
+        remote[name] = digest
+    changed = [(dest, src) for dest, src in files if remote.get(dest) != file_digest(src, src.stat(), {})]
+    if not changed:
+        return []
+    # Same filesystem as the targets, so each mv is an atomic rename; the compose file (listed first) goes last.
+    order = " ".join(shlex.quote(dest) for dest, _ in [*changed[1:], *changed[:1]])
+    command = (
+        f"set -e; mkdir -p {path}; chmod 750 {path} || true; cd {path}; tmp=$(mktemp -d .sync.XXXXXX); "
+        f"trap 'rm -rf \"$tmp\"' EXIT; tar -xf - -C \"$tmp\"; "
+        f"for f in {order}; do mkdir -p \"$(dirname \"$f\")\"; mv -f \"$tmp/$f\" \"$f\"; done"
+    )
+    ssh = subprocess.Popen([*ssh_argv(settings, host), command], stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+    with tarfile.open(fileobj=ssh.stdin, mode="w|") as out:
+        for dest, src in changed:
+            out.add(src, arcname=dest)
+    ssh.stdin.close()
+    if ssh.wait() != 0:
+        raise RuntimeError(ssh.stderr.read().decode(errors="replace").strip() or f"ssh exited {ssh.returncode}")
+    return [dest for dest, _ in changed]
+
+
+def sync_host(settings: dict, host: str, files: list[tuple[str, Path]], requested: str) -> dict:
+    started = time.monotonic()
+    method = requested if requested != "auto" else "rsync" if shutil.which("rsync") else "tar"
+    result: dict[str, Any] = {"host": host, "files": len(files)}
+    try:
+        try:
+            changed = (sync_rsync if method == "rsync" else sync_tar)(settings, host, files)
+        except RuntimeError as err:
+            # auto falls back to tar when the host lacks rsync; other failures are reported as they are.
+            if requested != "auto" or method != "rsync" or "not found" not in str(err):
+                raise
+            method = "tar"
+            changed = sync_tar(settings, host, files)
+        result.update({"status": "ok", "method": method, "changed": changed})
+    except (OSError, RuntimeError, tarfile.TarError) as err:
+        result.update({"status": "failed", "method": method, "error": str(err)})
+    result["duration_s"] = round(time.monotonic() - started, 3)
+    return result
+
+
+def sync_main(args) -> int:
+    try:
+        env_name = normalize_env_name(args.sync)
+    except ValueError as err:
+        print(f"CONFIG_ERROR: {err}")
+        return 1
+    settings = remote_settings(args, env_name)
+    try:
+        files = artifact_files(Path(args.root).resolve(), artifact_specs(args.artifact))
+    except ValueError as err:
+        print(f"CONFIG_ERROR: {err}")
+        return 1
+    if not settings["hosts"] or not files:
+        print("CONFIG_ERROR: --sync needs --artifact and at least one host")
+        return 1
+    with ThreadPoolExecutor(max_workers=min(32, len(settings["hosts"]))) as pool:
+        hosts = list(pool.map(lambda host: sync_host(settings, host, files, args.sync_method), settings["hosts"]))
+    failed = any(item["status"] != "ok" for item in hosts)
+    if args.json:
+        print(json.dumps({"status": "failed" if failed else "ok", "env": env_name, "hosts": hosts}, indent=2))
+    for item in hosts:
+        if item["status"] != "ok":
+            print(f"[{item['host']}] sync failed ({item['method']}): {item['error']}", file=sys.stderr)
+        elif not args.json:
+            print(f"[{item['host']}] {len(item['changed'])} of {item['files']} file(s) changed ({item['method']})")
+    return 1 if failed else 0
+
+
+# One round trip per host; every line is "key=value" so a missing tool only drops its own line.
+PREFLIGHT_PROBE = """
+info=$(@SUDO@docker info --format '{{.ServerVersion}} {{.DockerRootDir}}' 2>/dev/null)
+echo "docker=$info"
+root=${info#* }
+df -Pk "${root:-/}" 2>/dev/null | awk 'NR == 2 {print "disk_free_kb=" $4}'
+awk '/^MemTotal:/ {print "mem_total_kb=" $2} /^MemAvailable:/ {print "mem_available_kb=" $2}' /proc/meminfo 2>/dev/null
+for net in @NETWORKS@; do
+  if @SUDO@docker network inspect "$net" >/dev/null 2>&1; then echo "network=$net ok"; else echo "network=$net missing"; fi
+done
+for port in @PORTS@; do
+  if command -v ss >/dev/null 2>&1; then busy=$(ss -Hltn "sport = :$port" 2>/dev/null | head -n 1)
+  else busy=$(netstat -ltn 2>/dev/null | awk -v p=":$port" '$4 ~ p "$"' | head -n 1); fi
+  owners=$(@SUDO@docker ps --filter "publish=$port" --format '{{.Names}}' 2>/dev/null | tr '\\n' ' ')
+  if [ -n "$busy" ]; then echo "port=$port busy $owners"; else echo "port=$port free"; fi
+done
+"""
+MEMORY_UNITS = {
+    "": 1, "b": 1, "k": 1024, "kb": 1024, "kib": 1024, "m": 1024**2, "mb": 1024**2, "mib": 1024**2,
+    "g": 1024**3, "gb": 1024**3, "gib": 1024**3, "t": 1024**4, "tb": 1024**4, "tib": 1024**4,
+}
+
+
+def memory_bytes(value: str) -> int | None:
+    match = re.fullmatch(r"\s*([0-9.]+)\s*([a-zA-Z]*)\s*", str(value))
+    if not match or match.group(2).lower() not in MEMORY_UNITS:
+        return None
+    return int(float(match.group(1)) * MEMORY_UNITS[match.group(2).lower()])
+
+
+def compose_requirements(path: Path) -> dict:
+    """Published host ports, external networks and memory (limits/reservations x replicas) of a compose file.
+
+    Reads the block-style YAML that compose_template() writes; flow mappings and anchors are not supported.
+    """
+    scalars: dict[tuple[str, ...], str] = {}
+    items: dict[tuple[str, ...], list[str]] = {}
+    stack: list[tuple[int, str]] = []
+    for raw in path.read_text(encoding="utf-8").splitlines():
+        text = raw.strip()
+        if not text or text.startswith("#"):
+            continue
+        indent = len(raw) - len(raw.lstrip())
+        while stack and stack[-1][0] >= indent:
+            stack.pop()
+        keys = tuple(key for _, key in stack)
+        if text.startswith("- "):
+            items.setdefault(keys, []).append(text[2:].strip().strip("\"'"))
+            continue
+        key, _, value = text.partition(":")
+        key = key.strip().strip("\"'")
+        if value.strip():
+            scalars[(*keys, key)] = value.strip().strip("\"'")
+        else:
+            stack.append((indent, key))
+    services = {keys[1] for keys in [*scalars, *items] if len(keys) > 1 and keys[0] == "services"}
+    ports: list[int] = []
+    memory = {"limits": 0, "reservations": 0}
+    for service in sorted(services):
+        for item in items.get(("services", service, "ports"), []):
+            parts = item.split(":")
+            published = re.fullmatch(r"(\d+)(?:-(\d+))?", parts[-2]) if len(parts) >= 2 else None
+            if published:
+                first = int(published.group(1))
+                ports.extend(range(first, int(published.group(2) or first) + 1))
+        replicas = int(scalars.get(("services", service, "deploy", "replicas"), "1") or 1)
+        for kind in memory:
+            size = memory_bytes(scalars.get(("services", service, "deploy", "resources", kind, "memory"), ""))
+            memory[kind] += (size or 0) * replicas
+    networks = [
+        scalars.get(("networks", name, "name"), name)
+        for (top, name, *rest), value in scalars.items()
+        if top == "networks" and rest == ["external"] and parse_bool(value)
+    ]
+    return {"ports": sorted(set(ports)), "networks": networks, "memory": memory}
+
+
+def local_image_size(image: str | None) -> int | None:
+    if not image:
+        return None
+    proc = subprocess.run(["docker", "image", "inspect", "--format", "{{.Size}}", image], capture_output=True, text=True)
+    value = proc.stdout.strip()
+    return int(value) if proc.returncode == 0 and value.isdigit() else None
+
+
+def preflight_checks(facts: dict, needs: dict, image_size: int | None, app_name: str | None) -> dict:
+    checks: dict[str, dict] = {}
+    version = facts.get("docker", "").split(" ")[0]
+    checks["docker"] = {"status": "ok", "version": version} if version else {"status": "fail", "error": "docker daemon unreachable"}
+
+    free = int(facts["disk_free_kb"]) * 1024 if facts.get("disk_free_kb", "").isdigit() else None
+    disk = {"status": "ok", "free_bytes": free, "image_bytes": image_size}
+    if free is None:
+        disk["status"] = "warn"
+    elif image_size and free < image_size:
+        disk["status"] = "fail"
+    elif image_size and free < 2 * image_size:
+        disk["status"] = "warn"
+    checks["disk"] = disk
+
+    total = int(facts["mem_total_kb"]) * 1024 if facts.get("mem_total_kb", "").isdigit() else None
+    available = int(facts["mem_available_kb"]) * 1024 if facts.get("mem_available_kb", "").isdigit() else None
+    limits, reservations = needs["memory"]["limits"], needs["memory"]["reservations"]
+    memory = {"status": "ok", "available_bytes": available, "limits_bytes": limits, "reservations_bytes": reservations}
+    if total is None:
+        memory["status"] = "warn"
+    elif reservations > total:
+        memory["status"] = "fail"
+    elif available is not None and limits > available:
+        # The containers being replaced free their memory on switch-over, so this is only a warning.
+        memory["status"] = "warn"
+    checks["memory"] = memory
+
+    for name in needs["networks"]:
+        present = facts.get(f"network={name}") == "ok"
+        checks[f"network:{name}"] = {"status": "ok" if present else "fail", "network": name, "present": present}
+
+    for port in needs["ports"]:
+        state = facts.get(f"port={port}", "free").split()
+        owners = state[1:]
+        ours = bool(app_name) and bool(owners) and all(app_name in owner for owner in owners)
+        status = "ok" if state[0] != "busy" or ours else "fail"
+        checks[f"port:{port}"] = {"status": status, "port": port, "in_use": state[0] == "busy", "containers": owners}
+    return checks
+
+
+def preflight_host(settings: dict, host: str, needs: dict, image_size: int | None, app_name: str | None) -> dict:
+    started = time.monotonic()
+    script = (
+        PREFLIGHT_PROBE.replace("@SUDO@", settings["sudo"])
+        .replace("@NETWORKS@", " ".join(shlex.quote(name) for name in needs["networks"]))
+        .replace("@PORTS@", " ".join(str(port) for port in needs["ports"]))
+    )
+    proc = subprocess.run([*ssh_argv(settings, host), script], capture_output=True, text=True, stdin=subprocess.DEVNULL)
+    result: dict[str, Any] = {"host": host, "duration_s": round(time.monotonic() - started, 3)}
+    if proc.returncode == 255:
+        return {**result, "status": "unreachable", "error": proc.stderr.strip()}
+    facts: dict[str, str] = {}
+    for line in proc.stdout.splitlines():
+        key, _, value = line.partition("=")
+        if key in {"network", "port"}:
+            name, _, value = value.partition(" ")
+            key = f"{key}={name}"
+        facts[key] = value.strip()
+    checks = preflight_checks(facts, needs, image_size, app_name)
+    states = {check["status"] for check in checks.values()}
+    status = "failed" if "fail" in states else "warn" if "warn" in states else "ok"
+    return {**result, "status": status, "checks": checks}
+
+
+def preflight_main(args) -> int:
+    try:
+        env_name = normalize_env_name(args.preflight)
     except ValueError as err:
         print(f"CONFIG_ERROR: {err}")
         return 1
+    root = Path(args.root).resolve()
+    settings = remote_settings(args, env_name)
+    if not settings["hosts"]:
+        print(f"CONFIG_ERROR: no REMOTE_HOSTS configured for {env_name}")
+        return 1
+    compose_file = args.compose_file or load_env_files(root, env_name).get("LOCAL_COMPOSE_FILE")
+    needs: dict[str, Any] = {"ports": [], "networks": [], "memory": {"limits": 0, "reservations": 0}}
+    if compose_file and (root / compose_file).exists():
+        needs = compose_requirements(root / compose_file)
+    if args.app_port and args.app_port not in needs["ports"]:
+        needs["ports"].append(args.app_port)
+    image_size = local_image_size(args.image)
+    with ThreadPoolExecutor(max_workers=min(32, len(settings["hosts"]))) as pool:
+        hosts = list(
+            pool.map(lambda host: preflight_host(settings, host, needs, image_size, args.app_name), settings["hosts"])
+        )
+    states = {item["status"] for item in hosts}
+    status = "failed" if states & {"failed", "unreachable"} else "warn" if "warn" in states else "ok"
+    report = {"status": status, "env": env_name, "compose_file": compose_file, "requires": needs, "hosts": hosts}
+    print(json.dumps(report, ensure_ascii=True, indent=2))
+    return 1 if status == "failed" else 0
+
+
+STATS_PROBE = """
+cd @COMPOSE_PATH@ || exit 3
+ids=$(@SUDO@env APP_NAME=@APP@ docker compose -f @APP@.yaml ps -aq 2>/dev/null)
+echo "host_cpus=$(nproc 2>/dev/null)"
+[ -n "$ids" ] || exit 0
+inspect() {
+  @SUDO@docker inspect --format "$1={{.Name}}|{{.HostConfig.NanoCpus}}|{{.HostConfig.Memory}}|{{.RestartCount}}|{{.State.Status}}|{{if .State.Health}}{{.State.Health.Status}}|{{.State.Health.FailingStreak}}{{end}}" $ids
+}
+inspect start
+i=0
+while [ $i -lt @SAMPLES@ ]; do
+  t=$(date +%s)
+  @SUDO@docker stats --no-stream --format 'sample={{.Name}}|{{.CPUPerc}}|{{.MemUsage}}' $ids 2>/dev/null
+  echo "tick=$i"
+  i=$((i + 1))
+  left=$((@INTERVAL@ - $(date +%s) + t))
+  [ $i -lt @SAMPLES@ ] && [ $left -gt 0 ] && sleep $left
+done
+inspect end
+"""
+STATS_FLAGS = ("cpu_saturated", "memory_saturated", "restarted", "unhealthy", "not_running")
+
+
+def spread(values: list[float], digits: int | None = 2) -> dict | None:
+    if not values:
+        return None
+    stats = {"min": min(values), "avg": sum(values) / len(values), "max": max(values)}
+    return {name: round(value, digits) for name, value in stats.items()}
+
+
+def stats_containers(lines: list[str], host_cpus: float | None, saturation: float) -> tuple[dict, list[list[dict]]]:
+    """Aggregate STATS_PROBE output per container; also returns the raw samples grouped by tick."""
+    inspected: dict[str, dict[str, list[str]]] = {}
+    ticks: list[list[dict]] = [[]]
+    for line in lines:
+        key, _, value = line.partition("=")
+        fields = value.split("|")
+        if key in {"start", "end"}:
+            inspected.setdefault(fields[0].lstrip("/"), {})[key] = fields
+        elif key == "sample" and len(fields) == 3:
+            usage, _, limit = fields[2].partition("/")
+            try:
+                cpu = float(fields[1].strip().rstrip("%"))
+            except ValueError:
+                continue
+            sample = {"name": fields[0], "cpu": cpu, "memory": memory_bytes(usage), "limit": memory_bytes(limit)}
+            ticks[-1].append(sample)
+        elif key == "tick":
+            ticks.append([])
+    ticks = [tick for tick in ticks if tick]
+    containers: dict[str, dict] = {}
+    for name, states in sorted(inspected.items()):
+        start, end = states.get("start"), states.get("end") or states.get("start")
+        samples = [item for tick in ticks for item in tick if item["name"] == name]
+        nano_cpus = int(end[1]) if end[1].isdigit() else 0
+        cpus = nano_cpus / 1e9 if nano_cpus else host_cpus
+        memory_limit = int(end[2]) if end[2].isdigit() and int(end[2]) else None
+        memory_limit = memory_limit or next((item["limit"] for item in samples if item["limit"]), None)
+        cpu = spread([item["cpu"] for item in samples])
+        memory = spread([item["memory"] for item in samples if item["memory"] is not None], None)
+        restarts = int(end[3]) - int(start[3]) if start and end[3].isdigit() and start[3].isdigit() else 0
+        entry: dict[str, Any] = {
+            "state": end[4],
+            "health": end[5] if len(end) > 6 and end[5] else None,
+            "failing_streak": int(end[6]) if len(end) > 6 and end[6].isdigit() else 0,
+            "restart_count": int(end[3]) if end[3].isdigit() else None,
+            "restarts": max(0, restarts),
+            "samples": len(samples),
+            "cpu_percent": cpu,
+            "memory_bytes": memory,
+            "cpus": cpus,
+            "cpus_limited": bool(nano_cpus),
+            "memory_limit_bytes": memory_limit,
+            "memory_limited": end[2].isdigit() and int(end[2]) > 0,
+            "cpu_utilization": None,
+            "memory_utilization": None,
+        }
+        # CPU is judged on the window average (short bursts are normal), memory on the peak (OOM kills are not).
+        if cpu and cpus:
+            entry["cpu_utilization"] = {stat: round(cpu[stat] / 100 / cpus, 3) for stat in ("avg", "max")}
+        if memory and memory_limit:
+            entry["memory_utilization"] = {stat: round(memory[stat] / memory_limit, 3) for stat in ("avg", "max")}
+        flags = {
+            "cpu_saturated": bool(entry["cpu_utilization"]) and entry["cpu_utilization"]["avg"] >= saturation,
+            "memory_saturated": bool(entry["memory_utilization"]) and entry["memory_utilization"]["max"] >= saturation,
+            "restarted": entry["restarts"] > 0,
+            "unhealthy": entry["health"] == "unhealthy",
+            "not_running": entry["state"] != "running",
+        }
+        entry["flags"] = [flag for flag in STATS_FLAGS if flags[flag]]
+        entry["status"] = "warn" if entry["flags"] else "ok"
+        containers[name] = entry
+    return containers, ticks
+
+
+def stats_host(settings: dict, host: str, app_name: str, samples: int, interval: int, saturation: float) -> dict:
+    started = time.monotonic()
+    script = (
+        STATS_PROBE.replace("@SUDO@", settings["sudo"])
+        .replace("@COMPOSE_PATH@", settings["compose_path"])
+        .replace("@APP@", shlex.quote(app_name))
+        .replace("@SAMPLES@", str(samples))
+        .replace("@INTERVAL@", str(interval))
+    )
+    result: dict[str, Any] = {"host": host}
+    try:
+        proc = subprocess.run(
+            [*ssh_argv(settings, host), script],
+            capture_output=True,
+            text=True,
+            stdin=subprocess.DEVNULL,
+            timeout=samples * (interval + 15) + 60,
+        )
+    except subprocess.TimeoutExpired:
+        return {**result, "status": "failed", "error": "timed out", "duration_s": round(time.monotonic() - started, 3)}
+    result["duration_s"] = round(time.monotonic() - started, 3)
+    if proc.returncode == 255:
+        return {**result, "status": "unreachable", "error": proc.stderr.strip()}
+    if proc.returncode != 0:
+        return {**result, "status": "failed", "error": proc.stderr.strip() or f"exit {proc.returncode}"}
+    lines = proc.stdout.splitlines()
+    cpus = next((line.partition("=")[2] for line in lines if line.startswith("host_cpus=")), "")
+    containers, ticks = stats_containers(lines, int(cpus) if cpus.isdigit() else None, saturation)
+    flagged = sorted({flag for entry in containers.values() for flag in entry["flags"]}, key=STATS_FLAGS.index)
+    if not containers:
+        result["error"] = f"no containers of {app_name} in {settings['compose_path']}"
+    return {
+        **result,
+        "status": "warn" if flagged or not containers else "ok",
+        "host_cpus": int(cpus) if cpus.isdigit() else None,
+        "samples": len(ticks),
+        "containers": len(containers),
+        "cpu_percent": spread([sum(item["cpu"] for item in tick) for tick in ticks]),
+        "memory_bytes": spread([sum(item["memory"] or 0 for item in tick) for tick in ticks], None),
+        "restarts": sum(entry["restarts"] for entry in containers.values()),
+        "flags": flagged,
+        "container_stats": containers,
+    }
 
-    base_cfg = {
-        "app_name": str(pick(profile, args.app_name, ["app_name", "APP_NAME"], "service-app")),
-        "version": str(pick(profile, args.version, ["version", "VERSION"], "latest")),
-        "env_mode": env_mode,
-        "use_sudo": use_sudo,
-        "monorepo_root": str(pick(profile, args.monorepo_root, ["monorepo_root", "MONOREPO_ROOT"], ".")),
-        "app_port": int(pick(profile, args.app_port, ["app_port", "APP_PORT"], 8080)),
-        "health_endpoint": str(pick(profile, args.health_endpoint, ["health_endpoint", "HEALTH_ENDPOINT"], "/healthz")),
+
+STATS_METRICS = {
+    "deploy_host_up": "1 when the host answered the stats probe.",
+    "deploy_host_containers": "Containers of the app on the host.",
+    "deploy_host_cpu_percent": "CPU of all app containers on the host, percent of one core.",
+    "deploy_host_memory_bytes": "Memory of all app containers on the host.",
+    "deploy_container_cpu_percent": "Container CPU, percent of one core.",
+    "deploy_container_memory_bytes": "Container memory usage.",
+    "deploy_container_cpu_limit_cores": "CPU limit of the container (host cores when unlimited).",
+    "deploy_container_memory_limit_bytes": "Memory limit of the container (host memory when unlimited).",
+    "deploy_container_restart_count": "Docker restart count of the container.",
+    "deploy_container_restarts_window": "Restarts during the sampling window.",
+    "deploy_container_healthy": "1 when the healthcheck reports healthy (absent without a healthcheck).",
+    "deploy_container_health_failing_streak": "Consecutive failed health checks.",
+    "deploy_container_saturated": "1 when usage reached the saturation threshold of the limit.",
+}
+
+
+def prometheus_label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def stats_prometheus(report: dict) -> str:
+    """Prometheus text format (all gauges) of a --stats report, e.g. for the node_exporter textfile collector."""
+    samples: dict[str, list[str]] = {name: [] for name in STATS_METRICS}
+
+    def add(name: str, labels: dict, value: Any) -> None:
+        if value is not None:
+            text = ",".join(f'{key}="{prometheus_label(item)}"' for key, item in labels.items())
+            number = int(value) if isinstance(value, bool) or float(value).is_integer() else value
+            samples[name].append(f"{name}{{{text}}} {number}")
+
+    for item in report["hosts"]:
+        host = {"env": report["env"], "app": report["app"], "host": item["host"]}
+        add("deploy_host_up", host, item["status"] in {"ok", "warn"})
+        add("deploy_host_containers", host, item.get("containers"))
+        for metric, key in (("deploy_host_cpu_percent", "cpu_percent"), ("deploy_host_memory_bytes", "memory_bytes")):
+            for stat, value in (item.get(key) or {}).items():
+                add(metric, {**host, "stat": stat}, value)
+        for name, entry in (item.get("container_stats") or {}).items():
+            labels = {**host, "container": name}
+            for metric, key in (
+                ("deploy_container_cpu_percent", "cpu_percent"),
+                ("deploy_container_memory_bytes", "memory_bytes"),
+            ):
+                for stat, value in (entry[key] or {}).items():
+                    add(metric, {**labels, "stat": stat}, value)
+            add("deploy_container_cpu_limit_cores", labels, entry["cpus"])
+            add("deploy_container_memory_limit_bytes", labels, entry["memory_limit_bytes"])
+            add("deploy_container_restart_count", labels, entry["restart_count"])
+            add("deploy_container_restarts_window", labels, entry["restarts"])
+            add("deploy_container_healthy", labels, None if entry["health"] is None else entry["health"] == "healthy")
+            add("deploy_container_health_failing_streak", labels, entry["failing_streak"])
+            for resource in ("cpu", "memory"):
+                saturated = f"{resource}_saturated" in entry["flags"]
+                add("deploy_container_saturated", {**labels, "resource": resource}, saturated)
+    lines = []
+    for name, values in samples.items():
+        if values:
+            lines += [f"# HELP {name} {STATS_METRICS[name]}", f"# TYPE {name} gauge", *values]
+    return "\n".join(lines) + "\n"
+
+
+def stats_main(args) -> int:
+    try:
+        env_name = normalize_env_name(args.stats)
+    except ValueError as err:
+        print(f"CONFIG_ERROR: {err}")
+        return 1
+    settings = remote_settings(args, env_name)
+    app_name = args.app_name or load_env_files(Path(args.root).resolve(), env_name).get("APP_NAME")
+    if not settings["hosts"] or not app_name:
+        print("CONFIG_ERROR: --stats needs --app-name and at least one host")
+        return 1
+    if args.interval < 1 or args.window < 0 or not 0 < args.saturation <= 1:
+        print("CONFIG_ERROR: --interval must be >= 1, --window >= 0 and --saturation in (0, 1]")
+        return 1
+    samples = max(1, int(args.window // args.interval))
+    with ThreadPoolExecutor(max_workers=min(32, len(settings["hosts"]))) as pool:
+        hosts = list(
+            pool.map(
+                lambda host: stats_host(settings, host, app_name, samples, args.interval, args.saturation),
+                settings["hosts"],
+            )
+        )
+    states = {item["status"] for item in hosts}
+    status = "failed" if states & {"failed", "unreachable"} else "warn" if "warn" in states else "ok"
+    report = {
+        "status": status,
+        "env": env_name,
+        "app": app_name,
+        "window_s": args.window,
+        "interval_s": args.interval,
+        "samples": samples,
+        "saturation": args.saturation,
+        "hosts": hosts,
     }
+    if args.prom_file:
+        atomic_write(Path(args.prom_file), stats_prometheus(report))
+    if args.format == "prometheus":
+        print(stats_prometheus(report), end="")
+    else:
+        print(json.dumps(report, ensure_ascii=True, indent=2))
+    return 1 if status == "failed" else 0
+
+
+LOG_LINE = re.compile(r"^(?P<container>\S+)\s+\|\s(?P<ts>\d{4}-\d\d-\d\dT[0-9:]+(?:\.\d+)?Z)\s?(?P<message>.*)$")
+LOG_LEVELS = {
+    "debug": ["DEBUG", "TRACE"],
+    "info": ["INFO", "NOTICE"],
+    "warn": ["WARN", "WARNING"],
+    "error": ["ERROR", "ERR"],
+    "fatal": ["FATAL", "CRITICAL", "CRIT", "PANIC"],
+}
+# Lines from different hosts may arrive out of order; in follow mode hold them this long before merging.
+LOG_REORDER_S = 0.5
+
+
+def log_command(settings: dict, app_name: str, args) -> str:
+    """Remote pipeline that tails compose logs and filters them before they cross the SSH link."""
+    app = shlex.quote(app_name)
+    command = (
+        f"cd {settings['compose_path']} && {settings['sudo']}env APP_NAME={app} "
+        f"docker compose -f {app}.yaml logs --no-color --timestamps --tail {max(0, args.tail)}"
+    )
+    if args.since:
+        command += f" --since {shlex.quote(args.since)}"
+    if args.follow:
+        command += " --follow"
+    command += " 2>&1"
+    if args.level:
+        levels = list(LOG_LEVELS)
+        words = [word for level in levels[levels.index(args.level) :] for word in LOG_LEVELS[level]]
+        command += f" | grep --line-buffered -i -w -E {shlex.quote('|'.join(words))}"
+    if args.grep:
+        command += f" | grep --line-buffered -E {shlex.quote(args.grep)}"
+    return command
+
+
+def log_sort_key(ts: str) -> str:
+    # Docker trims trailing zeros from RFC3339Nano fractions; pad them so keys compare as strings.
+    base, _, fraction = ts.rstrip("Z").partition(".")
+    return f"{base}.{fraction.ljust(9, '0')}"
+
+
+def parse_log_line(host: str, line: str) -> dict:
+    match = LOG_LINE.match(line)
+    if not match:
+        return {"host": host, "container": "", "ts": "", "message": line}
+    return {"host": host, **match.groupdict()}
+
+
+def follow_host_logs(settings: dict, host: str, command: str, lines: queue.Queue, procs: list) -> None:
+    proc = subprocess.Popen(
+        [*ssh_argv(settings, host), command],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        stdin=subprocess.DEVNULL,
+        text=True,
+        errors="replace",
+    )
+    procs.append(proc)
+    # Drain stderr alongside stdout so a chatty remote cannot fill the pipe and stall the follower.
+    errors: list[str] = []
+
+    def drain_stderr() -> None:
+        for line in proc.stderr:
+            errors.append(line.rstrip("\n"))
+            del errors[:-20]
+
+    drain = threading.Thread(target=drain_stderr, daemon=True)
+    drain.start()
+    for line in proc.stdout:
+        lines.put((host, line.rstrip("\n"), None))
+    # grep exits 1 when nothing matched, which is not a failure.
+    code = proc.wait()
+    drain.join()
+    lines.put((host, None, f"exit {code}: {'; '.join(errors).strip()}" if code not in (0, 1) else None))
+
+
+def logs_main(args) -> int:
+    try:
+        env_name = normalize_env_name(args.logs)
+    except ValueError as err:
+        print(f"CONFIG_ERROR: {err}")
+        return 1
+    settings = remote_settings(args, env_name)
+    app_name = args.app_name or load_env_files(Path(args.root).resolve(), env_name).get("APP_NAME")
+    if not settings["hosts"] or not app_name:
+        print("CONFIG_ERROR: --logs needs --app-name and at least one host")
+        return 1
+    command = log_command(settings, app_name, args)
+    lines: queue.Queue = queue.Queue()
+    procs: list[subprocess.Popen] = []
+    for host in settings["hosts"]:
+        threading.Thread(target=follow_host_logs, args=(settings, host, command, lines, procs), daemon=True).start()
+    width = max(len(host) for host in settings["hosts"])
+    pending: list[tuple[str, int, float, dict]] = []
+    failures: list[str] = []
+    running = len(settings["hosts"])
+    seq = 0
+
+    def emit(entry: dict) -> None:
+        if args.json:
+            print(json.dumps(entry, ensure_ascii=True), flush=True)
+        else:
+            container = f"{entry['container']} | " if entry["container"] else ""
+            print(f"{entry['host']:<{width}}  {container}{entry['ts']} {entry['message']}".rstrip(), flush=True)
 
-    common_cfg = {
-        "REGISTRY_HOST": str(pick(profile, args.registry_host, ["registry_host", "REGISTRY_HOST"], "registry.example.com")),
-        "REMOTE_USER": str(pick(profile, args.remote_user, ["remote_user", "REMOTE_USER"], "deploy")),
-        "REMOTE_HOST": str(pick(profile, args.remote_host, ["remote_host", "REMOTE_HOST"], "127.0.0.1")),
-        "REMOTE_PORT": str(common_port),
-        "REMOTE_COMPOSE_PATH": str(
-            pick(profile, args.remote_compose_path, ["remote_compose_path", "REMOTE_COMPOSE_PATH"], "~/docker-composes")
-        ),
-        "LOCAL_COMPOSE_FILE": "docker-compose.test.yaml",
+    try:
+        while running or pending:
+            try:
+                host, line, error = lines.get(timeout=0.1)
+                if line is None:
+                    running -= 1
+                    if error:
+                        failures.append(f"{host}: {error}")
+                else:
+                    entry = parse_log_line(host, line)
+                    seq += 1
+                    heapq.heappush(pending, (log_sort_key(entry["ts"]) if entry["ts"] else "", seq, time.monotonic(), entry))
+            except queue.Empty:
+                pass
+            # Without --follow every host ends on its own, so everything is merged once they all finished.
+            if not running:
+                horizon = float("inf")
+            elif args.follow:
+                horizon = time.monotonic() - LOG_REORDER_S
+            else:
+                continue
+            while pending and pending[0][2] <= horizon:
+                emit(heapq.heappop(pending)[3])
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for proc in procs:
+            if proc.poll() is None:
+                proc.terminate()
+    for failure in failures:
+        print(f"[logs] {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+def smoke_load(url: str, concurrency: int, duration: float, timeout: float = 5.0) -> dict:
+    """GET url from `concurrency` keep-alive clients for `duration` seconds; latencies in ms.
+
+    Stdlib only and self-contained: its source is also piped to python3 on the deploy host.
+    """
+    import http.client
+    import math
+    import threading
+    import time
+    from urllib.parse import urlsplit
+
+    parts = urlsplit(url)
+    connection = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+    target = (parts.path or "/") + ("?" + parts.query if parts.query else "")
+    latencies: list = []
+    statuses: dict = {}
+    lock = threading.Lock()
+
+    def client(deadline: float) -> None:
+        conn = None
+        samples, codes = [], {}
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            try:
+                if conn is None:
+                    conn = connection(parts.hostname, parts.port, timeout=timeout)
+                conn.request("GET", target)
+                response = conn.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException) as err:
+                code = type(err).__name__
+                if conn is not None:
+                    conn.close()
+                conn = None
+                # A refused connection fails instantly; do not spin on it.
+                time.sleep(0.05)
+            else:
+                code = str(response.status)
+                if response.status < 400:
+                    samples.append(time.monotonic() - started)
+            codes[code] = codes.get(code, 0) + 1
+        if conn is not None:
+            conn.close()
+        with lock:
+            latencies.extend(samples)
+            for code, count in codes.items():
+                statuses[code] = statuses.get(code, 0) + count
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=client, args=(started + duration,)) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    latencies.sort()
+    total = sum(statuses.values())
+    errors = total - len(latencies)
+
+    def percentile(q: float):
+        if not latencies:
+            return None
+        return round(latencies[max(0, math.ceil(q * len(latencies)) - 1)] * 1000, 3)
+
+    return {
+        "requests": total,
+        "errors": errors,
+        "error_rate": round(errors / total, 4) if total else 1.0,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": percentile(0.5),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "max_ms": percentile(1.0),
+        "statuses": statuses,
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 3),
     }
 
-    test_obj = get_env_obj(profile, "test")
-    prod_obj = get_env_obj(profile, "prod")
 
+SMOKE_DRIVER = "import json, sys\nprint(json.dumps(smoke_load(**json.loads(sys.argv[1]))))\n"
+
+
+def smoke_remote(settings: dict, host: str, load: dict) -> dict:
+    """Run smoke_load on the host itself, next to the service."""
+    script = inspect.getsource(smoke_load) + "\n\n" + SMOKE_DRIVER
+    proc = subprocess.run(
+        [*ssh_argv(settings, host), f"python3 - {shlex.quote(json.dumps(load))}"],
+        input=script,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode == 127:
+        raise RuntimeError(f"python3 is not available on {host}; use --via tunnel")
+    if proc.returncode != 0:
+        raise RuntimeError(f"smoke load on {host} failed: {proc.stderr.strip()}")
+    return json.loads(proc.stdout)
+
+
+def smoke_tunnel(settings: dict, host: str, load: dict) -> dict:
+    """Run smoke_load locally through an SSH port forward to the service on the host."""
+    parts = urlsplit(load["url"])
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        local_port = sock.getsockname()[1]
+    forward = f"127.0.0.1:{local_port}:{parts.hostname}:{parts.port or (443 if parts.scheme == 'https' else 80)}"
+    # A dedicated connection: a multiplexed client would hand the forward to the control master.
+    argv = [
+        "ssh", "-o", "ControlPath=none", "-o", "ExitOnForwardFailure=yes", "-N", "-L", forward,
+        *settings["ssh_opts"], "-p", settings["port"], f"{settings['user']}@{host}",
+    ]
+    proc = subprocess.Popen(argv, stdin=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
     try:
-        test_cfg = {
-            "REGISTRY_HOST": str(
-                pick_env(
-                    profile,
-                    test_obj,
-                    args.test_registry_host,
-                    ["test_registry_host", "TEST_REGISTRY_HOST", "registry_host", "REGISTRY_HOST"],
-                    common_cfg["REGISTRY_HOST"],
-                )
-            ),
-            "REMOTE_USER": str(
-                pick_env(
-                    profile,
-                    test_obj,
-                    args.test_remote_user,
-                    ["test_remote_user", "TEST_REMOTE_USER", "remote_user", "REMOTE_USER"],
-                    common_cfg["REMOTE_USER"],
-                )
-            ),
-            "REMOTE_HOST": str(
-                pick_env(
-                    profile,
-                    test_obj,
-                    args.test_remote_host,
-                    ["test_remote_host", "TEST_REMOTE_HOST", "remote_host", "REMOTE_HOST"],
-                    common_cfg["REMOTE_HOST"],
-                )
-            ),
-            "REMOTE_PORT": str(
-                normalize_port(
-                    pick_env(
-                        profile,
-                        test_obj,
-                        args.test_remote_port,
-                        ["test_remote_port", "TEST_REMOTE_PORT", "remote_port", "REMOTE_PORT"],
-                        common_cfg["REMOTE_PORT"],
-                    ),
-                    "test_remote_port",
-                )
-            ),
-            "REMOTE_COMPOSE_PATH": str(
-                pick_env(
-                    profile,
-                    test_obj,
-                    args.test_remote_compose_path,
-                    ["test_remote_compose_path", "TEST_REMOTE_COMPOSE_PATH", "remote_compose_path", "REMOTE_COMPOSE_PATH"],
-                    common_cfg["REMOTE_COMPOSE_PATH"],
-                )
-            ),
-            "LOCAL_COMPOSE_FILE": str(test_obj.get("LOCAL_COMPOSE_FILE", "docker-compose.test.yaml")),
-        }
+        deadline = time.monotonic() + 15
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError(f"SSH tunnel to {host} failed: {proc.stderr.read().strip()}")
+            try:
+                socket.create_connection(("127.0.0.1", local_port), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"SSH tunnel to {host} did not open within 15s") from None
+                time.sleep(0.1)
+        return smoke_load(**{**load, "url": parts._replace(netloc=f"127.0.0.1:{local_port}").geturl()})
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def published_port(settings: dict, host: str, app_name: str, app_port: int) -> int | None:
+    """Host port currently bound to app_port; it moves within the range after a rolling deploy."""
+    app = shlex.quote(app_name)
+    command = (
+        f"cd {settings['compose_path']} && {settings['sudo']}env APP_NAME={app} "
+        f"docker compose -f {app}.yaml port {app} {app_port}"
+    )
+    proc = subprocess.run(
+        [*ssh_argv(settings, host), command], capture_output=True, text=True, stdin=subprocess.DEVNULL
+    )
+    port = proc.stdout.strip().rpartition(":")[2]
+    return int(port) if proc.returncode == 0 and port.isdigit() and port != "0" else None
+
+
+def smoke_violations(result: dict, baseline: dict | None, limits: dict) -> list[str]:
+    problems = []
+    if result["error_rate"] > limits["max_error_rate"]:
+        problems.append(f"error rate {result['error_rate']:.2%} > {limits['max_error_rate']:.2%}")
+    if result["p99_ms"] is None:
+        return problems or ["no successful requests"]
+    if limits["max_p99_ms"] is not None and result["p99_ms"] > limits["max_p99_ms"]:
+        problems.append(f"p99 {result['p99_ms']}ms > {limits['max_p99_ms']:g}ms")
+    if not baseline or baseline.get("p99_ms") is None:
+        return problems
+    for key, limit in (("p95_ms", "max_p95_regression"), ("p99_ms", "max_p99_regression")):
+        allowed = baseline[key] * (1 + limits[limit])
+        # Sub-millisecond services jitter by whole percents; ignore regressions below min_delta_ms.
+        if result[key] > allowed and result[key] - baseline[key] > limits["min_delta_ms"]:
+            problems.append(
+                f"{key[:3]} {result[key]}ms > {allowed:.1f}ms (baseline {baseline[key]}ms +{limits[limit]:.0%})"
+            )
+    floor = baseline["rps"] * (1 - limits["max_rps_drop"])
+    if result["rps"] < floor:
+        problems.append(
+            f"throughput {result['rps']} req/s < {floor:.1f} (baseline {baseline['rps']} -{limits['max_rps_drop']:.0%})"
+        )
+    return problems
 
-        prod_cfg = {
-            "REGISTRY_HOST": str(
-                pick_env(
-                    profile,
-                    prod_obj,
-                    args.prod_registry_host,
-                    ["prod_registry_host", "PROD_REGISTRY_HOST", "registry_host", "REGISTRY_HOST"],
-                    "registry.prod.example.com",
-                )
-            ),
-            "REMOTE_USER": str(
-                pick_env(
-                    profile,
-                    prod_obj,
-                    args.prod_remote_user,
-                    ["prod_remote_user", "PROD_REMOTE_USER", "remote_user", "REMOTE_USER"],
-                    "deploy-prod",
-                )
-            ),
-            "REMOTE_HOST": str(
-                pick_env(
-                    profile,
-                    prod_obj,
-                    args.prod_remote_host,
-                    ["prod_remote_host", "PROD_REMOTE_HOST", "remote_host", "REMOTE_HOST"],
-                    "prod.example.com",
-                )
-            ),
-            "REMOTE_PORT": str(
-                normalize_port(
-                    pick_env(
-                        profile,
-                        prod_obj,
-                        args.prod_remote_port,
-                        ["prod_remote_port", "PROD_REMOTE_PORT", "remote_port", "REMOTE_PORT"],
-                        22,
-                    ),
-                    "prod_remote_port",
-                )
-            ),
-            "REMOTE_COMPOSE_PATH": str(
-                pick_env(
-                    profile,
-                    prod_obj,
-                    args.prod_remote_compose_path,
-                    ["prod_remote_compose_path", "PROD_REMOTE_COMPOSE_PATH", "remote_compose_path", "REMOTE_COMPOSE_PATH"],
-                    common_cfg["REMOTE_COMPOSE_PATH"],
-                )
-            ),
-            "LOCAL_COMPOSE_FILE": str(prod_obj.get("LOCAL_COMPOSE_FILE", "docker-compose.yaml")),
-        }
+
+def smoke_bench_main(args) -> int:
+    try:
+        env_name = normalize_env_name(args.smoke_bench)
     except ValueError as err:
         print(f"CONFIG_ERROR: {err}")
         return 1
+    settings = remote_settings(args, env_name)
+    if not settings["hosts"]:
+        print(f"CONFIG_ERROR: no REMOTE_HOSTS configured for {env_name}")
+        return 1
+    host = settings["hosts"][0]
+    url = args.url
+    if not url:
+        app_port = args.app_port or 8080
+        port = published_port(settings, host, args.app_name, app_port) if args.app_name else None
+        url = f"http://127.0.0.1:{port or app_port}{args.url_path}"
+    load = {"url": url, "concurrency": max(1, args.concurrency), "duration": args.duration}
+    report: dict[str, Any] = {"env": env_name, "host": host, "via": args.via, "url": url}
+    try:
+        result = (smoke_tunnel if args.via == "tunnel" else smoke_remote)(settings, host, load)
+    except (OSError, RuntimeError, ValueError) as err:
+        print(json.dumps({"status": "failed", **report, "error": str(err)}, ensure_ascii=True, indent=2))
+        return 1
+    baseline_path = Path(args.root).resolve() / args.state_dir / f"smoke-{env_name}.json"
+    try:
+        baseline = None if args.save_baseline else json.loads(baseline_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        baseline = None
+    limits = {
+        "max_p95_regression": args.max_p95_regression,
+        "max_p99_regression": args.max_p99_regression,
+        "max_rps_drop": args.max_rps_drop,
+        "max_error_rate": args.max_error_rate,
+        "max_p99_ms": args.max_p99_ms,
+        "min_delta_ms": args.min_delta_ms,
+    }
+    violations = smoke_violations(result, baseline, limits)
+    warnings = []
+    if baseline and (baseline.get("concurrency"), baseline.get("url")) != (load["concurrency"], url):
+        warnings.append(
+            f"baseline was recorded with concurrency {baseline.get('concurrency')} against {baseline.get('url')}"
+        )
+    saved = None
+    if not violations and (args.save_baseline or baseline is None):
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        record = {**result, "url": url, "host": host, "recorded": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+        atomic_write(baseline_path, json.dumps(record, indent=2) + "\n")
+        saved = str(baseline_path)
+    status = "failed" if violations else "ok"
+    report.update(
+        result=result, baseline=baseline, limits=limits, violations=violations, warnings=warnings, baseline_saved=saved
+    )
+    print(json.dumps({"status": status, **report}, ensure_ascii=True, indent=2))
+    return 1 if status == "failed" else 0
 
-    custom_envs = collect_custom_envs(args, profile, env_mode)
 
+def context_report_main(args) -> int:
     root = Path(args.root).resolve()
-    if not root.exists():
-        print(f"CONFIG_ERROR: root does not exist: {root}")
+    context = (root / (args.context or ".")).resolve()
+    if not context.is_dir():
+        print(f"CONFIG_ERROR: build context does not exist: {context}")
         return 1
+    report = context_report(context, root / args.dockerfile, top=args.top)
+    print(json.dumps(report, ensure_ascii=True, indent=2))
+    return 0
 
-    results: dict[str, str] = {}
-    results["Makefile"] = upsert_block(
-        root / "Makefile",
-        MAKEFILE_START,
-        MAKEFILE_END,
-        makefile_block(base_cfg, custom_envs),
+
+def append_timeline(path: Path, record: dict) -> None:
+    # One short O_APPEND write per record keeps lines intact across concurrent writers.
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("a", encoding="utf-8") as fh:
+        fh.write(json.dumps(record, ensure_ascii=True) + "\n")
+
+
+def record_step(
+    step: str, host: str, start: float, status: int, nbytes: int | None = None, timeline: str | None = None
+) -> None:
+    """Append a timeline record; without an explicit file only when running under `--timed`."""
+    timeline = timeline or os.environ.get("DEPLOY_TIMELINE")
+    if not timeline:
+        return
+    end = time.time()
+    append_timeline(
+        Path(timeline),
+        {
+            "run": os.environ.get("DEPLOY_RUN_ID", "adhoc"),
+            "step": step,
+            "host": host,
+            "start": round(start, 3),
+            "end": round(end, 3),
+            "duration_s": round(end - start, 3),
+            "status": status,
+            "bytes": nbytes,
+        },
     )
 
-    results["Dockerfile"] = write_file(
-        root / "Dockerfile",
-        dockerfile_template(base_cfg["app_port"]),
-        overwrite=args.force_dockerfile,
+
+def step_bytes(args) -> int | None:
+    if args.bytes_file:
+        try:
+            return os.path.getsize(args.bytes_file)
+        except OSError:
+            return None
+    if args.bytes_image:
+        probe = subprocess.run(
+            ["docker", "image", "inspect", "-f", "{{.Size}}", args.bytes_image], capture_output=True, text=True
+        )
+        return int(probe.stdout.strip()) if probe.returncode == 0 and probe.stdout.strip().isdigit() else None
+    return None
+
+
+UNTIMED_PREFIX = ": notime;"
+
+
+def timed_main(args) -> int:
+    """Run one shell command (make invokes this as SHELL ... -c LINE) and record it on the timeline."""
+    if args.command is None:
+        print("CONFIG_ERROR: --timed needs -c COMMAND")
+        return 2
+    if args.command.startswith(UNTIMED_PREFIX):
+        return subprocess.run(["/bin/sh", "-c", args.command]).returncode
+    timeline = Path(args.timeline).resolve()
+    env = {**os.environ, "DEPLOY_TIMELINE": str(timeline)}
+    start = time.time()
+    status = subprocess.run(["/bin/sh", "-c", args.command], env=env).returncode
+    nbytes = step_bytes(args) if status == 0 else None
+    record_step(args.timed, args.host or "local", start, status, nbytes, str(timeline))
+    return status
+
+
+def load_timeline(path: Path) -> list[dict]:
+    records = []
+    with path.open(encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+
+def deploy_report(records: list[dict], run: str | None = None) -> dict:
+    run = run or records[-1]["run"]
+    rows = [item for item in records if item.get("run") == run]
+    if not rows:
+        raise ValueError(f"no timeline records for run {run}")
+    origin = min(item["start"] for item in rows)
+    # A step runs one record per recipe line; collapse them into one span per (step, host).
+    spans: dict[tuple[str, str], dict] = {}
+    for item in rows:
+        span = spans.setdefault(
+            (item["step"], item["host"]),
+            {
+                "step": item["step"],
+                "host": item["host"],
+                "start": item["start"],
+                "end": item["end"],
+                "busy": 0.0,
+                "status": 0,
+                "bytes": None,
+            },
+        )
+        span["busy"] += item["duration_s"]
+        span["start"] = min(span["start"], item["start"])
+        span["end"] = max(span["end"], item["end"])
+        span["status"] = span["status"] or item["status"]
+        if item.get("bytes") is not None:
+            span["bytes"] = (span["bytes"] or 0) + item["bytes"]
+    steps = sorted(spans.values(), key=lambda span: (span["start"], span["end"]))
+    for span in steps:
+        span["offset_s"] = round(span["start"] - origin, 3)
+        # Busy time excludes the gaps between recipe lines that make and the wrapper add.
+        span["duration_s"] = round(span["busy"], 3)
+    # Walk back from the last span to finish, each time to the latest span that ended before it began.
+    path = [max(steps, key=lambda span: span["end"])]
+    while True:
+        before = [span for span in steps if span["end"] <= path[0]["start"] + 0.01 and span not in path]
+        if not before:
+            break
+        path.insert(0, max(before, key=lambda span: span["end"]))
+    wall = max(span["end"] for span in steps) - origin
+    public = ("step", "host", "offset_s", "duration_s", "status", "bytes")
+    return {
+        "status": "failed" if any(span["status"] for span in steps) else "ok",
+        "run": run,
+        "wall_s": round(wall, 3),
+        "critical_path_s": round(sum(span["duration_s"] for span in path), 3),
+        "critical_path": [{key: span[key] for key in public} for span in path],
+        "slowest": {key: max(steps, key=lambda span: span["duration_s"])[key] for key in public},
+        "steps": [{key: span[key] for key in public} for span in steps],
+    }
+
+
+def deploy_summary(report: dict) -> str:
+    on_path = {(span["step"], span["host"]) for span in report["critical_path"]}
+    lines = [
+        f"Deploy {report['run']}: {report['status']} in {report['wall_s']}s "
+        f"(critical path {report['critical_path_s']}s)"
+    ]
+    for span in report["steps"]:
+        marker = "*" if (span["step"], span["host"]) in on_path else " "
+        status = "ok" if span["status"] == 0 else f"exit {span['status']}"
+        size = f"  {human_size(span['bytes'])}" if span["bytes"] is not None else ""
+        lines.append(
+            f" {marker} {span['step']:<18} {span['host']:<16} +{span['offset_s']:>7.3f}s {span['duration_s']:>8.3f}s  {status}{size}"
+        )
+    return "\n".join(lines)
+
+
+def deploy_report_main(args) -> int:
+    timeline = Path(args.root).resolve() / args.timeline
+    try:
+        report = deploy_report(load_timeline(timeline), args.run)
+    except (OSError, IndexError, ValueError) as err:
+        print(f"CONFIG_ERROR: cannot build deploy report from {timeline}: {err}")
+        return 1
+    if args.summary:
+        print(deploy_summary(report))
+    else:
+        print(json.dumps(report, ensure_ascii=True, indent=2))
+    return 0
+
+
+def digest_main(args) -> int:
+    root = Path(args.root).resolve()
+    context = (root / args.context).resolve() if args.context else None
+    dockerfile = root / args.dockerfile if context is not None else None
+    includes = [root / item for item in args.include or []]
+    for path in [p for p in (context, dockerfile) if p is not None] + includes:
+        if not path.exists():
+            print(f"CONFIG_ERROR: digest input does not exist: {path}", file=sys.stderr)
+            return 1
+    print(inputs_digest(context, dockerfile, includes, args.salt or "", root / args.state_dir))
+    return 0
+
+
+def generation_key(args, profile: dict, root: Path) -> str:
+    payload = {
+        "template": TEMPLATE_VERSION,
+        "root": str(root),
+        # DEPLOY_SCRIPT in the Makefile follows the skill install, so a moved skill must re-render.
+        "script": script_path(root),
+        "args": {key: value for key, value in vars(args).items() if key not in {"batch", "workers"}},
+        "profile": profile,
+        "environ": {
+            name: value
+            for name, value in os.environ.items()
+            if name.startswith(ENVIRON_PREFIX) or any(name.endswith("_" + key) for key in ENV_SCHEMA)
+        },
+        "tips": [(root / name).exists() for name in ("AGENTS.md", "CLAUDE.md")],
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def file_signature(path: Path) -> list[int] | None:
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def generate(args, profile: dict, root: Path) -> dict:
+    """Render and write every deployment file for one app, or report "cached" when neither the
+    resolved inputs nor the previously written outputs changed; raises ValueError on bad config."""
+    key = generation_key(args, profile, root)
+    cache_file = root / STATE_DIR / "generate.json"
+    try:
+        cached = json.loads(cache_file.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        cached = {}
+    files = cached.get("files") or {}
+    if cached.get("key") == key and files and all(file_signature(root / name) == sig for name, sig in files.items()):
+        return {**cached["report"], "results": {name: "cached" for name in files}}
+    report = render_outputs(args, profile, root)
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    atomic_write(
+        cache_file,
+        json.dumps(
+            {
+                "key": key,
+                "report": {name: value for name, value in report.items() if name != "results"},
+                "files": {name: file_signature(root / name) for name in report["results"]},
+            }
+        ),
     )
+    return report
+
 
-    results["docker-compose.local.yaml"] = write_file(
-        root / "docker-compose.local.yaml",
-        compose_template("local", base_cfg["app_name"], base_cfg["app_port"], base_cfg["health_endpoint"]),
-        overwrite=args.force_compose,
+def base_settings(args, profile: dict, root: Path) -> dict:
+    """Resolve the app-wide settings that makefile_block() renders from args and the profile."""
+    env_mode = normalize_env_name(str(pick(profile, args.env_mode, ["env_mode", "ENV_MODE"], "test")))
+    use_sudo = parse_bool(str(pick(profile, args.use_sudo, ["use_sudo", "USE_SUDO"], "true")))
+    deploy_strategy = normalize_strategy(
+        pick(profile, args.deploy_strategy, ["deploy_strategy", "DEPLOY_STRATEGY"], "recreate")
     )
+    runtime = normalize_runtime(pick(profile, args.runtime, ["runtime", "RUNTIME"], "generic"))
+    image_source = str(pick(profile, args.image_source, ["image_source", "IMAGE_SOURCE"], "registry")).lower()
+    if image_source not in IMAGE_SOURCES:
+        raise ValueError(f"image_source must be one of: {', '.join(IMAGE_SOURCES)}")
+    build_cache = normalize_build_cache(pick(profile, args.build_cache, ["build_cache", "BUILD_CACHE"], "none"))
 
+    base_cfg = {
+        "app_name": str(pick(profile, args.app_name, ["app_name", "APP_NAME"], "service-app")),
+        "version": str(pick(profile, args.version, ["version", "VERSION"], "latest")),
+        "env_mode": env_mode,
+        "use_sudo": use_sudo,
+        "monorepo_root": str(pick(profile, args.monorepo_root, ["monorepo_root", "MONOREPO_ROOT"], ".")),
+        "app_port": int(pick(profile, args.app_port, ["app_port", "APP_PORT"], 8080)),
+        "health_endpoint": str(pick(profile, args.health_endpoint, ["health_endpoint", "HEALTH_ENDPOINT"], "/healthz")),
+        "deploy_strategy": deploy_strategy,
+        "health_timeout": int(pick(profile, args.health_timeout, ["health_timeout", "HEALTH_TIMEOUT"], 120)),
+        "runtime": runtime,
+        "image_source": image_source,
+        "platforms": ",".join(
+            split_list(pick(profile, args.platforms, ["platforms", "PLATFORMS"], "linux/amd64"))
+        ),
+        "build_cache": build_cache,
+        "build_cache_ref": str(
+            pick(profile, args.build_cache_ref, ["build_cache_ref", "BUILD_CACHE_REF"], "$(REGISTRY_HOST)/$(APP_NAME):buildcache")
+        ),
+        "build_cache_dir": str(pick(profile, args.build_cache_dir, ["build_cache_dir", "BUILD_CACHE_DIR"], ".buildx-cache")),
+        "fleet_parallel": int(pick(profile, args.fleet_parallel, ["fleet_parallel", "FLEET_PARALLEL"], 2)),
+        "fleet_batch_size": int(pick(profile, args.fleet_batch_size, ["fleet_batch_size", "FLEET_BATCH_SIZE"], 2)),
+        "fleet_canary": int(pick(profile, args.fleet_canary, ["fleet_canary", "FLEET_CANARY"], 1)),
+    }
+    base_cfg["smoke"] = smoke_settings(profile, base_cfg["health_endpoint"])
+    base_cfg["artifacts"] = artifact_specs(profile.get("artifacts"))
+    base_cfg["deploy_script"] = script_path(root)
+    return base_cfg
+
+
+def plan_outputs(args, profile: dict, root: Path) -> dict:
+    """Resolve the profile and render every output in memory; nothing under root is written."""
+    base_cfg = base_settings(args, profile, root)
+    custom_envs = collect_custom_envs(args, profile, base_cfg["env_mode"])
+    profile_index = index_profile(profile)
+    common = resolve_env("", args, profile_index, {})
+    common_cfg = common["values"]
     env_configs: dict[str, dict[str, str]] = {
-        "test": test_cfg,
-        "prod": prod_cfg,
+        env_name: resolve_env(env_name, args, profile_index, get_env_obj(profile, env_name), common)["values"]
+        for env_name in ["test", "prod", *custom_envs]
     }
+    tunings = {name: compose_settings(profile, name) for name in ["local", "test", "prod", *custom_envs]}
 
-    for env_name in custom_envs:
-        env_obj = get_env_obj(profile, env_name)
-        try:
-            env_cfg = {
-                "REGISTRY_HOST": str(env_obj.get("REGISTRY_HOST", env_obj.get("registry_host", common_cfg["REGISTRY_HOST"]))),
-                "REMOTE_USER": str(env_obj.get("REMOTE_USER", env_obj.get("remote_user", common_cfg["REMOTE_USER"]))),
-                "REMOTE_HOST": str(env_obj.get("REMOTE_HOST", env_obj.get("remote_host", common_cfg["REMOTE_HOST"]))),
-                "REMOTE_PORT": str(
-                    normalize_port(
-                        env_obj.get("REMOTE_PORT", env_obj.get("remote_port", common_cfg["REMOTE_PORT"])),
-                        f"{env_name}.REMOTE_PORT",
-                    )
-                ),
-                "REMOTE_COMPOSE_PATH": str(
-                    env_obj.get("REMOTE_COMPOSE_PATH", env_obj.get("remote_compose_path", common_cfg["REMOTE_COMPOSE_PATH"]))
-                ),
-                "LOCAL_COMPOSE_FILE": str(
-                    env_obj.get("LOCAL_COMPOSE_FILE", env_obj.get("compose_file", f"docker-compose.{env_name}.yaml"))
-                ),
-            }
-        except ValueError as err:
-            print(f"CONFIG_ERROR: {err}")
-            return 1
-        env_configs[env_name] = env_cfg
+    def planned(content: str, overwrite: bool = False, block: tuple[str, str] | None = None) -> dict:
+        return {"content": content, "overwrite": overwrite, "block": block}
+
+    outputs: dict[str, dict] = {}
+    outputs["Makefile"] = planned(
+        makefile_block(base_cfg, custom_envs), block=(MAKEFILE_START, MAKEFILE_END)
+    )
+
+    _, app_dir = context_layout(root, base_cfg["monorepo_root"])
+    outputs["Dockerfile"] = planned(
+        dockerfile_template(base_cfg["app_port"], base_cfg["runtime"], app_dir), args.force_dockerfile
+    )
+
+    outputs[dockerignore_name(app_dir)] = planned(
+        dockerignore_template(
+            app_dir,
+            [str(item) for item in profile.get("dockerignore", []) if str(item).strip()],
+            [str(item) for item in profile.get("context_include", []) if str(item).strip()],
+        ),
+        args.force_dockerignore,
+    )
+
+    outputs["docker-compose.local.yaml"] = planned(
+        compose_template(
+            "local", base_cfg["app_name"], base_cfg["app_port"], base_cfg["health_endpoint"], tuning=tunings["local"]
+        ),
+        args.force_compose,
+    )
 
     # Ensure default compose files are present.
-    results["docker-compose.test.yaml"] = write_file(
-        root / "docker-compose.test.yaml",
-        compose_template("test", base_cfg["app_name"], base_cfg["app_port"], base_cfg["health_endpoint"]),
-        overwrite=args.force_compose,
+    outputs["docker-compose.test.yaml"] = planned(
+        compose_template(
+            "test",
+            base_cfg["app_name"],
+            base_cfg["app_port"],
+            base_cfg["health_endpoint"],
+            base_cfg["deploy_strategy"],
+            tunings["test"],
+        ),
+        args.force_compose,
     )
-    results["docker-compose.yaml"] = write_file(
-        root / "docker-compose.yaml",
-        compose_template("prod", base_cfg["app_name"], base_cfg["app_port"], base_cfg["health_endpoint"]),
-        overwrite=args.force_compose,
+    outputs["docker-compose.yaml"] = planned(
+        compose_template(
+            "prod",
+            base_cfg["app_name"],
+            base_cfg["app_port"],
+            base_cfg["health_endpoint"],
+            base_cfg["deploy_strategy"],
+            tunings["prod"],
+        ),
+        args.force_compose,
     )
 
     for env_name, env_cfg in env_configs.items():
         compose_name = env_cfg["LOCAL_COMPOSE_FILE"]
-        compose_path = root / compose_name
         if env_name in {"test", "prod"} and compose_name in {"docker-compose.test.yaml", "docker-compose.yaml"}:
             continue
-        results[compose_name] = write_file(
-            compose_path,
-            compose_template(env_name, base_cfg["app_name"], base_cfg["app_port"], base_cfg["health_endpoint"]),
-            overwrite=args.force_compose,
+        outputs[compose_name] = planned(
+            compose_template(
+                env_name,
+                base_cfg["app_name"],
+                base_cfg["app_port"],
+                base_cfg["health_endpoint"],
+                base_cfg["deploy_strategy"],
+                tunings[env_name],
+            ),
+            args.force_compose,
         )
 
-    results[".deploy.env.common"] = write_file(
-        root / ".deploy.env.common",
-        common_env_template(common_cfg),
-        overwrite=args.force_env_files,
-    )
+    outputs[".deploy.env.common"] = planned(common_env_template(common_cfg), args.force_env_files)
 
     for env_name, env_cfg in env_configs.items():
-        env_file_name = f".deploy.env.{env_name}"
-        results[env_file_name] = write_file(
-            root / env_file_name,
-            env_override_template(env_name, common_cfg, env_cfg),
-            overwrite=args.force_env_files,
+        outputs[f".deploy.env.{env_name}"] = planned(
+            env_override_template(env_name, common_cfg, env_cfg), args.force_env_files
         )
 
     tips = deployment_tips_block()
-    agents = root / "AGENTS.md"
-    claude = root / "CLAUDE.md"
-    if agents.exists():
-        results["AGENTS.md"] = upsert_block(agents, DEPLOYMENT_TIPS_START, DEPLOYMENT_TIPS_END, tips)
-    if claude.exists():
-        results["CLAUDE.md"] = upsert_block(claude, DEPLOYMENT_TIPS_START, DEPLOYMENT_TIPS_END, tips)
-
-    print(
-        json.dumps(
-            {
-                "status": "ok",
-                "root": str(root),
-                "custom_envs": custom_envs,
-                "common_file": ".deploy.env.common",
-                "results": results,
-            },
-            ensure_ascii=True,
-            indent=2,
-        )
+    for name in ("AGENTS.md", "CLAUDE.md"):
+        if (root / name).exists():
+            outputs[name] = planned(tips, block=(DEPLOYMENT_TIPS_START, DEPLOYMENT_TIPS_END))
+
+    warnings = publish_warnings(base_cfg["app_port"], base_cfg["deploy_strategy"], tunings)
+    return {"custom_envs": custom_envs, "outputs": outputs, "warnings": warnings}
+
+
+def render_outputs(args, profile: dict, root: Path) -> dict:
+    plan = plan_outputs(args, profile, root)
+    return {
+        "status": "ok",
+        "root": str(root),
+        "custom_envs": plan["custom_envs"],
+        "common_file": ".deploy.env.common",
+        "warnings": plan["warnings"],
+        "results": apply_outputs(root, plan["outputs"])["results"],
+    }
+
+
+def render(profile: dict, root: str | Path = ".", write: bool = False, diff: bool = False, **options) -> dict:
+    """Library entry point: render one app from a profile dict without argparse or a subprocess.
+
+    options are the CLI flags by dest name (app_port=8080, force_compose=True, custom_env=[...]).
+    Returns every rendered output under "files" (the Makefile/AGENTS.md entries hold only the
+    managed block), the per-file results ("would be" results unless write=True) and, with
+    diff=True, unified diffs against root. Safe to call concurrently; raises ValueError on
+    bad config. Process environment variables still override the profile, as on the CLI.
+    """
+    unknown = sorted(set(options) - set(GENERATE_DEFAULTS))
+    if unknown:
+        raise ValueError(f"unknown option(s): {', '.join(unknown)}")
+    args = argparse.Namespace(**{**GENERATE_DEFAULTS, **options})
+    root = Path(root).resolve()
+    if write and not root.is_dir():
+        raise ValueError(f"root does not exist: {root}")
+    plan = plan_outputs(args, profile, root)
+    applied = apply_outputs(root, plan["outputs"], write=write, diff=diff)
+    report = {
+        "status": "ok",
+        "root": str(root),
+        "written": write,
+        "custom_envs": plan["custom_envs"],
+        "common_file": ".deploy.env.common",
+        "warnings": plan["warnings"],
+        "makefile_block": plan["outputs"]["Makefile"]["content"],
+        "files": {name: output["content"] for name, output in plan["outputs"].items()},
+        "results": applied["results"],
+    }
+    if diff:
+        report["diffs"] = applied["diffs"]
+    return report
+
+
+def merge_profiles(base: dict, override: dict) -> dict:
+    merged = dict(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_profiles(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def batch_services(source: Path, root: Path, shared: dict) -> list[tuple[Path, dict]]:
+    """Expand a manifest file or a directory of profiles into (service root, merged profile) pairs."""
+    if source.is_dir():
+        defaults_file = source / "defaults.json"
+        defaults = merge_profiles(shared, load_profile(str(defaults_file)) if defaults_file.exists() else {})
+        services = []
+        for path in sorted(source.glob("*.json")):
+            if path == defaults_file:
+                continue
+            profile = load_profile(str(path))
+            services.append((root / str(profile.pop("root", path.stem)), merge_profiles(defaults, profile)))
+        return services
+    manifest = load_profile(str(source))
+    defaults = manifest.get("defaults") or {}
+    if isinstance(defaults, str):
+        defaults = load_profile(str(source.parent / defaults))
+    defaults = merge_profiles(shared, defaults)
+    services = []
+    for index, item in enumerate(manifest.get("services") or []):
+        if not isinstance(item, dict) or not item.get("root"):
+            raise ValueError(f"services[{index}] needs a root")
+        item = dict(item)
+        service_root = root / str(item.pop("root"))
+        profile = defaults
+        if item.get("profile"):
+            profile = merge_profiles(profile, load_profile(str(source.parent / str(item.pop("profile")))))
+        services.append((service_root, merge_profiles(profile, item)))
+    return services
+
+
+def generate_service(args, service_root: Path, profile: dict) -> dict:
+    if not service_root.is_dir():
+        return {"root": str(service_root), "status": "error", "error": "root does not exist"}
+    try:
+        return generate(args, profile, service_root)
+    except (ValueError, OSError) as err:
+        return {"root": str(service_root), "status": "error", "error": str(err)}
+
+
+def batch_main(args) -> int:
+    started = time.monotonic()
+    root = Path(args.root).resolve()
+    source = Path(args.batch)
+    try:
+        services = batch_services(source if source.is_absolute() else root / source, root, load_profile(args.from_json))
+    except (FileNotFoundError, json.JSONDecodeError, ValueError) as err:
+        print(f"CONFIG_ERROR: {err}")
+        return 1
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        results = list(pool.map(lambda service: generate_service(args, *service), services))
+    failed = [item for item in results if item["status"] != "ok"]
+    report = {
+        "status": "failed" if failed else "ok",
+        "services": len(results),
+        "failed": len(failed),
+        "elapsed_ms": round((time.monotonic() - started) * 1000, 1),
+        "results": results,
+    }
+    print(json.dumps(report, ensure_ascii=True, indent=2))
+    return 1 if failed else 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Create deployment configuration with shared common file + environment override files."
+    )
+    parser.add_argument("--root", default=".", help="Project root.")
+    parser.add_argument("--from-json", help="Optional profile JSON.")
+    parser.add_argument("--app-name")
+    parser.add_argument("--version")
+    parser.add_argument("--env-mode")
+    parser.add_argument("--use-sudo")
+    parser.add_argument("--monorepo-root")
+    parser.add_argument("--registry-host")
+    parser.add_argument("--remote-user")
+    parser.add_argument("--remote-host")
+    parser.add_argument("--remote-port")
+    parser.add_argument("--remote-compose-path")
+    parser.add_argument("--test-registry-host")
+    parser.add_argument("--test-remote-user")
+    parser.add_argument("--test-remote-host")
+    parser.add_argument("--test-remote-port")
+    parser.add_argument("--test-remote-compose-path")
+    parser.add_argument("--prod-registry-host")
+    parser.add_argument("--prod-remote-user")
+    parser.add_argument("--prod-remote-host")
+    parser.add_argument("--prod-remote-port")
+    parser.add_argument("--prod-remote-compose-path")
+    parser.add_argument("--ssh-multiplex", help="Reuse one SSH control connection per host (true/false).")
+    parser.add_argument("--ssh-control-persist", help="How long an idle SSH control connection stays open.")
+    parser.add_argument("--image-keep", help="Images of the app kept per host by the retention policy.")
+    parser.add_argument("--image-max-disk", help="Disk budget for those images, e.g. 10G (empty = none).")
+    parser.add_argument("--custom-env", action="append", help="Custom environment name (repeatable).")
+    parser.add_argument("--app-port", type=int)
+    parser.add_argument("--health-endpoint")
+    parser.add_argument("--deploy-strategy", choices=DEPLOY_STRATEGIES)
+    parser.add_argument("--health-timeout", type=int, help="Seconds a rolling deploy waits for health checks.")
+    parser.add_argument("--force-compose", action="store_true", help="Overwrite compose files.")
+    parser.add_argument("--force-env-files", action="store_true", help="Overwrite .deploy.env* files.")
+    parser.add_argument("--force-dockerfile", action="store_true", help="Overwrite Dockerfile.")
+    parser.add_argument("--force-dockerignore", action="store_true", help="Overwrite the generated .dockerignore.")
+    parser.add_argument("--runtime", choices=RUNTIMES, help="Dockerfile preset (multi-stage for non-generic).")
+    parser.add_argument("--image-source", choices=IMAGE_SOURCES, help="registry (push/pull) or load (SSH stream).")
+    parser.add_argument("--platforms", help="Comma separated target platforms, e.g. linux/amd64,linux/arm64.")
+    parser.add_argument("--build-cache", choices=BUILD_CACHE_TYPES, help="Build cache backend for build/build-arm.")
+    parser.add_argument("--build-cache-ref", help="Registry reference used for the registry build cache.")
+    parser.add_argument("--build-cache-dir", help="Directory used for local build cache.")
+    parser.add_argument("--fleet-parallel", type=int, help="Default number of hosts deployed concurrently.")
+    parser.add_argument("--fleet-batch-size", type=int, help="Default number of hosts per deploy wave.")
+    parser.add_argument("--fleet-canary", type=int, help="Default number of canary hosts deployed first.")
+    fleet = parser.add_argument_group("fleet run (executes a Makefile target on every host of an environment)")
+    fleet.add_argument("--fleet", metavar="ENV", help="Run --target on every host in REMOTE_HOSTS of ENV.")
+    fleet.add_argument("--hosts", help="Space or comma separated hosts (default: REMOTE_HOSTS from .deploy.env.*).")
+    fleet.add_argument("--target", default="remote-up", help="Per-host Makefile target.")
+    fleet.add_argument("--parallel", type=int, default=2, help="Maximum concurrent hosts.")
+    fleet.add_argument("--batch-size", type=int, default=2, help="Hosts per wave after the canary.")
+    fleet.add_argument("--canary", type=int, default=1, help="Hosts deployed alone before the first wave.")
+    remote = parser.add_argument_group("remote connection (runtime modes; defaults come from .deploy.env.*)")
+    remote.add_argument("--ssh-opts", help="Extra ssh options, e.g. the Makefile's $(SSH_MUX_OPTS).")
+    load = parser.add_argument_group("registry-less image transfer")
+    load.add_argument("--remote-load", metavar="ENV", help="Stream --image to every host of ENV over SSH.")
+    load.add_argument("--image", help="Local image to transfer.")
+    load.add_argument("--remote-image", help="Tag applied on the remote host after loading.")
+    load.add_argument("--compression", choices=["auto", *LOAD_COMPRESSORS], default="auto")
+    preflight = parser.add_argument_group("remote preflight (docker, disk, memory, networks, ports)")
+    preflight.add_argument("--preflight", metavar="ENV", help="Probe every host of ENV concurrently and print JSON.")
+    preflight.add_argument("--compose-file", help="Compose file whose ports, networks and memory are checked.")
+    stats = parser.add_argument_group("runtime stats (docker stats, restarts and health sampled on every host)")
+    stats.add_argument("--stats", metavar="ENV", help="Sample the app containers on every host of ENV concurrently.")
+    stats.add_argument("--window", type=float, default=30, help="Seconds to sample for.")
+    stats.add_argument("--interval", type=int, default=5, help="Seconds between samples.")
+    stats.add_argument("--saturation", type=float, default=0.9, help="Usage/limit ratio flagged as saturated.")
+    stats.add_argument("--format", choices=["json", "prometheus"], default="json", help="Output format.")
+    stats.add_argument("--prom-file", help="Also write the Prometheus text format here (textfile collector).")
+    logs = parser.add_argument_group("multi-host logs (merged by timestamp, filtered on the remote side)")
+    logs.add_argument("--logs", metavar="ENV", help="Tail compose logs from every host of ENV.")
+    logs.add_argument("--grep", help="Extended regex; only matching lines leave the host.")
+    logs.add_argument("--level", choices=list(LOG_LEVELS), help="Only lines with this level or a more severe one.")
+    logs.add_argument("--since", help="Passed to docker compose logs --since (e.g. 10m, 2024-01-01T00:00:00).")
+    logs.add_argument("--tail", type=int, default=200, help="Lines per container before following.")
+    logs.add_argument("--follow", action="store_true", help="Keep streaming new lines.")
+    logs.add_argument("--json", action="store_true", help="Print JSON lines (host, container, ts, message).")
+    sync = parser.add_argument_group("artifact sync (checksum delta into the remote compose path)")
+    sync.add_argument("--sync", metavar="ENV", help="Sync --artifact files to every host of ENV.")
+    sync.add_argument("--artifact", action="append", help="src[:dest], dest relative to the compose path (repeatable).")
+    sync.add_argument("--sync-method", choices=SYNC_METHODS, default="auto", help="rsync (block delta) or tar (files).")
+    smoke = parser.add_argument_group("post-deploy smoke benchmark (latency/throughput vs the ENV baseline)")
+    smoke.add_argument("--smoke-bench", metavar="ENV", help="Load-test the first host of ENV against its baseline.")
+    smoke.add_argument("--via", choices=SMOKE_VIAS, default="remote", help="Load from the host or an SSH tunnel.")
+    smoke.add_argument("--url", help="Target URL as seen from the load (default: 127.0.0.1, the host port published for --app-port, --url-path).")
+    smoke.add_argument("--url-path", default="/healthz", help="Request path when --url is not given.")
+    smoke.add_argument("--concurrency", type=int, default=SMOKE_DEFAULTS["concurrency"], help="Concurrent clients.")
+    smoke.add_argument("--duration", type=float, default=SMOKE_DEFAULTS["duration"], help="Seconds of load.")
+    smoke.add_argument("--max-p95-regression", type=float, default=SMOKE_DEFAULTS["max_p95_regression"])
+    smoke.add_argument("--max-p99-regression", type=float, default=SMOKE_DEFAULTS["max_p99_regression"])
+    smoke.add_argument("--max-rps-drop", type=float, default=SMOKE_DEFAULTS["max_rps_drop"])
+    smoke.add_argument("--max-error-rate", type=float, default=SMOKE_DEFAULTS["max_error_rate"])
+    smoke.add_argument("--max-p99-ms", type=float, help="Absolute p99 ceiling, checked even without a baseline.")
+    smoke.add_argument(
+        "--min-delta-ms", type=float, default=SMOKE_DEFAULTS["min_delta_ms"], help="Ignore smaller latency regressions."
     )
+    smoke.add_argument("--save-baseline", action="store_true", help="Record this run as the ENV baseline.")
+    report = parser.add_argument_group("build context report")
+    report.add_argument("--context-report", action="store_true", help="Print build context size and largest dirs.")
+    report.add_argument("--context", help="Build context directory, relative to --root.")
+    report.add_argument("--dockerfile", default="Dockerfile", help="Dockerfile path, relative to --root.")
+    report.add_argument("--top", type=int, default=15, help="Number of largest directories to list.")
+    timing = parser.add_argument_group("deploy timing (timeline records and critical-path report)")
+    timing.add_argument("--timed", metavar="STEP", help="Run -c COMMAND via /bin/sh and append a timeline record.")
+    timing.add_argument("-c", dest="command", help="Shell command for --timed (make passes it via .SHELLFLAGS).")
+    timing.add_argument("--host", help="Host recorded for the step (default: local).")
+    timing.add_argument("--timeline", default=f"{STATE_DIR}/timeline.jsonl", help="JSON-lines timeline file.")
+    timing.add_argument("--bytes-file", help="Record this file's size as the step's bytes.")
+    timing.add_argument("--bytes-image", help="Record this local image's size as the step's bytes.")
+    timing.add_argument("--deploy-report", action="store_true", help="Print step spans and the critical path of a run.")
+    timing.add_argument("--run", help="Run id for --deploy-report (default: the latest run).")
+    timing.add_argument("--summary", action="store_true", help="Print --deploy-report as a short text table.")
+    batch = parser.add_argument_group("batch generation (many services in one run)")
+    batch.add_argument("--batch", metavar="PATH", help="Manifest JSON or directory of profiles, relative to --root.")
+    batch.add_argument("--workers", type=int, default=1, help="Services generated concurrently.")
+    digest = parser.add_argument_group("input digest (skip-if-unchanged stamps)")
+    digest.add_argument("--digest", action="store_true", help="Print sha256 of --context, --dockerfile and --include.")
+    digest.add_argument("--include", action="append", help="Extra file hashed into the digest (repeatable).")
+    digest.add_argument("--salt", help="Extra string hashed into the digest, e.g. image ref or platforms.")
+    digest.add_argument("--state-dir", default=STATE_DIR, help="Directory for the file hash cache.")
+    return parser
+
+
+GENERATE_DEFAULTS = vars(build_parser().parse_args([]))
+
+
+def main() -> int:
+    args = build_parser().parse_args()
+
+    if args.timed:
+        return timed_main(args)
+    if args.deploy_report:
+        return deploy_report_main(args)
+    if args.batch:
+        return batch_main(args)
+    if args.fleet:
+        return fleet_main(args)
+    if args.context_report:
+        return context_report_main(args)
+    if args.digest:
+        return digest_main(args)
+    if args.remote_load:
+        return remote_load_main(args)
+    if args.preflight:
+        return preflight_main(args)
+    if args.logs:
+        return logs_main(args)
+    if args.stats:
+        return stats_main(args)
+    if args.smoke_bench:
+        return smoke_bench_main(args)
+    if args.sync:
+        return sync_main(args)
+
+    try:
+        profile = load_profile(args.from_json)
+    except (FileNotFoundError, json.JSONDecodeError) as err:
+        print(f"CONFIG_ERROR: {err}")
+        return 1
+
+    root = Path(args.root).resolve()
+    if not root.exists():
+        print(f"CONFIG_ERROR: root does not exist: {root}")
+        return 1
+    try:
+        report = generate(args, profile, root)
+    except ValueError as err:
+        print(f"CONFIG_ERROR: {err}")
+        return 1
+    print(json.dumps(report, ensure_ascii=True, indent=2))
     return 0
 
 
@@ -0,0 +1,30 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "skills" / "deployment" / "scripts"))
+
+import config  # noqa: E402
+
+PROFILE = {"app_name": "demo", "registry_host": "reg.io", "remote_user": "deploy", "remote_host": "h1"}
+
+
+@pytest.fixture(autouse=True)
+def clean_environ(monkeypatch):
+    # DEPLOY_<KEY> and <ENV>_<KEY> process variables override the profile; keep the runner's out of the tests.
+    for name in list(os.environ):
+        if name.startswith(config.ENVIRON_PREFIX) or any(name.endswith("_" + key) for key in config.ENV_SCHEMA):
+            monkeypatch.delenv(name)
+
+
+@pytest.fixture
+def project(tmp_path):
+    """Write the generated files for PROFILE (plus overrides) into tmp_path and return it."""
+
+    def write(profile: dict | None = None, **options) -> Path:
+        config.render({**PROFILE, **(profile or {})}, tmp_path, write=True, **options)
+        return tmp_path
+
+    return write
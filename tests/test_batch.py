@@ -0,0 +1,96 @@
+import argparse
+import json
+
+import pytest
+
+import config
+
+from conftest import PROFILE
+
+
+def write_json(path, data) -> None:
+    path.write_text(json.dumps(data))
+
+
+def test_merge_profiles_is_deep_and_leaves_inputs_alone():
+    base = {"app_port": 8080, "compose": {"limits": {"cpus": "1.0", "memory": "512M"}, "replicas": 2}}
+    merged = config.merge_profiles(base, {"compose": {"limits": {"memory": "1G"}}, "app_port": 9000})
+    assert merged == {"app_port": 9000, "compose": {"limits": {"cpus": "1.0", "memory": "1G"}, "replicas": 2}}
+    assert base["compose"]["limits"]["memory"] == "512M"
+
+
+def test_manifest_merges_shared_defaults_profile_and_item(tmp_path):
+    write_json(tmp_path / "defaults.json", {"registry_host": "reg.io", "app_port": 8000})
+    write_json(tmp_path / "api.json", {"app_port": 8100, "runtime": "python"})
+    write_json(
+        tmp_path / "services.json",
+        {
+            "defaults": "defaults.json",
+            "services": [
+                {"root": "svc/api", "app_name": "api", "profile": "api.json"},
+                {"root": "svc/web", "app_name": "web", "runtime": "node"},
+            ],
+        },
+    )
+    services = config.batch_services(tmp_path / "services.json", tmp_path, {"remote_host": "h1", "app_port": 7000})
+    assert services == [
+        (
+            tmp_path / "svc/api",
+            {"remote_host": "h1", "app_port": 8100, "registry_host": "reg.io", "runtime": "python", "app_name": "api"},
+        ),
+        (tmp_path / "svc/web", {"remote_host": "h1", "app_port": 8000, "registry_host": "reg.io", "app_name": "web", "runtime": "node"}),
+    ]
+
+
+@pytest.mark.parametrize("item", [{"app_name": "api"}, "svc/api", {"root": ""}])
+def test_manifest_services_need_a_root(tmp_path, item):
+    write_json(tmp_path / "services.json", {"defaults": {"app_port": 8000}, "services": [{"root": "ok"}, item]})
+    with pytest.raises(ValueError, match=r"services\[1\] needs a root"):
+        config.batch_services(tmp_path / "services.json", tmp_path, {})
+
+
+def test_profile_directory_uses_defaults_file_and_stem_or_root(tmp_path):
+    profiles = tmp_path / "profiles"
+    profiles.mkdir()
+    write_json(profiles / "defaults.json", {"app_port": 8000})
+    write_json(profiles / "api.json", {"app_name": "api"})
+    write_json(profiles / "web.json", {"app_name": "web", "root": "apps/frontend"})
+    services = config.batch_services(profiles, tmp_path, {"remote_host": "h1"})
+    assert services == [
+        (tmp_path / "api", {"remote_host": "h1", "app_port": 8000, "app_name": "api"}),
+        (tmp_path / "apps/frontend", {"remote_host": "h1", "app_port": 8000, "app_name": "web"}),
+    ]
+
+
+def test_batch_main_generates_every_service_and_reports_failures(tmp_path, capsys):
+    (tmp_path / "svc" / "api").mkdir(parents=True)
+    (tmp_path / "svc" / "web").mkdir(parents=True)
+    write_json(tmp_path / "shared.json", PROFILE)
+    write_json(
+        tmp_path / "services.json",
+        {
+            "services": [
+                {"root": "svc/api", "app_name": "api"},
+                {"root": "svc/web", "app_name": "web", "deploy_strategy": "blue-green"},
+                {"root": "svc/missing", "app_name": "gone"},
+            ]
+        },
+    )
+    args = argparse.Namespace(
+        **{
+            **config.GENERATE_DEFAULTS,
+            "root": str(tmp_path),
+            "batch": "services.json",
+            "from_json": str(tmp_path / "shared.json"),
+            "workers": 2,
+        }
+    )
+    assert config.batch_main(args) == 1
+    report = json.loads(capsys.readouterr().out)
+    assert (report["status"], report["services"], report["failed"]) == ("failed", 3, 2)
+    api, web, missing = report["results"]
+    assert api["status"] == "ok"
+    assert "APP_NAME ?= api" in (tmp_path / "svc" / "api" / "Makefile").read_text()
+    assert web["status"] == "error"
+    assert "deploy_strategy" in web["error"]
+    assert missing == {"root": str(tmp_path / "svc" / "missing"), "status": "error", "error": "root does not exist"}
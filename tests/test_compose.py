@@ -0,0 +1,83 @@
+import pytest
+
+import config
+
+from conftest import PROFILE
+
+
+def compose(profile: dict, name: str = "docker-compose.yaml") -> str:
+    return config.render({**PROFILE, **profile}, "/nonexistent")["files"][name]
+
+
+def test_recreate_publishes_app_port():
+    text = compose({"app_port": 9000})
+    assert '- "9000:9000"' in text
+    assert "container_name: ${APP_NAME}-prod" in text
+
+
+def test_rolling_needs_an_explicit_publish_mode():
+    # The serving host port would alternate between releases, so it must be chosen, not defaulted.
+    with pytest.raises(ValueError, match='compose.publish must be set for deploy_strategy=rolling.*"none".*"range"'):
+        compose({"app_port": 9000, "deploy_strategy": "rolling"})
+
+
+def test_rolling_behind_a_proxy_exposes_the_port():
+    report = config.render(
+        {**PROFILE, "app_port": 9000, "deploy_strategy": "rolling", "compose": {"publish": "none"}}, "/nonexistent"
+    )
+    text = report["files"]["docker-compose.yaml"]
+    assert 'expose:\n      - "9000"' in text
+    assert "container_name" not in text
+    assert not any("alternates" in warning for warning in report["warnings"])
+
+
+def test_rolling_port_range_is_opt_in():
+    report = config.render(
+        {**PROFILE, "app_port": 9000, "deploy_strategy": "rolling", "compose": {"publish": "range"}}, "/nonexistent"
+    )
+    text = report["files"]["docker-compose.yaml"]
+    assert '- "9000-9001:9000"' in text
+    assert "container_name" not in text
+    assert "expose" not in text
+    assert any("9000-9001" in warning and "alternates" in warning for warning in report["warnings"])
+    # local never rolls
+    assert '- "9000:9000"' in report["files"]["docker-compose.local.yaml"]
+
+
+def test_unpublished_ports_are_opt_in_and_warned():
+    report = config.render({**PROFILE, "environments": {"prod": {"compose": {"publish": "none"}}}}, "/nonexistent")
+    assert 'expose:\n      - "8080"' in report["files"]["docker-compose.yaml"]
+    assert "ports:" not in report["files"]["docker-compose.yaml"]
+    assert [warning for warning in report["warnings"] if "not published" in warning][0].startswith("prod:")
+
+
+def test_publish_mode_is_validated():
+    with pytest.raises(ValueError, match="compose.publish"):
+        compose({"compose": {"publish": "sometimes"}})
+
+
+def test_preflight_reads_published_port_ranges(tmp_path):
+    path = tmp_path / "compose.yaml"
+    path.write_text(compose({"app_port": 9000, "deploy_strategy": "rolling", "compose": {"publish": "range"}}))
+    assert config.compose_requirements(path)["ports"] == [9000, 9001]
+
+
+def test_replicas_publish_one_port_per_replica():
+    report = config.render({**PROFILE, "app_port": 9000, "compose": {"replicas": 3}}, "/nonexistent")
+    text = report["files"]["docker-compose.yaml"]
+    assert text.startswith(
+        "services:\n"
+        "  demo:\n"
+        "    image: ${FULL_REGISTRY_IMAGE}\n"
+        "    restart: unless-stopped\n"
+        "    ports:\n"
+        '      - "9000-9002:9000"\n'
+    )
+    assert "    deploy:\n      replicas: 3\n" in text
+    assert any(warning.startswith("prod: up to 3 containers") for warning in report["warnings"])
+    assert not any("alternates" in warning for warning in report["warnings"])
+
+
+def test_rolling_replicas_double_the_port_range():
+    text = compose({"app_port": 9000, "deploy_strategy": "rolling", "compose": {"replicas": 2, "publish": "range"}})
+    assert '- "9000-9003:9000"' in text
@@ -0,0 +1,136 @@
+import argparse
+
+import pytest
+
+import config
+
+from conftest import PROFILE
+
+
+def resolve(profile: dict, env_name: str = "prod", **options) -> dict[str, str]:
+    args = argparse.Namespace(**{**config.GENERATE_DEFAULTS, **options})
+    index = config.index_profile(profile)
+    common = config.resolve_env("", args, index, {})
+    return config.resolve_env(env_name, args, index, config.get_env_obj(profile, env_name), common)["values"]
+
+
+def test_index_profile_maps_prefixes_aliases_and_groups():
+    index = config.index_profile(
+        {
+            "remote_port": 2200,
+            "PROD_REMOTE_PORT": 2201,
+            "staging_eu_remote_user": "eu",
+            "compose_file": "dc.yaml",
+            "retention": {"keep": 5, "max_disk": "10G", "unknown": 1},
+            "remote_host": "",
+            "app_name": "demo",
+        }
+    )
+    assert index == {
+        ("", "REMOTE_PORT"): 2200,
+        ("prod", "REMOTE_PORT"): 2201,
+        ("staging_eu", "REMOTE_USER"): "eu",
+        ("", "LOCAL_COMPOSE_FILE"): "dc.yaml",
+        ("", "IMAGE_KEEP"): 5,
+        ("", "IMAGE_MAX_DISK"): "10G",
+    }
+    # Hyphenated environment names are indexed with underscores and must resolve the same way.
+    assert resolve({**PROFILE, "staging_eu_remote_user": "eu"}, "staging-eu")["REMOTE_USER"] == "eu"
+
+
+TIERS = [
+    ("cli", 2001),
+    ("environ", 2002),
+    ("environments", 2003),
+    ("profile", 2004),
+    ("common", 2005),
+]
+
+
+@pytest.mark.parametrize("top", range(len(TIERS) + 1))
+def test_resolve_env_precedence(monkeypatch, top):
+    # Set REMOTE_PORT on every tier from `top` down; the highest one left must win.
+    tiers = dict(TIERS[top:])
+    profile = {**PROFILE}
+    options = {}
+    if "cli" in tiers:
+        options["prod_remote_port"] = tiers["cli"]
+    if "environ" in tiers:
+        monkeypatch.setenv("PROD_REMOTE_PORT", str(tiers["environ"]))
+    if "environments" in tiers:
+        profile["environments"] = {"prod": {"remote_port": tiers["environments"]}}
+    if "profile" in tiers:
+        profile["prod_remote_port"] = tiers["profile"]
+    if "common" in tiers:
+        profile["remote_port"] = tiers["common"]
+    expected = TIERS[top][1] if top < len(TIERS) else 22
+    assert resolve(profile, **options)["REMOTE_PORT"] == str(expected)
+
+
+@pytest.mark.parametrize(
+    "name, read, where, line",
+    [
+        ("DEPLOY_APP_NAME", True, "Makefile", "APP_NAME ?= {}"),
+        ("APP_NAME", False, "Makefile", "APP_NAME ?= {}"),
+        ("DEPLOY_VERSION", True, "Makefile", "VERSION ?= {}"),
+        ("VERSION", False, "Makefile", "VERSION ?= {}"),
+        ("DEPLOY_STRATEGY", True, "Makefile", "DEPLOY_STRATEGY ?= {}"),
+        ("DEPLOY_REGISTRY_HOST", True, ".deploy.env.common", "REGISTRY_HOST={}"),
+        ("REGISTRY_HOST", False, ".deploy.env.common", "REGISTRY_HOST={}"),
+        ("PROD_REMOTE_USER", True, ".deploy.env.prod", "REMOTE_USER={}"),
+        ("STAGING_EU_REMOTE_USER", True, ".deploy.env.staging-eu", "REMOTE_USER={}"),
+    ],
+)
+def test_environ_tier_reads_only_prefixed_names(monkeypatch, name, read, where, line):
+    value = "rolling" if name == "DEPLOY_STRATEGY" else "from-env"
+    monkeypatch.setenv(name, value)
+    profile = {**PROFILE, "custom_envs": ["staging-eu"], "compose": {"publish": "none"}}
+    text = config.render(profile, "/nonexistent")["files"][where]
+    assert (line.format(value) in text.splitlines()) is read
+
+
+def test_prod_inherits_common_except_compose_file():
+    values = resolve({**PROFILE, "compose_file": "dc.yaml", "retention": {"keep": 5}})
+    assert values["REMOTE_HOST"] == "h1"
+    assert values["REMOTE_USER"] == "deploy"
+    assert values["IMAGE_KEEP"] == "5"
+    assert values["LOCAL_COMPOSE_FILE"] == "docker-compose.yaml"
+    # Without a common value prod falls back to its own defaults.
+    defaults = resolve({"app_name": "demo"})
+    assert defaults["REMOTE_HOST"] == "prod.example.com"
+    assert defaults["REGISTRY_HOST"] == "registry.prod.example.com"
+
+
+def test_remote_hosts_list_and_single_host_override():
+    assert resolve({**PROFILE, "remote_hosts": "a, b"})["REMOTE_HOSTS"] == "a b"
+    values = resolve({**PROFILE, "remote_hosts": ["a", "b"]}, prod_remote_host="c")
+    assert (values["REMOTE_HOST"], values["REMOTE_HOSTS"]) == ("c", "c")
+
+
+def test_env_files_hold_only_overrides():
+    report = config.render(
+        {**PROFILE, "retention": {"keep": 5, "max_disk": "10G"}, "environments": {"prod": {"remote_user": "ops"}}},
+        "/nonexistent",
+    )
+    common = report["files"][".deploy.env.common"]
+    assert "IMAGE_KEEP=5\n" in common
+    assert "IMAGE_MAX_DISK=10G\n" in common
+    prod = report["files"][".deploy.env.prod"]
+    assert "REMOTE_USER=ops\n" in prod
+    assert "REMOTE_HOST" not in prod
+    assert "IMAGE_KEEP" not in prod
+
+
+@pytest.mark.parametrize(
+    "retention, message",
+    [
+        ({"keep": "many"}, "retention.keep must be an integer"),
+        ({"keep": 0}, "retention.keep must be at least 1"),
+        ({"max_disk": "lots"}, "retention.max_disk must be a size"),
+    ],
+)
+def test_retention_is_validated(retention, message):
+    with pytest.raises(ValueError, match=message):
+        config.render({**PROFILE, "retention": retention}, "/nonexistent")
+    with pytest.raises(ValueError, match=f"prod.{message}"):
+        config.render({**PROFILE, "environments": {"prod": {"retention": retention}}}, "/nonexistent")
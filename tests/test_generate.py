@@ -0,0 +1,86 @@
+import argparse
+import os
+
+import pytest
+
+import config
+
+from conftest import PROFILE
+
+
+def generate(root, profile: dict | None = None, **options) -> dict:
+    args = argparse.Namespace(**{**config.GENERATE_DEFAULTS, "root": str(root), **options})
+    return config.generate(args, {**PROFILE, **(profile or {})}, root)
+
+
+def statuses(report: dict) -> set[str]:
+    return set(report["results"].values())
+
+
+def test_unchanged_inputs_are_served_from_the_cache(tmp_path):
+    first = generate(tmp_path)
+    assert statuses(first) == {"created"}
+    second = generate(tmp_path)
+    assert statuses(second) == {"cached"}
+    assert second["results"].keys() == first["results"].keys()
+    assert second["custom_envs"] == first["custom_envs"]
+
+
+@pytest.mark.parametrize("change", ["profile", "args", "environ", "tips"])
+def test_changed_inputs_render_again(tmp_path, monkeypatch, change):
+    generate(tmp_path)
+    if change == "profile":
+        report = generate(tmp_path, {"app_port": 9000})
+    elif change == "args":
+        report = generate(tmp_path, force_compose=True)
+    elif change == "environ":
+        monkeypatch.setenv("PROD_REMOTE_HOST", "h9")
+        report = generate(tmp_path)
+    else:
+        (tmp_path / "AGENTS.md").write_text("# Agents\n")
+        report = generate(tmp_path)
+    assert "cached" not in statuses(report)
+
+
+def test_edited_output_renders_again(tmp_path):
+    generate(tmp_path)
+    makefile = tmp_path / "Makefile"
+    makefile.write_text(makefile.read_text() + "\nlocal-target:\n\t@true\n")
+    # The managed block is still current, so the Makefile is checked again but left as edited.
+    report = generate(tmp_path)
+    assert report["results"]["Makefile"] == "unchanged"
+    assert "cached" not in statuses(report)
+    assert "local-target:" in makefile.read_text()
+
+
+def test_moved_skill_rewrites_deploy_script(tmp_path, monkeypatch):
+    generate(tmp_path)
+    monkeypatch.setattr(config, "__file__", "/opt/skills/deployment/scripts/config.py")
+    report = generate(tmp_path)
+    assert report["results"]["Makefile"] == "updated"
+    assert "DEPLOY_SCRIPT ?= /opt/skills/deployment/scripts/config.py\n" in (tmp_path / "Makefile").read_text()
+
+
+def test_atomic_write_replaces_and_keeps_mode(tmp_path):
+    path = tmp_path / "deploy.sh"
+    path.write_text("old\n")
+    os.chmod(path, 0o755)
+    config.atomic_write(path, "new\n")
+    assert path.read_text() == "new\n"
+    assert path.stat().st_mode & 0o777 == 0o755
+    assert [item.name for item in tmp_path.iterdir()] == ["deploy.sh"]
+
+
+@pytest.mark.parametrize(
+    "current, expected",
+    [
+        (None, "block\n"),
+        ("", "block\n"),
+        ("top", "top\nblock\n"),
+        ("top\n<s>\nold\n<e>\nbottom\n", "top\n<s>\nnew\n<e>\nbottom\n"),
+        ("top\n<s>\nno end\n", "top\n<s>\nno end\n<s>\nnew\n<e>\n"),
+    ],
+)
+def test_merge_block(current, expected):
+    block = "<s>\nnew\n<e>" if current and "<s>" in current else "block"
+    assert config.merge_block(current, "<s>", "<e>", block + "\n\n") == expected
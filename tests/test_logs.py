@@ -0,0 +1,104 @@
+import argparse
+import json
+import queue
+import threading
+
+import pytest
+
+import config
+
+SETTINGS = {"ssh_opts": [], "port": "22", "user": "deploy", "sudo": "", "compose_path": "~/apps"}
+
+
+@pytest.mark.parametrize(
+    "line, expected",
+    [
+        (
+            "demo-prod-1  | 2024-05-01T10:00:00.123456789Z GET /healthz 200",
+            {"container": "demo-prod-1", "ts": "2024-05-01T10:00:00.123456789Z", "message": "GET /healthz 200"},
+        ),
+        ("demo-1 | 2024-05-01T10:00:00Z", {"container": "demo-1", "ts": "2024-05-01T10:00:00Z", "message": ""}),
+        ("Attaching to demo-1", {"container": "", "ts": "", "message": "Attaching to demo-1"}),
+    ],
+)
+def test_parse_log_line(line, expected):
+    assert config.parse_log_line("h1", line) == {"host": "h1", **expected}
+
+
+def test_log_sort_key_orders_trimmed_fractions():
+    stamps = ["2024-05-01T10:00:00.5Z", "2024-05-01T10:00:00Z", "2024-05-01T10:00:00.123Z", "2024-05-01T10:00:01Z"]
+    assert sorted(stamps, key=config.log_sort_key) == [
+        "2024-05-01T10:00:00Z",
+        "2024-05-01T10:00:00.123Z",
+        "2024-05-01T10:00:00.5Z",
+        "2024-05-01T10:00:01Z",
+    ]
+
+
+@pytest.mark.parametrize(
+    "options, present, absent",
+    [
+        ({}, ["--tail 200", "2>&1"], ["--follow", "--since", "grep"]),
+        ({"follow": True, "since": "10m", "tail": -5}, ["--follow", "--since 10m", "--tail 0"], ["grep"]),
+        ({"level": "error"}, ["grep --line-buffered -i -w -E 'ERROR|ERR|FATAL|CRITICAL|CRIT|PANIC'"], ["WARN"]),
+        ({"grep": "timeout|refused"}, ["| grep --line-buffered -E 'timeout|refused'"], ["-i -w"]),
+    ],
+)
+def test_log_command_filters_on_the_host(options, present, absent):
+    args = argparse.Namespace(**{"tail": 200, "since": None, "follow": False, "level": None, "grep": None, **options})
+    command = config.log_command(SETTINGS, "demo", args)
+    assert command.startswith("cd ~/apps && env APP_NAME=demo docker compose -f demo.yaml logs --no-color --timestamps")
+    for part in present:
+        assert part in command
+    for part in absent:
+        assert part not in command
+
+
+def fake_hosts(monkeypatch, scripts: dict[str, str]) -> None:
+    # Each "host" runs its script locally; the remote command becomes an ignored positional argument.
+    monkeypatch.setattr(config, "ssh_argv", lambda settings, host: ["sh", "-c", scripts[host], host])
+
+
+def test_chatty_stderr_does_not_stall_the_follower(monkeypatch):
+    # 300 KB of stderr before the first stdout line is far more than a pipe buffer holds.
+    noisy = "head -c 300000 /dev/zero | tr '\\0' x >&2; echo >&2; echo 'ssh: lost connection' >&2"
+    fake_hosts(monkeypatch, {"h1": f"{noisy}; echo 'demo-1 | 2024-05-01T10:00:00Z up'; exit 255"})
+    lines: queue.Queue = queue.Queue()
+    follower = threading.Thread(target=config.follow_host_logs, args=(SETTINGS, "h1", "logs", lines, []), daemon=True)
+    follower.start()
+    follower.join(10)
+    assert not follower.is_alive()
+    received = [lines.get_nowait() for _ in range(lines.qsize())]
+    assert received[0] == ("h1", "demo-1 | 2024-05-01T10:00:00Z up", None)
+    host, line, error = received[-1]
+    assert (host, line) == ("h1", None)
+    assert error.startswith("exit 255: ")
+    assert error.endswith("; ssh: lost connection")
+
+
+def test_logs_main_merges_hosts_by_timestamp(tmp_path, monkeypatch, capsys):
+    fake_hosts(
+        monkeypatch,
+        {
+            "h1": "printf 'demo-1 | 2024-05-01T10:00:00.2Z b\\ndemo-1 | 2024-05-01T10:00:01Z d\\n'",
+            "h2": "printf 'demo-1 | 2024-05-01T10:00:00.1Z a\\ndemo-1 | 2024-05-01T10:00:00.9Z c\\n'; exit 1",
+            "h3": "echo 'permission denied' >&2; exit 2",
+        },
+    )
+    args = argparse.Namespace(
+        **{
+            **config.GENERATE_DEFAULTS,
+            "root": str(tmp_path),
+            "logs": "prod",
+            "hosts": "h1 h2 h3",
+            "app_name": "demo",
+            "ssh_opts": "",
+            "json": True,
+        }
+    )
+    assert config.logs_main(args) == 1
+    out, err = capsys.readouterr()
+    entries = [json.loads(line) for line in out.splitlines()]
+    assert [(entry["host"], entry["message"]) for entry in entries] == [("h2", "a"), ("h1", "b"), ("h2", "c"), ("h1", "d")]
+    # grep's "no match" exit status 1 is not a failure; the other host's stderr is reported.
+    assert err == "[logs] h3: exit 2: permission denied\n"
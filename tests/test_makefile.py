@@ -0,0 +1,125 @@
+import shutil
+import subprocess
+
+import pytest
+
+pytestmark = pytest.mark.skipif(shutil.which("make") is None, reason="make is not installed")
+
+
+def make(root, *args) -> str:
+    proc = subprocess.run(["make", "-s", "-C", str(root), *args], capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stderr
+    return proc.stdout
+
+
+def remote_pull(root, remote) -> str:
+    # Run the remote-pull recipe locally: SSH becomes sh -c, docker pull is only echoed.
+    return make(
+        root,
+        "-o", "push", "-o", "check-config", "-o", "ssh-open",
+        "remote-pull",
+        "SSH=sh -c",
+        f"REMOTE_COMPOSE_PATH={remote}",
+        "SUDO_CMD=echo",
+        "RELEASE_DIGEST=abc",
+        "DEPLOY_TIMING=false",
+    )
+
+
+@pytest.mark.parametrize("marker", [None, ".demo.release", ".demo.staged"])
+def test_remote_pull_skips_current_or_staged_release(project, tmp_path, marker):
+    root = project()
+    remote = tmp_path / "remote"
+    remote.mkdir()
+    if marker:
+        (remote / marker).write_text("abc\n")
+    output = remote_pull(root, remote)
+    if marker:
+        assert "pull skipped" in output
+    else:
+        assert output.strip() == "docker pull reg.io/demo:latest"
+
+
+def test_remote_pull_runs_for_a_different_release(project, tmp_path):
+    root = project()
+    remote = tmp_path / "remote"
+    remote.mkdir()
+    (remote / ".demo.release").write_text("old\n")
+    (remote / ".demo.staged").write_text("old\n")
+    assert "docker pull" in remote_pull(root, remote)
+
+
+def test_missing_script_fails_with_a_clear_message(project):
+    root = project()
+    proc = subprocess.run(
+        ["make", "-s", "-C", str(root), "fleet-logs", "DEPLOY_SCRIPT=/missing/config.py"], capture_output=True, text=True
+    )
+    assert proc.returncode != 0
+    assert "Deployment script not found: /missing/config.py" in proc.stdout
+
+
+def test_push_compose_file_without_script_uploads_compose(project, tmp_path):
+    root = project()
+    remote = tmp_path / "remote"
+    make(
+        root,
+        "-o", "check-config", "-o", "ssh-open",
+        "push-compose-file",
+        "DEPLOY_SCRIPT=/missing/config.py",
+        "SSH=sh -c",
+        f"REMOTE_COMPOSE_PATH={remote}",
+    )
+    assert (remote / "demo.yaml").read_text() == (root / "docker-compose.test.yaml").read_text()
+
+
+def test_timed_steps_fall_back_to_sh_without_script(project):
+    root = project()
+    output = make(root, "local-clean", "DEPLOY_SCRIPT=/missing/config.py", "DEPLOY_TIMING=true", "PATH=/usr/bin:/bin")
+    assert "can't open file" not in output
+    assert not (root / ".deploy-state" / "timeline.jsonl").exists()
+
+
+def test_inline_cache_reads_the_published_image(project):
+    root = project()
+    output = make(root, "-n", "build", "BUILD_CACHE=inline", "VERSION=v2", "SKIP_UNCHANGED=false", "DEPLOY_TIMING=false")
+    assert "--cache-from type=registry,ref=reg.io/demo:v2" in output
+    assert "--cache-from type=registry,ref=reg.io/demo:latest" in output
+    assert ":buildcache" not in output
+
+
+@pytest.mark.parametrize("target", ["build", "build-arm"])
+@pytest.mark.parametrize(
+    "cache, flags",
+    [
+        ("inline", ["--cache-from type=registry,ref=reg.io/demo:v2", "--cache-to type=inline"]),
+        ("registry", ["--cache-from type=registry,ref=reg.io/demo:buildcache", "--load"]),
+        ("local", ["--cache-from type=local,src=.buildx-cache", "mv .buildx-cache-new .buildx-cache"]),
+        ("none", []),
+    ],
+)
+def test_build_targets_share_cache_flags(project, target, cache, flags):
+    output = make(
+        project(), "-n", target, f"BUILD_CACHE={cache}", "VERSION=v2", "SKIP_UNCHANGED=false", "DEPLOY_TIMING=false"
+    )
+    for flag in flags:
+        assert flag in output
+    assert ("--cache-" in output) is bool(flags)
+    if cache != "registry":
+        assert ":buildcache" not in output
+
+
+def test_deploy_uploads_compose_only_after_push(project):
+    output = make(project(), "-n", "remote-deploy", "SKIP_UNCHANGED=false")
+    assert output.index("docker push reg.io/demo:latest") < output.index("--sync test")
+
+
+@pytest.mark.parametrize("features, parallel", [(None, True), ("", False)])
+def test_parallel_deploy_needs_output_sync(project, features, parallel):
+    # make 3.81 (macOS) has no output-sync in .FEATURES; the deploy must fall back to serial and untimed.
+    args = ["-n", "-p", "remote-deploy", "SKIP_UNCHANGED=false"]
+    if features is not None:
+        args.append(f".FEATURES={features}")
+    output = make(project(), *args)
+    makeflags = next(line for line in output.splitlines() if line.startswith("MAKEFLAGS = "))
+    assert ("-Oline" in makeflags) is parallel
+    assert ("push: SHELL = $(PYTHON) $(DEPLOY_SCRIPT) --timed" in output) is parallel
@@ -0,0 +1,125 @@
+import subprocess
+
+import pytest
+
+import config
+
+MIB = 1024 * 1024
+NEEDS = {"ports": [9000], "networks": ["edge"], "memory": {"limits": 512 * MIB, "reservations": 128 * MIB}}
+HEALTHY = {
+    "docker": "27.1.1 /var/lib/docker",
+    "disk_free_kb": str(10 * 1024 * 1024),
+    "mem_total_kb": str(4 * 1024 * 1024),
+    "mem_available_kb": str(2 * 1024 * 1024),
+    "network=edge": "ok",
+    "port=9000": "free",
+}
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [("512M", 512 * MIB), ("1.5g", 1536 * MIB), ("64 KiB", 64 * 1024), ("100", 100), ("lots", None), ("5X", None)],
+)
+def test_memory_bytes(value, expected):
+    assert config.memory_bytes(value) == expected
+
+
+def test_compose_requirements(tmp_path):
+    path = tmp_path / "docker-compose.yaml"
+    path.write_text(
+        "services:\n"
+        "  app:\n"
+        "    ports:\n"
+        '      - "127.0.0.1:9000-9001:9000"\n'
+        '      - "9100:9100"\n'
+        '      - "9200"\n'
+        "    deploy:\n"
+        "      replicas: 2\n"
+        "      resources:\n"
+        "        limits:\n"
+        "          memory: 512M\n"
+        "        reservations:\n"
+        "          memory: 128M\n"
+        "  worker:\n"
+        "    deploy:\n"
+        "      resources:\n"
+        "        limits:\n"
+        "          memory: 1G\n"
+        "networks:\n"
+        "  edge:\n"
+        "    external: true\n"
+        "    name: shared-edge\n"
+        "  internal:\n"
+        "    external: false\n"
+    )
+    mib = 1024 * 1024
+    assert config.compose_requirements(path) == {
+        "ports": [9000, 9001, 9100],
+        "networks": ["shared-edge"],
+        "memory": {"limits": 2 * 512 * mib + 1024 * mib, "reservations": 2 * 128 * mib},
+    }
+
+
+@pytest.mark.parametrize(
+    "facts, image_size, check, status",
+    [
+        ({}, None, "docker", "ok"),
+        ({"docker": ""}, None, "docker", "fail"),
+        ({}, 5 * 1024**3, "disk", "ok"),
+        ({}, 6 * 1024**3, "disk", "warn"),
+        ({}, 11 * 1024**3, "disk", "fail"),
+        ({"disk_free_kb": ""}, None, "disk", "warn"),
+        ({"mem_available_kb": str(256 * 1024)}, None, "memory", "warn"),
+        ({"mem_total_kb": str(64 * 1024)}, None, "memory", "fail"),
+        ({"mem_total_kb": ""}, None, "memory", "warn"),
+        ({"network=edge": "missing"}, None, "network:edge", "fail"),
+        ({"port=9000": "busy other-app-1"}, None, "port:9000", "fail"),
+        ({"port=9000": "busy"}, None, "port:9000", "fail"),
+        ({"port=9000": "busy demo-prod demo-2"}, None, "port:9000", "ok"),
+    ],
+)
+def test_preflight_checks(facts, image_size, check, status):
+    checks = config.preflight_checks({**HEALTHY, **facts}, NEEDS, image_size, "demo")
+    assert checks[check]["status"] == status
+    assert all(item["status"] == "ok" for name, item in checks.items() if name != check)
+
+
+def probe(monkeypatch, returncode: int, stdout: str = "", stderr: str = "") -> list[str]:
+    scripts = []
+
+    def run(argv, **kwargs):
+        scripts.append(argv[-1])
+        return subprocess.CompletedProcess(argv, returncode, stdout, stderr)
+
+    monkeypatch.setattr(config.subprocess, "run", run)
+    return scripts
+
+
+SETTINGS = {"ssh_opts": [], "port": "22", "user": "deploy", "sudo": "sudo "}
+
+
+def test_preflight_host_parses_the_probe(monkeypatch):
+    scripts = probe(
+        monkeypatch,
+        0,
+        "docker=27.1.1 /var/lib/docker\ndisk_free_kb=1048576\nmem_total_kb=4194304\nmem_available_kb=2097152\n"
+        "network=edge missing\nport=9000 busy demo-prod \n",
+    )
+    result = config.preflight_host(SETTINGS, "h1", NEEDS, None, "demo")
+    assert result["status"] == "failed"
+    assert {name: check["status"] for name, check in result["checks"].items()} == {
+        "docker": "ok",
+        "disk": "ok",
+        "memory": "ok",
+        "network:edge": "fail",
+        "port:9000": "ok",
+    }
+    assert result["checks"]["port:9000"]["containers"] == ["demo-prod"]
+    assert "for net in edge;" in scripts[0] and "for port in 9000;" in scripts[0]
+    assert "sudo docker info" in scripts[0]
+
+
+def test_unreachable_host(monkeypatch):
+    probe(monkeypatch, 255, stderr="ssh: connect to host h1 port 22: Connection refused\n")
+    result = config.preflight_host(SETTINGS, "h1", NEEDS, None, "demo")
+    assert (result["status"], result["error"]) == ("unreachable", "ssh: connect to host h1 port 22: Connection refused")
@@ -0,0 +1,126 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import tarfile
+
+import pytest
+
+import config
+
+# ssh runs the remote command locally; docker answers the layer query from $REMOTE_LAYERS and
+# `docker load` keeps the received archive in $LOADED.
+SSH = '#!/bin/sh\nfor a; do last=$a; done\nexec sh -c "$last"\n'
+DOCKER = """#!/bin/sh
+case "$*" in
+  "image ls"*) echo sha256:img ;;
+  "image inspect"*) cat "$REMOTE_LAYERS" ;;
+  load) cat > "$LOADED" ;;
+  tag*) echo "$@" >> "$LOADED.tags" ;;
+esac
+"""
+SETTINGS = {"ssh_opts": [], "port": "22", "user": "deploy", "sudo": ""}
+
+
+def chain(*diff_ids: str) -> str:
+    return "sha256:" + hashlib.sha256(" ".join(diff_ids).encode()).hexdigest()
+
+
+def test_layer_chain_ids():
+    assert config.layer_chain_ids([]) == []
+    assert config.layer_chain_ids(["sha256:a", "sha256:b", "sha256:c"]) == [
+        "sha256:a",
+        chain("sha256:a", "sha256:b"),
+        chain(chain("sha256:a", "sha256:b"), "sha256:c"),
+    ]
+
+
+def add(tar: tarfile.TarFile, name: str, data: bytes) -> None:
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    tar.addfile(info, io.BytesIO(data))
+
+
+@pytest.fixture
+def archive(tmp_path):
+    path = tmp_path / "image.tar"
+    with tarfile.open(path, "w") as tar:
+        add(tar, "manifest.json", json.dumps([{"Config": "cfg.json", "Layers": ["l1/layer.tar", "l2/layer.tar"]}]).encode())
+        add(tar, "cfg.json", json.dumps({"rootfs": {"diff_ids": ["sha256:a", "sha256:b"]}}).encode())
+        add(tar, "l1/layer.tar", b"base" * 1000)
+        add(tar, "l2/layer.tar", b"app" * 1000)
+    return path
+
+
+@pytest.fixture
+def remote(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    for name, script in (("ssh", SSH), ("docker", DOCKER)):
+        (bin_dir / name).write_text(script)
+        (bin_dir / name).chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}:{os.environ['PATH']}")
+    monkeypatch.setenv("REMOTE_LAYERS", str(tmp_path / "layers.json"))
+    monkeypatch.setenv("LOADED", str(tmp_path / "loaded.tar"))
+    return tmp_path
+
+
+def test_saved_image_layers(archive):
+    assert config.saved_image_layers(archive) == [("l1/layer.tar", "sha256:a"), ("l2/layer.tar", chain("sha256:a", "sha256:b"))]
+
+
+@pytest.mark.parametrize(
+    "remote_layers, sent",
+    [
+        ("", ["l1/layer.tar", "l2/layer.tar"]),
+        ('["sha256:a"]\n', ["l2/layer.tar"]),
+        ('["sha256:a","sha256:b"]\n', []),
+    ],
+)
+@pytest.mark.parametrize("compression", ["none", "gzip"])
+def test_load_sends_only_layers_missing_on_the_host(archive, remote, remote_layers, sent, compression):
+    (remote / "layers.json").write_text(remote_layers)
+    layers = config.saved_image_layers(archive)
+    result = config.load_image_on_host(SETTINGS, "h1", archive, layers, "demo:v1", "reg.io/demo:v1", compression)
+    assert result["status"] == "ok", result.get("error")
+    assert result["layers_sent"] == len(sent)
+    assert result["compression"] == compression
+    with tarfile.open(remote / "loaded.tar") as loaded:
+        names = loaded.getnames()
+    assert [name for name in names if name.endswith("layer.tar")] == sent
+    assert {"manifest.json", "cfg.json"} <= set(names)
+    assert (remote / "loaded.tar.tags").read_text() == "tag demo:v1 reg.io/demo:v1\n"
+    if compression == "gzip":
+        assert result["wire_bytes"] < result["raw_bytes"]
+
+
+def test_failed_stream_reaps_ssh_and_compressor(tmp_path, remote, monkeypatch):
+    (remote / "layers.json").write_text("")
+    broken = tmp_path / "broken.tar"
+    broken.write_bytes(b"not a tar archive")
+    started = []
+    popen = subprocess.Popen
+
+    def tracking_popen(*args, **kwargs):
+        started.append(popen(*args, **kwargs))
+        return started[-1]
+
+    monkeypatch.setattr(config.subprocess, "Popen", tracking_popen)
+    result = config.load_image_on_host(SETTINGS, "h1", broken, [], "demo:v1", "", "gzip")
+    assert result["status"] == "failed"
+    # The layer query, then the ssh stream and gzip left behind by the unreadable archive.
+    assert len(started) == 3
+    assert all(proc.returncode is not None for proc in started)
+    assert all(proc.stdin.closed and proc.stdout.closed for proc in started[1:])
+
+
+@pytest.mark.skipif(shutil.which("zstd") is None, reason="zstd is not installed")
+def test_auto_compression_prefers_zstd_when_both_sides_have_it(archive, remote):
+    # The layer query reports zstd because the fake host shares this PATH.
+    (remote / "layers.json").write_text("")
+    result = config.load_image_on_host(
+        SETTINGS, "h1", archive, config.saved_image_layers(archive), "demo:v1", "", "auto"
+    )
+    assert result["compression"] == "zstd"
@@ -0,0 +1,96 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+pytestmark = pytest.mark.skipif(shutil.which("make") is None, reason="make is not installed")
+
+MIB = 1024 * 1024
+# Stand-in for the docker CLI calls the retention pipeline makes, answered from $FAKE_DOCKER.
+DOCKER = f"""#!{sys.executable}
+import json, os, sys
+
+state = json.load(open(os.environ["FAKE_DOCKER"]))
+images = {{image["id"]: image for image in state["images"]}}
+args = sys.argv[1:]
+if args[0] == "ps":
+    print("\\n".join(f"c{{i}}" for i in range(len(state["containers"]))))
+elif args[0] == "inspect":
+    print("\\n".join(state["containers"][int(name[1:])] for name in args[3:]))
+elif args[:2] == ["image", "ls"]:
+    repo = "<none>" if "--filter" in args else args[-1]
+    print("\\n".join(i for i, image in images.items() if image["repo"] == repo))
+elif args[:2] == ["image", "inspect"] and args[3] == "{{{{.Id}}}}":
+    if not state["current"]:
+        sys.exit(1)
+    print(state["current"])
+elif args[:2] == ["image", "inspect"]:
+    print("\\n".join(f"{{i}} {{images[i]['size']}} {{images[i]['created']}}" for i in args[4:]))
+elif args[0] == "rmi":
+    with open(os.environ["FAKE_DOCKER"] + ".removed", "a") as fh:
+        fh.write("\\n".join(args[2:]) + "\\n")
+"""
+
+
+def image(number: int, repo: str = "reg.io/demo", size: int = 100 * MIB) -> dict:
+    # Higher numbers are newer.
+    return {"id": f"sha256:{number}", "repo": repo, "size": size, "created": f"2024-05-{number:02d}T00:00:00Z"}
+
+
+@pytest.fixture
+def docker(tmp_path):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "docker").write_text(DOCKER)
+    (bin_dir / "docker").chmod(0o755)
+    state = tmp_path / "docker.json"
+
+    def gc(root, target: str, images: list[dict], containers=(), current="", marker=None, **variables) -> list[str]:
+        state.write_text(json.dumps({"images": images, "containers": list(containers), "current": current}))
+        remote = tmp_path / "remote"
+        remote.mkdir(exist_ok=True)
+        if marker:
+            (remote / ".demo.images").write_text("\n".join(marker) + "\n")
+        proc = subprocess.run(
+            [
+                "make", "-s", "-C", str(root), "-o", "check-config", "-o", "ssh-open", target,
+                "SSH=sh -c", "SUDO_CMD=", f"REMOTE_COMPOSE_PATH={remote}", "DEPLOY_TIMING=false",
+                *(f"{name}={value}" for name, value in variables.items()),
+            ],
+            capture_output=True,
+            text=True,
+            env={**os.environ, "PATH": f"{bin_dir}:{os.environ['PATH']}", "FAKE_DOCKER": str(state)},
+        )
+        assert proc.returncode == 0, proc.stderr
+        removed = state.with_name("docker.json.removed")
+        return sorted(removed.read_text().split()) if removed.exists() else []
+
+    return gc
+
+
+@pytest.mark.parametrize(
+    "variables, containers, current, removed",
+    [
+        ({"IMAGE_KEEP": 2}, [], "", ["sha256:1", "sha256:2"]),
+        ({"IMAGE_KEEP": 4}, [], "", []),
+        # Images in use and the current release survive but still count towards IMAGE_KEEP.
+        ({"IMAGE_KEEP": 2}, ["sha256:1"], "", ["sha256:2"]),
+        ({"IMAGE_KEEP": 1}, [], "sha256:2", ["sha256:1", "sha256:3"]),
+        # 100M images against a 250M budget: the two newest fit.
+        ({"IMAGE_KEEP": 10, "IMAGE_MAX_DISK": "250M"}, [], "", ["sha256:1", "sha256:2"]),
+        ({"IMAGE_KEEP": 10, "IMAGE_MAX_DISK": "1G"}, [], "", []),
+    ],
+)
+def test_local_gc_selects_old_images(project, docker, variables, containers, current, removed):
+    images = [image(1), image(2), image(3, repo="demo"), image(4)]
+    assert docker(project(), "local-gc", images, containers, current, **variables) == removed
+
+
+def test_remote_gc_keeps_the_previous_release_and_prunes_dangling(project, docker):
+    images = [image(0, repo="<none>"), image(1), image(2), image(3), image(4), image(5, repo="other/app")]
+    removed = docker(project(), "remote-clean", images, marker=["sha256:1"], IMAGE_KEEP=2)
+    # sha256:1 is the previous release recorded in .demo.images; other repositories are left alone.
+    assert removed == ["sha256:0", "sha256:2"]
@@ -0,0 +1,142 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+pytestmark = pytest.mark.skipif(shutil.which("make") is None, reason="make is not installed")
+
+# Answers the image queries of the release/rollback scripts: the current id of a tag comes from
+# $DOCKER_CURRENT, an image id exists when listed in $DOCKER_IMAGES; every call is logged.
+DOCKER = """#!/bin/sh
+echo "$* ${FULL_REGISTRY_IMAGE:+image=$FULL_REGISTRY_IMAGE}" >> "$DOCKER_LOG"
+case "$*" in
+  "image inspect -f {{.Id}} "*) cat "$DOCKER_CURRENT" ;;
+  "image inspect "*) grep -qx "$3" "$DOCKER_IMAGES" ;;
+esac
+"""
+HISTORY = [
+    "sha256:c reg.io/demo:v3 300-3 2024-05-03T00:00:00Z",
+    "sha256:b reg.io/demo:v2 200-2 2024-05-02T00:00:00Z",
+    "sha256:a reg.io/demo:v1 100-1 2024-05-01T00:00:00Z",
+]
+
+
+@pytest.fixture
+def host(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "docker").write_text(DOCKER)
+    (bin_dir / "docker").chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}:{os.environ['PATH']}")
+    for name in ("log", "current", "images"):
+        monkeypatch.setenv(f"DOCKER_{name.upper()}", str(tmp_path / f"docker.{name}"))
+        (tmp_path / f"docker.{name}").write_text("")
+    remote = tmp_path / "remote"
+    (remote / ".demo.history").mkdir(parents=True)
+    return remote
+
+
+def make(root, remote, target: str, **variables) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [
+            "make", "-s", "-C", str(root), "-o", "check-config", "-o", "ssh-open", "-o", "push-compose-file", target,
+            "SSH=sh -c", "SUDO_CMD=", f"REMOTE_COMPOSE_PATH={remote}", "DEPLOY_TIMING=false",
+            "SKIP_UNCHANGED=false", "IMAGE_RETENTION=false",
+            *(f"{name}={value}" for name, value in variables.items()),
+        ],
+        capture_output=True,
+        text=True,
+    )
+
+
+def deploy(root, remote, image_id: str, version: str, compose: str, **variables) -> None:
+    (remote / "demo.yaml").write_text(compose)
+    (remote.parent / "docker.current").write_text(image_id + "\n")
+    proc = make(root, remote, "remote-up", VERSION=version, **variables)
+    assert proc.returncode == 0, proc.stderr
+
+
+def history(remote) -> list[tuple[str, str]]:
+    return [tuple(line.split()[:2]) for line in (remote / ".demo.images").read_text().splitlines()]
+
+
+def test_release_records_newest_first_and_prunes_snapshots(project, host):
+    root = project()
+    deploy(root, host, "sha256:a", "v1", "services: {v: 1}\n", IMAGE_KEEP=2)
+    deploy(root, host, "sha256:b", "v2", "services: {v: 2}\n", IMAGE_KEEP=2)
+    deploy(root, host, "sha256:c", "v3", "services: {v: 3}\n", IMAGE_KEEP=2)
+    assert history(host) == [("sha256:c", "reg.io/demo:v3"), ("sha256:b", "reg.io/demo:v2")]
+    snapshots = sorted(path.read_text() for path in (host / ".demo.history").iterdir())
+    assert snapshots == ["services: {v: 2}\n", "services: {v: 3}\n"]
+
+
+def test_redeploying_a_release_moves_it_to_the_top(project, host):
+    root = project()
+    deploy(root, host, "sha256:a", "v1", "services: {v: 1}\n")
+    deploy(root, host, "sha256:b", "v2", "services: {v: 2}\n")
+    deploy(root, host, "sha256:a", "v1", "services: {v: 1}\n")
+    assert history(host) == [("sha256:a", "reg.io/demo:v1"), ("sha256:b", "reg.io/demo:v2")]
+    # The same image with another compose file is a separate release.
+    deploy(root, host, "sha256:a", "v1", "services: {v: 9}\n")
+    assert history(host) == [("sha256:a", "reg.io/demo:v1"), ("sha256:a", "reg.io/demo:v1"), ("sha256:b", "reg.io/demo:v2")]
+
+
+@pytest.mark.parametrize(
+    "rollback_to, image, order",
+    [
+        ("", "sha256:b reg.io/demo:v2", ["sha256:b", "sha256:c", "sha256:a"]),
+        ("3", "sha256:a reg.io/demo:v1", ["sha256:a", "sha256:c", "sha256:b"]),
+        ("1", "sha256:c reg.io/demo:v3", ["sha256:c", "sha256:b", "sha256:a"]),
+    ],
+)
+def test_rollback_switches_image_and_compose_file(project, host, rollback_to, image, order):
+    (host / ".demo.images").write_text("\n".join(HISTORY) + "\n")
+    (host.parent / "docker.images").write_text("sha256:a\nsha256:b\nsha256:c\n")
+    for conf in ("100-1", "200-2", "300-3"):
+        (host / ".demo.history" / f"{conf}.yaml").write_text(f"# {conf}\n")
+    (host / "demo.yaml").write_text("# broken release\n")
+    (host / ".demo.release").write_text("digest\n")
+    variables = {"ROLLBACK_TO": rollback_to} if rollback_to else {}
+    proc = make(project(), host, "remote-rollback", **variables)
+    assert proc.returncode == 0, proc.stderr
+    image_id, ref = image.split()
+    entry = next(line for line in HISTORY if line.startswith(image_id))
+    assert (host / "demo.yaml").read_text() == f"# {entry.split()[2]}\n"
+    log = (host.parent / "docker.log").read_text().splitlines()
+    assert f"tag {image_id} {ref} " in log
+    assert f"compose -f demo.yaml up -d --remove-orphans image={ref}" in log
+    assert [line.split()[0] for line in (host / ".demo.images").read_text().splitlines()] == order
+    assert not (host / ".demo.release").exists()
+
+
+@pytest.mark.parametrize(
+    "rollback_to, images, message",
+    [
+        ("0", "sha256:b", "ROLLBACK_TO must be a release number"),
+        ("two", "sha256:b", "ROLLBACK_TO must be a release number"),
+        ("4", "sha256:b", "No release #4 of demo"),
+        ("2", "sha256:c", "Image of release #2 (reg.io/demo:v2) is gone"),
+    ],
+)
+def test_rollback_refuses_unknown_releases(project, host, rollback_to, images, message):
+    (host / ".demo.images").write_text("\n".join(HISTORY) + "\n")
+    (host.parent / "docker.images").write_text(images + "\n")
+    (host / "demo.yaml").write_text("# current\n")
+    proc = make(project(), host, "remote-rollback", ROLLBACK_TO=rollback_to)
+    assert proc.returncode != 0
+    assert message in proc.stderr
+    assert (host / "demo.yaml").read_text() == "# current\n"
+    assert (host / ".demo.images").read_text() == "\n".join(HISTORY) + "\n"
+    assert "tag " not in (host.parent / "docker.log").read_text()
+
+
+def test_history_flags_removed_images_and_missing_snapshots(project, host):
+    (host / ".demo.images").write_text("\n".join(HISTORY) + "\n")
+    (host.parent / "docker.images").write_text("sha256:b\nsha256:c\n")
+    (host / ".demo.history" / "300-3.yaml").write_text("")
+    (host / ".demo.history" / "100-1.yaml").write_text("")
+    proc = make(project(), host, "remote-history")
+    assert proc.returncode == 0, proc.stderr
+    states = [line.rsplit("[", 1)[1].rstrip("]") for line in proc.stdout.splitlines()]
+    assert states == ["current", "available, no compose snapshot", "image removed"]
@@ -0,0 +1,154 @@
+import argparse
+import http.server
+import json
+import threading
+
+import pytest
+
+import config
+
+LIMITS = {
+    "max_p95_regression": 0.25,
+    "max_p99_regression": 0.5,
+    "max_rps_drop": 0.25,
+    "max_error_rate": 0.01,
+    "max_p99_ms": None,
+    "min_delta_ms": 5,
+}
+BASELINE = {"p95_ms": 20.0, "p99_ms": 40.0, "rps": 100.0}
+
+
+def result(**values) -> dict:
+    return {"error_rate": 0.0, "p95_ms": 20.0, "p99_ms": 40.0, "rps": 100.0, **values}
+
+
+@pytest.mark.parametrize(
+    "layer, expected",
+    [
+        (None, {"path": "/healthz", "via": "remote", "concurrency": 4, "rollback": False}),
+        ({"path": "/api/ping", "via": "TUNNEL", "concurrency": "8"}, {"path": "/api/ping", "via": "tunnel", "concurrency": 8}),
+        ({"max_p99_ms": "250", "rollback": "yes"}, {"max_p99_ms": 250.0, "rollback": True}),
+        ({"max_p99_ms": ""}, {"max_p99_ms": None}),
+    ],
+)
+def test_smoke_settings(layer, expected):
+    settings = config.smoke_settings({"smoke": layer}, "/healthz")
+    assert {key: settings[key] for key in expected} == expected
+
+
+@pytest.mark.parametrize(
+    "layer, message",
+    [
+        ("fast", "smoke must be an object"),
+        ({"rps": 10}, "smoke.rps is not supported"),
+        ({"via": "local"}, "smoke.via must be one of: remote, tunnel"),
+        ({"duration": "fast"}, "smoke.duration must be a number"),
+        ({"concurrency": 0}, "smoke.concurrency must be positive"),
+        ({"max_rps_drop": -0.1}, "smoke.max_rps_drop must be positive"),
+    ],
+)
+def test_smoke_settings_rejects(layer, message):
+    with pytest.raises(ValueError, match=message):
+        config.smoke_settings({"smoke": layer}, "/healthz")
+
+
+@pytest.mark.parametrize(
+    "run, baseline, limits, expected",
+    [
+        (result(), BASELINE, {}, []),
+        (result(), None, {}, []),
+        (result(error_rate=0.05), BASELINE, {}, ["error rate 5.00% > 1.00%"]),
+        (result(error_rate=1.0, p95_ms=None, p99_ms=None, rps=0.0), BASELINE, {}, ["error rate 100.00% > 1.00%"]),
+        (result(p95_ms=None, p99_ms=None, rps=0.0), None, {}, ["no successful requests"]),
+        (result(p99_ms=300.0), None, {"max_p99_ms": 250}, ["p99 300.0ms > 250ms"]),
+        (result(p95_ms=26.0), BASELINE, {}, ["p95 26.0ms > 25.0ms (baseline 20.0ms +25%)"]),
+        # Over the relative limit but within min_delta_ms of the baseline.
+        (result(p95_ms=1.0, p99_ms=1.5), {**BASELINE, "p95_ms": 0.5, "p99_ms": 0.6}, {}, []),
+        (result(rps=70.0), BASELINE, {}, ["throughput 70.0 req/s < 75.0 (baseline 100.0 -25%)"]),
+        (
+            result(p99_ms=70.0, rps=50.0),
+            BASELINE,
+            {},
+            ["p99 70.0ms > 60.0ms (baseline 40.0ms +50%)", "throughput 50.0 req/s < 75.0 (baseline 100.0 -25%)"],
+        ),
+    ],
+)
+def test_smoke_violations(run, baseline, limits, expected):
+    assert config.smoke_violations(run, baseline, {**LIMITS, **limits}) == expected
+
+
+@pytest.mark.parametrize(
+    "output, expected",
+    [
+        ("echo 0.0.0.0:32768", 32768),
+        ("echo '[::]:8081'", 8081),
+        ("echo :0", None),
+        ("echo 'no container'; exit 1", None),
+    ],
+)
+def test_published_port(monkeypatch, output, expected):
+    monkeypatch.setattr(config, "ssh_argv", lambda settings, host: ["sh", "-c", output, host])
+    settings = {"compose_path": "~/apps", "sudo": ""}
+    assert config.published_port(settings, "h1", "demo", 8080) == expected
+
+
+@pytest.fixture
+def service():
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            body = b"ok" if self.path == "/healthz" else b"missing"
+            self.send_response(200 if self.path == "/healthz" else 404)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize("path, error_rate", [("/healthz", 0.0), ("/missing", 1.0)])
+def test_smoke_load_counts_statuses(service, path, error_rate):
+    load = config.smoke_load(f"{service}{path}", concurrency=2, duration=0.2)
+    assert load["requests"] > 0
+    assert load["error_rate"] == error_rate
+    assert set(load["statuses"]) == {"200" if error_rate == 0 else "404"}
+    assert (load["p99_ms"] is None) == (error_rate == 1.0)
+
+
+def test_smoke_bench_records_a_baseline_then_gates_on_it(tmp_path, monkeypatch, capsys, service):
+    # "ssh" runs the remote python3 locally, so the piped smoke_load source is exercised as well.
+    monkeypatch.setattr(config, "ssh_argv", lambda settings, host: ["sh", "-c"])
+    args = argparse.Namespace(
+        **{
+            **config.GENERATE_DEFAULTS,
+            "root": str(tmp_path),
+            "smoke_bench": "prod",
+            "hosts": "h1",
+            "ssh_opts": "",
+            "url": f"{service}/healthz",
+            "concurrency": 2,
+            "duration": 0.2,
+        }
+    )
+    baseline = tmp_path / config.STATE_DIR / "smoke-prod.json"
+    assert config.smoke_bench_main(args) == 0
+    first = json.loads(capsys.readouterr().out)
+    assert (first["status"], first["baseline"], first["baseline_saved"]) == ("ok", None, str(baseline))
+    assert json.loads(baseline.read_text())["url"] == args.url
+
+    recorded = {**json.loads(baseline.read_text()), "rps": 1e9}
+    baseline.write_text(json.dumps(recorded))
+    assert config.smoke_bench_main(args) == 1
+    second = json.loads(capsys.readouterr().out)
+    assert second["status"] == "failed"
+    assert second["violations"][0].startswith("throughput ")
+    assert second["baseline_saved"] is None
+    assert json.loads(baseline.read_text()) == recorded
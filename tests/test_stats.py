@@ -0,0 +1,144 @@
+import argparse
+import json
+
+import pytest
+
+import config
+
+# STATS_PROBE output for two containers over two ticks: web-1 is limited to half a core and 512 MiB,
+# web-2 has no limits, no healthcheck and restarted once during the window.
+PROBE = """\
+host_cpus=4
+start=/web-1|500000000|536870912|0|running|healthy|0
+start=/web-2|0|0|1|running|
+sample=web-1|40.00%|300MiB / 512MiB
+sample=web-2|10.00%|100MiB / 7.5GiB
+tick=0
+sample=web-1|50.00%|500MiB / 512MiB
+sample=web-2|30.00%|120MiB / 7.5GiB
+tick=1
+end=/web-1|500000000|536870912|0|running|healthy|0
+end=/web-2|0|0|2|running|
+"""
+MIB = 1024 * 1024
+
+
+def test_stats_containers_aggregates_samples():
+    containers, ticks = config.stats_containers(PROBE.splitlines(), 4, 0.9)
+    assert [len(tick) for tick in ticks] == [2, 2]
+    web1, web2 = containers["web-1"], containers["web-2"]
+    assert web1["cpu_percent"] == {"min": 40.0, "avg": 45.0, "max": 50.0}
+    assert web1["memory_bytes"] == {"min": 300 * MIB, "avg": 400 * MIB, "max": 500 * MIB}
+    assert (web1["cpus"], web1["cpus_limited"], web1["memory_limited"]) == (0.5, True, True)
+    assert web1["cpu_utilization"] == {"avg": 0.9, "max": 1.0}
+    assert web1["memory_utilization"] == {"avg": 0.781, "max": 0.977}
+    assert web1["flags"] == ["cpu_saturated", "memory_saturated"]
+    # Unlimited containers are judged against the host: all cores, and the memory docker stats reports.
+    assert (web2["cpus"], web2["cpus_limited"], web2["memory_limited"]) == (4, False, False)
+    assert web2["memory_limit_bytes"] == int(7.5 * 1024 * MIB)
+    assert (web2["health"], web2["restart_count"], web2["restarts"]) == (None, 2, 1)
+    assert web2["flags"] == ["restarted"]
+    assert web2["status"] == "warn"
+
+
+@pytest.mark.parametrize(
+    "start, end, samples, flags",
+    [
+        ("0|0|0|running|", "0|0|0|running|", ["5.00%|10MiB / 1GiB"], []),
+        ("0|0|0|running|healthy|0", "0|0|0|running|unhealthy|3", ["5.00%|10MiB / 1GiB"], ["unhealthy"]),
+        ("0|0|0|running|", "0|0|0|exited|", [], ["not_running"]),
+        # The window average decides CPU saturation, a single peak does not.
+        ("1000000000|0|0|running|", "1000000000|0|0|running|", ["20.00%|1MiB / 1GiB", "120.00%|1MiB / 1GiB"], []),
+        ("0|0|0|running|", "0|0|0|running|", ["--|1MiB / 1GiB", "5.00%|1000MiB / 1GiB"], ["memory_saturated"]),
+    ],
+)
+def test_stats_containers_flags(start, end, samples, flags):
+    lines = [f"start=/app|{start}"]
+    for sample in samples:
+        lines += [f"sample=app|{sample}", "tick=0"]
+    lines.append(f"end=/app|{end}")
+    containers, _ = config.stats_containers(lines, 2, 0.9)
+    assert containers["app"]["flags"] == flags
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [("web-1", "web-1"), ('say "hi"', 'say \\"hi\\"'), ("C:\\app", "C:\\\\app"), ("a\nb", "a\\nb"), (8080, "8080")],
+)
+def test_prometheus_label(value, expected):
+    assert config.prometheus_label(value) == expected
+
+
+@pytest.fixture
+def canned_hosts(monkeypatch, tmp_path):
+    # Each host prints a canned probe answer instead of running STATS_PROBE.
+    outputs = {"h1": PROBE, "h2": "host_cpus=2\n"}
+    for host, output in outputs.items():
+        (tmp_path / host).write_text(output)
+
+    def argv(settings, host):
+        if host not in outputs:
+            return ["sh", "-c", "echo 'ssh: connect to host h3 port 22: Connection refused' >&2; exit 255"]
+        return ["sh", "-c", f"cat {tmp_path / host}; true"]
+
+    monkeypatch.setattr(config, "ssh_argv", argv)
+    return tmp_path
+
+
+def stats_args(root, **options) -> argparse.Namespace:
+    values = {
+        **config.GENERATE_DEFAULTS,
+        "root": str(root),
+        "stats": "prod",
+        "app_name": "web",
+        "ssh_opts": "",
+        "window": 0,
+        "interval": 1,
+        **options,
+    }
+    return argparse.Namespace(**values)
+
+
+def test_stats_main_reports_each_host(canned_hosts, capsys):
+    assert config.stats_main(stats_args(canned_hosts, hosts="h1 h2 h3")) == 1
+    report = json.loads(capsys.readouterr().out)
+    h1, h2, h3 = report["hosts"]
+    assert (h1["status"], h1["containers"], h1["restarts"], h1["flags"]) == (
+        "warn",
+        2,
+        1,
+        ["cpu_saturated", "memory_saturated", "restarted"],
+    )
+    assert h1["cpu_percent"] == {"min": 50.0, "avg": 65.0, "max": 80.0}
+    assert (h2["status"], h2["containers"], h2["error"]) == ("warn", 0, "no containers of web in ~/docker-composes")
+    assert (h3["status"], h3["error"]) == ("unreachable", "ssh: connect to host h3 port 22: Connection refused")
+
+
+def test_stats_prometheus_output(canned_hosts, capsys):
+    prom_file = canned_hosts / "textfile" / "deploy.prom"
+    prom_file.parent.mkdir()
+    args = stats_args(canned_hosts, hosts="h1 h3", format="prometheus", prom_file=str(prom_file))
+    assert config.stats_main(args) == 1
+    out = capsys.readouterr().out
+    assert prom_file.read_text() == out
+    lines = out.splitlines()
+    web1 = 'env="prod",app="web",host="h1",container="web-1"'
+    web2 = 'env="prod",app="web",host="h1",container="web-2"'
+    for line in [
+        'deploy_host_up{env="prod",app="web",host="h1"} 1',
+        'deploy_host_up{env="prod",app="web",host="h3"} 0',
+        'deploy_host_cpu_percent{env="prod",app="web",host="h1",stat="avg"} 65',
+        f'deploy_container_cpu_percent{{{web1},stat="max"}} 50',
+        f'deploy_container_memory_bytes{{{web1},stat="max"}} {500 * MIB}',
+        f"deploy_container_cpu_limit_cores{{{web1}}} 0.5",
+        f"deploy_container_healthy{{{web1}}} 1",
+        f'deploy_container_saturated{{{web1},resource="memory"}} 1',
+        f'deploy_container_saturated{{{web2},resource="cpu"}} 0',
+        f"deploy_container_restarts_window{{{web2}}} 1",
+    ]:
+        assert line in lines
+    # Containers without a healthcheck get no healthy sample; the unreachable host only reports up=0.
+    assert not any(line.startswith(f"deploy_container_healthy{{{web2}}}") for line in lines)
+    assert not any('host="h3"' in line for line in lines if not line.startswith("deploy_host_up"))
+    for name in config.STATS_METRICS:
+        assert lines.count(f"# TYPE {name} gauge") == 1
@@ -0,0 +1,109 @@
+import shutil
+
+import pytest
+
+import config
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        (None, []),
+        (["demo.yaml"], ["demo.yaml:demo.yaml"]),
+        (["config/nginx/:nginx/"], ["config/nginx:nginx"]),
+        ([{"src": "dist", "dest": "static"}, {"src": ".env.prod"}], ["dist:static", ".env.prod:.env.prod"]),
+    ],
+)
+def test_artifact_specs(value, expected):
+    assert config.artifact_specs(value) == expected
+
+
+@pytest.mark.parametrize(
+    "item, message",
+    [
+        ("", "invalid artifact"),
+        ("my file.txt", "invalid artifact"),
+        ({"dest": "static"}, "invalid artifact"),
+        ("a:b:c", "invalid artifact"),
+        ("dist:/srv/static", "must stay inside remote_compose_path"),
+        ("dist:~/static", "must stay inside remote_compose_path"),
+        ("dist:static/../../etc", "must stay inside remote_compose_path"),
+    ],
+)
+def test_artifact_specs_rejects(item, message):
+    with pytest.raises(ValueError, match=message):
+        config.artifact_specs([item])
+
+
+def test_artifact_files_walks_directories(tmp_path):
+    (tmp_path / "dist" / "css").mkdir(parents=True)
+    (tmp_path / "dist" / "index.html").write_text("<html>")
+    (tmp_path / "dist" / "css" / "app.css").write_text("body {}")
+    (tmp_path / "demo.yaml").write_text("services: {}\n")
+    files = config.artifact_files(tmp_path, ["demo.yaml:demo.yaml", "dist:static"])
+    assert files == [
+        ("demo.yaml", tmp_path / "demo.yaml"),
+        ("static/css/app.css", tmp_path / "dist" / "css" / "app.css"),
+        ("static/index.html", tmp_path / "dist" / "index.html"),
+    ]
+    with pytest.raises(ValueError, match="artifact does not exist: missing"):
+        config.artifact_files(tmp_path, ["missing:missing"])
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    # The remote commands run locally: REMOTE_COMPOSE_PATH is a directory under tmp_path.
+    monkeypatch.setattr(config, "ssh_argv", lambda settings, host: ["sh", "-c"])
+    local = tmp_path / "local"
+    (local / "dist").mkdir(parents=True)
+    (local / "demo.yaml").write_text("services: {}\n")
+    (local / "dist" / "app.js").write_text("console.log(1)\n")
+    (local / "dist" / "app.css").write_text("body {}\n")
+    settings = {"compose_path": str(tmp_path / "remote" / "apps"), "sudo": ""}
+    files = config.artifact_files(local, ["demo.yaml:demo.yaml", "dist:static"])
+    return settings, files, local, tmp_path / "remote" / "apps"
+
+
+@pytest.mark.skipif(shutil.which("sha256sum") is None, reason="sha256sum is not installed")
+def test_sync_tar_sends_only_changed_files(workspace):
+    settings, files, local, remote = workspace
+    assert config.sync_tar(settings, "h1", files) == ["demo.yaml", "static/app.css", "static/app.js"]
+    assert (remote / "static" / "app.js").read_text() == "console.log(1)\n"
+    assert config.sync_tar(settings, "h1", files) == []
+    (local / "dist" / "app.js").write_text("console.log(2)\n")
+    assert config.sync_tar(settings, "h1", files) == ["static/app.js"]
+    assert (remote / "static" / "app.js").read_text() == "console.log(2)\n"
+    # The staging directory is removed after the renames.
+    assert not list(remote.glob(".sync.*"))
+
+
+def test_sync_tar_reports_remote_failure(workspace):
+    settings, files, _, remote = workspace
+    remote.parent.mkdir()
+    remote.write_text("not a directory")
+    with pytest.raises(RuntimeError):
+        config.sync_tar(settings, "h1", files)
+
+
+@pytest.mark.parametrize(
+    "requested, rsync_error, method, status",
+    [
+        ("auto", "bash: rsync: command not found", "tar", "ok"),
+        ("auto", "Permission denied (publickey)", "rsync", "failed"),
+        ("rsync", "bash: rsync: command not found", "rsync", "failed"),
+        ("tar", None, "tar", "ok"),
+    ],
+)
+def test_sync_host_falls_back_to_tar_only_when_rsync_is_missing(monkeypatch, requested, rsync_error, method, status):
+    def rsync(settings, host, files):
+        raise RuntimeError(rsync_error)
+
+    monkeypatch.setattr(config.shutil, "which", lambda name: "/usr/bin/rsync")
+    monkeypatch.setattr(config, "sync_rsync", rsync)
+    monkeypatch.setattr(config, "sync_tar", lambda settings, host, files: [dest for dest, _ in files])
+    result = config.sync_host({}, "h1", [("demo.yaml", None)], requested)
+    assert (result["method"], result["status"]) == (method, status)
+    if status == "ok":
+        assert result["changed"] == ["demo.yaml"]
+    else:
+        assert result["error"] == rsync_error
@@ -0,0 +1,84 @@
+import argparse
+import json
+
+import pytest
+
+import config
+
+
+def step(name: str, start: float, end: float, host: str = "local", status: int = 0, nbytes=None, run="r1") -> dict:
+    return {
+        "run": run,
+        "step": name,
+        "host": host,
+        "start": start,
+        "end": end,
+        "duration_s": end - start,
+        "status": status,
+        "bytes": nbytes,
+    }
+
+
+def test_deploy_report_critical_path():
+    records = [
+        step("build", 0, 3, run="r0"),
+        step("build", 100, 104),
+        step("build", 104.5, 108),
+        step("ssh-open", 100, 101, host="h1"),
+        step("push", 108, 112, nbytes=2048),
+        step("push-compose-file", 112, 113, host="h1"),
+        step("remote-up", 113, 115, host="h1"),
+    ]
+    report = config.deploy_report(records)
+    assert report["run"] == "r1"
+    assert report["status"] == "ok"
+    assert report["wall_s"] == 15
+    # The two build lines collapse into one span whose duration excludes the gap between them.
+    assert [span["step"] for span in report["steps"]] == ["ssh-open", "build", "push", "push-compose-file", "remote-up"]
+    assert (report["steps"][1]["offset_s"], report["steps"][1]["duration_s"]) == (0, 7.5)
+    assert [span["step"] for span in report["critical_path"]] == ["build", "push", "push-compose-file", "remote-up"]
+    assert report["critical_path_s"] == 14.5
+    assert report["slowest"]["step"] == "build"
+    assert report["steps"][2]["bytes"] == 2048
+
+
+def test_deploy_report_selects_run_and_flags_failures():
+    records = [step("build", 0, 1, run="r0", status=2), step("build", 5, 6)]
+    assert config.deploy_report(records)["status"] == "ok"
+    assert config.deploy_report(records, "r0")["status"] == "failed"
+    with pytest.raises(ValueError, match="no timeline records"):
+        config.deploy_report(records, "missing")
+
+
+def test_deploy_summary_marks_the_critical_path():
+    records = [
+        step("build", 0, 4),
+        step("ssh-open", 0, 1, host="h1"),
+        step("push", 4, 6, nbytes=2048),
+        step("remote-up", 6, 7, host="h1", status=3),
+    ]
+    lines = config.deploy_summary(config.deploy_report(records)).splitlines()
+    assert lines[0] == "Deploy r1: failed in 7s (critical path 7.0s)"
+    rows = [(line[1] == "*", line[3:].split()[0], line.rsplit("s  ", 1)[1]) for line in lines[1:]]
+    assert rows == [
+        (False, "ssh-open", "ok"),
+        (True, "build", "ok"),
+        (True, "push", "ok  2.0 KiB"),
+        (True, "remote-up", "exit 3"),
+    ]
+
+
+@pytest.mark.parametrize("command, status", [("true", 0), ("exit 4", 4), (": notime; exit 0", None)])
+def test_timed_steps_append_timeline_records(tmp_path, monkeypatch, command, status):
+    timeline = tmp_path / "timeline.jsonl"
+    monkeypatch.setenv("DEPLOY_RUN_ID", "r7")
+    args = argparse.Namespace(
+        **{**config.GENERATE_DEFAULTS, "timed": "push", "command": command, "host": "h1", "timeline": str(timeline)}
+    )
+    assert config.timed_main(args) == (status or 0)
+    if status is None:
+        assert not timeline.exists()
+        return
+    (record,) = [json.loads(line) for line in timeline.read_text().splitlines()]
+    assert (record["run"], record["step"], record["host"], record["status"]) == ("r7", "push", "h1", status)
+    assert record["end"] >= record["start"]